@@ -9,9 +9,12 @@ projective method.
 Main functions:
 create_Gaussian()
 create_Lorentzian()
+stick_spectrum()
+chunked_stick_spectrum()
 
 Internal subfunctions:
 field_grid_segmentation()
+angle_weights()
 
 External subfunctions from my own library:
 voigt_convolution_Gauss()
@@ -22,38 +25,33 @@ voigt_convolution_Lorentz()
 
 import numpy as np
 import math as math
-from scipy import stats
 from . import Convolutions
+from . import Interpolation_lib
+from . import Profiler as prof
+from . import Tools as tool
 
 voigt_convolution_Gauss = Convolutions.voigt_convolution_Gauss
 voigt_convolution_Lorentz = Convolutions.voigt_convolution_Lorentz
+spline_interpolation_chunks = Interpolation_lib.spline_interpolation_chunks
 
 
-try:
-	from numba import float64, jit
-
-	Numba = 1
-except ImportError:
-	Numba = 0
+Numba = 1 if tool.numba_available() else 0
 
 
 def jit_dec():
 	"""
 	Creates a decorator for the Gauß/Lorentz functions. If Numba
 	is available, the decorator is a Numba jit (just-in-time compilation),
-	otherwise the identity decorator is called (this decorator does nothing).
+	otherwise the Python function is called (see Tools.lazy_jit()).
 	The jit decorator is called with defined static types to improve the
 	performance. Cashing is enabled to avoid avoid compilation each time
 	the Python program is invoked.
 	"""
-	if Numba == 1:
-		return jit(
-			float64[:](float64[:], float64[:], float64[:], float64, float64),
-			nopython=True,
-			cache=True,
-		)
-	else:
-		return dec_identity
+	return tool.lazy_jit(
+		"float64[:](float64[:], float64[:], float64[:], float64, float64)",
+		nopython=True,
+		cache=True,
+	)
 
 
 def dec_identity(ob):
@@ -91,27 +89,20 @@ def create_Gaussian(Par, resonance, intensity):
 	At the end a convolution with a Lorentzian function is carried out if
 	wished.
 
+	The resonance fields and intensities are the weighted and binned sticks
+	of stick_spectrum() or chunked_stick_spectrum().
+
 	(c) Stephan Rein, 29.11.2017
 	"""
-	field, signal, w, w2, intensity = preparation(Par, intensity)
+	field = preparation(Par)
 	lw = Par.lw[0] / (2 * np.sqrt(2 * np.log(2)))
 	lw_sq = lw * lw
 	FWHM = Par.lw[0]
-	res = resonance.flatten(order="C")
-	ints = intensity.flatten(order="C")
-	length = len(res)
-	if length > 4096 and length < 8192:
-		ints, res, bin_num = stats.binned_statistic(
-			res, ints, statistic="sum", bins=4096
-		)
-	elif length > 8192:
-		ints, res, bin_num = stats.binned_statistic(
-			res, ints, statistic="sum", bins=8192
-		)
-
-	signal = eval_Gauss(res, ints, field, FWHM, lw_sq)
+	with prof.stage("rendering"):
+		signal = eval_Gauss(resonance, intensity, field, FWHM, lw_sq)
 	if Par.lw[1] >= 0.005:
-		signal = voigt_convolution_Lorentz(Par, field, signal)
+		with prof.stage("convolution"):
+			signal = voigt_convolution_Lorentz(Par, field, signal)
 	return field, signal
 
 
@@ -160,30 +151,23 @@ def create_Lorentzian(Par, resonance, intensity):
 	At the end a convolution with a Gaussian function is carried out if
 	wished.
 
+	The resonance fields and intensities are the weighted and binned sticks
+	of stick_spectrum() or chunked_stick_spectrum().
+
 	(c) Stephan Rein, 29.11.2017
 	"""
 	# Allocations
-	field, signal, w, w2, intensity = preparation(Par, intensity)
+	field = preparation(Par)
 	lw_sq = Par.lw[1] / 2.0
 	FWHM = Par.lw[1]
 	fac = lw_sq
 	lw_sq_2 = lw_sq ** 2
 	intensity = intensity * fac
-	res = resonance.flatten(order="C")
-	ints = intensity.flatten(order="C")
-	length = len(res)
-	if length > 4096 and length < 8192:
-		ints, res, bin_num = stats.binned_statistic(
-			res, ints, statistic="sum", bins=4096
-		)
-	elif length > 8192:
-		ints, res, bin_num = stats.binned_statistic(
-			res, ints, statistic="sum", bins=8192
-		)
-
-	signal = eval_Lorentz(res, ints, field, FWHM, lw_sq_2)
+	with prof.stage("rendering"):
+		signal = eval_Lorentz(resonance, intensity, field, FWHM, lw_sq_2)
 	if Par.lw[0] >= 0.005:
-		signal = voigt_convolution_Gauss(Par, field, signal)
+		with prof.stage("convolution"):
+			signal = voigt_convolution_Gauss(Par, field, signal)
 	return field, signal
 
 
@@ -205,27 +189,124 @@ def eval_Lorentz(res, inte, field, FWHM, lw_sq):
 	return signal
 
 
-def preparation(Par, intensity):
+def preparation(Par):
 	"""
 	Preparation for evaluating the Gaussian and Lorentzian functions.
+	Returns the magnetic field points of the evaluation.
 
 	"""
-	# Allocations
 	field = np.linspace(Par.Range[0], Par.Range[1], Par.Points, endpoint=True)
 	field = field_grid_segmentation(field, Par)
-	signal = np.zeros(len(field))
+	return field
+
+
+def angle_weights(Par):
+	"""
+	Weighting factors of the interpolated theta and phi values (border of
+	the octant and sin(theta) weighting).
+
+	"""
 	w = np.ones(Par._ntheta)
 	w2 = np.ones(Par._nphi)
 	w[Par._ntheta - 1] = 0.5
 	w2[Par._nphi - 1] = 0.5
 	w2[0] = 0.5
-	# Weighting factors for the border of octant and sin(theta) weighting
 	for k in range(0, Par._ntheta):
 		theta = (math.pi / 2) * ((k) / (Par._ntheta - 1))
-		intensity[:, k, :] = intensity[:, k, :] * float(w[k]) * math.sin(theta)
-	for k in range(0, Par._nphi):
-		intensity[:, :, k] = intensity[:, :, k] * w2[k]
-	return field, signal, w, w2, intensity
+		w[k] = w[k] * math.sin(theta)
+	return w, w2
+
+
+def stick_bins(length):
+	"""Number of bins for length sticks (None if they are not binned)."""
+	if length > 4096 and length < 8192:
+		return 4096
+	elif length > 8192:
+		return 8192
+	return None
+
+
+def bin_centres(bins, edges):
+	"""
+	Centres of bins equally spaced bins between edges = (min, max) of the
+	resonance fields (see stick_spectrum()).
+
+	"""
+	res = np.linspace(edges[0], edges[1], bins + 1)
+	return 0.5 * (res[1:] + res[:-1])
+
+
+def stick_spectrum(Par, resonance, intensity):
+	"""
+	Weighted and binned stick spectrum of the interpolated resonance fields
+	and intensities (Transdim x Par._ntheta x Par._nphi, the intensities
+	are weighted in place, see angle_weights()).
+
+	Returns
+	-------
+	res, ints
+		Resonance fields and intensities of the sticks. For more than 4096
+		sticks, the intensities are summed up in bins (see stick_bins())
+		and res are the centres of the bins.
+
+	"""
+	w, w2 = angle_weights(Par)
+	for k in range(0, Par._ntheta):
+		intensity[:, k, :] *= w[k]
+	intensity *= w2
+	res = resonance.ravel(order="C")
+	ints = intensity.ravel(order="C")
+	bins = stick_bins(len(res))
+	if bins is None:
+		return res, ints
+	edges = (np.min(res), np.max(res))
+	ints = np.histogram(res, bins=bins, range=edges, weights=ints)[0]
+	return bin_centres(bins, edges), ints
+
+
+def chunked_stick_spectrum(Par, intensity, resonance, rows):
+	"""
+	Stick spectrum as stick_spectrum(), but the interpolation to the angle
+	grid is carried out in chunks of rows theta angles of one transition
+	(see Interpolation_lib.spline_interpolation_chunks()), so that the
+	interpolated resonance fields and intensities are never stored for all
+	orientations (Parameters.max_memory). The range of the bins is
+	determined in a first pass over the resonance fields.
+
+	Parameters
+	----------
+	intensity, resonance
+		Sticks on the orientation grid (see solid_state_sticks())
+	rows
+		Number of interpolated theta angles per chunk
+
+	"""
+	w, w2 = angle_weights(Par)
+	bins = stick_bins(Par.Transdim * Par._ntheta * Par._nphi)
+	prof.count("interpolation chunks", -(-Par._ntheta // rows) * Par.Transdim)
+	edges = (np.inf, -np.inf)
+	if bins is not None:
+		for k, t, inten, res in spline_interpolation_chunks(
+			Par, intensity, resonance, rows, intensities=False
+		):
+			edges = (min(edges[0], np.min(res)), max(edges[1], np.max(res)))
+		ints = np.zeros(bins)
+	else:
+		sticks = []
+	for k, t, inten, res in spline_interpolation_chunks(
+		Par, intensity, resonance, rows
+	):
+		for j in range(0, len(inten)):
+			inten[j] *= w[t + j]
+		inten *= w2
+		if bins is None:
+			sticks.append((res.ravel(), inten.ravel()))
+		else:
+			ints += np.histogram(res, bins=bins, range=edges, weights=inten)[0]
+	if bins is None:
+		res, ints = zip(*sticks)
+		return np.concatenate(res), np.concatenate(ints)
+	return bin_centres(bins, edges), ints
 
 
 def field_grid_segmentation(field, Par):
@@ -1,12 +1,29 @@
-import seaborn as sns
-import matplotlib_inline
-from matplotlib.pyplot import rcParams
-matplotlib_inline.backend_inline.set_matplotlib_formats('svg')
-rcParams["font.family"] = "Arial"
-rcParams['font.size'] = 12
-rcParams["savefig.bbox"] = 'tight'
-rcParams["figure.autolayout"]=True
-rcParams["lines.linewidth"]=1
-
-pal2 = sns.color_palette(['#000000','#023eff','#ff7c00','#1ac938','#e8000b','#8b2be2','#9f4800', '#f14cc1','#ffc400','#00d7ff'])
-sns.set_palette(pal2)
\ No newline at end of file
+# Plot style for EPR spectra. The style is applied when the module is imported.
+# Matplotlib and seaborn are only imported here, not by the simulation modules.
+
+
+def set_style():
+	"""
+	Applies the EPRsim plot style (fonts, line widths and color palette).
+
+	"""
+	import seaborn as sns
+	from matplotlib.pyplot import rcParams
+
+	try:
+		import matplotlib_inline
+
+		matplotlib_inline.backend_inline.set_matplotlib_formats('svg')
+	except ImportError:
+		pass
+	rcParams["font.family"] = "Arial"
+	rcParams['font.size'] = 12
+	rcParams["savefig.bbox"] = 'tight'
+	rcParams["figure.autolayout"]=True
+	rcParams["lines.linewidth"]=1
+
+	pal2 = sns.color_palette(['#000000','#023eff','#ff7c00','#1ac938','#e8000b','#8b2be2','#9f4800', '#f14cc1','#ffc400','#00d7ff'])
+	sns.set_palette(pal2)
+
+
+set_style()
@@ -12,12 +12,16 @@ Copyright, Stephan Rein, 2019
 # Load all external libraries
 import numpy as np
 import time as time
+from math import factorial
 from copy import copy
+from concurrent import futures
 from . import Validate_input_parameter as Val
 from . import Nucdic as Nucdic
 from . import Tools as tool
 from . import FastMotion as fm
 from . import SolidState as so
+from . import SlowMotion as sm
+from . import Profiler as prof
 
 # Load physical constans
 con = tool.physical_constants()
@@ -26,7 +30,9 @@ con = tool.physical_constants()
 # Function for the calcualtion of spectra in the isotropic/fast motion regime
 # *****************************************************************************
 
-def simulate(Parameters):
+def simulate(
+	Parameters, workers=None, executor="thread", profiler=None, experiments=None
+):
 	"""
 	Simulation function for cw-EPR simulations.
 
@@ -35,16 +41,39 @@ def simulate(Parameters):
 	Parameters : :class:`object`
 				Object with all simulation parameters.
 
+	workers : :class:`int`, optional
+				Number of workers for the parallel calculation of all
+				systems and isotope combinations. Default is None (serial).
+
+	executor : :class:`string`, optional
+				'thread' (default) for a thread pool or 'process' for a
+				process pool. Only relevant if workers > 1.
+
+	profiler : :class:`eprsim.Profiler.Profiler`, optional
+				Records wall time, call counts and peak array sizes of all
+				simulation stages (see profiler.report()).
+
+	experiments : :class:`list`, optional
+				Field-swept experiments (mwFreq, Range, Points) of the same
+				spin system(s), e.g. X-, Q- and W-band. The mwFreq, Range and
+				Points of the Parameters are replaced by the values of each
+				experiment. An experiment may also be a dictionary with these
+				keys (Points defaults to Parameters.Points).
+				See simulate_experiments().
+
 	Returns
 	-------
 	field : numpy.ndarray
-		Magnetic field vector.
+		Magnetic field vector (microwave frequency vector in GHz for
+		frequency sweeps). A list with one vector per experiment for
+		experiments.
 
 	spectrum : numpy.ndarray
-		Intesity vector of the cw-EPR signal.
+		Intesity vector of the cw-EPR signal (list for experiments).
 
 	flag : list
-		Flags with warning codes (description pleas find below)
+		Flags with warning codes (description pleas find below), one per
+		experiment for experiments.
 
 	See Also
 	--------
@@ -66,6 +95,14 @@ def simulate(Parameters):
 		All tensors (only relevant for fast-motion) need to be in its principal
 		axis system and colinear to each other.
 
+	Slow-motion
+		In the slow-motion regime (motion = 'slow'), the stochastic Liouville
+		equation is solved in a pruned basis of Wigner functions (LMKmax)
+		as a sparse matrix. The spectrum is calculated with a Lanczos
+		continued fraction for all field points at once (Solver = 'Lanczos')
+		or with conjugate gradients for each field point (Solver = 'CG') [3]_.
+		As for fast-motion, all tensors need to be colinear.
+
 	Solid-state
 		In the solid-state regime, the program uses a full matrix diagonalization
 		algorithm. Therefore, only spin systems with a Hilbert space
@@ -80,10 +117,34 @@ def simulate(Parameters):
 		with thermal equilibrium. Nuclear quadrupolar couplings (for I > 0.5)
 		are currently not implemented,
 
+	Frequency sweeps
+		If Field (in mT) is set, the spectrum is swept over the microwave
+		frequency range mwRange (in GHz) at the fixed field. The solid-state
+		Hamiltonian of every orientation is diagonalized once at this field
+		and the transition frequencies are broadened directly, without any
+		field bisection. The linewidths and the modulation amplitude are
+		given in mT as for field sweeps and are converted with the
+		isotropic g-value. Fast- and slow-motion parameter sets are
+		calculated in the solid state. All systems of a linear combination
+		need the same sweep type and axis, otherwise a ValueError is raised.
+
+	Parallel execution
+		With workers > 1, the kernels of all (system, isotope combination)
+		pairs are dispatched to a thread or process pool. The weighted sum
+		is carried out afterwards in the same order as in the serial
+		calculation, so the result does not depend on the number of workers.
+
+	Profiling
+		With a Profiler, the wall time, the number of calls and the peak
+		array sizes of the stages (validation, Presettings, ZFS_Hamiltonian,
+		HF_Eig with its bisection rounds, preselection, resonance_loop,
+		interpolation, rendering, convolution, modulation, ...) are recorded.
+
 	Return codes:
 	0. Everything is alright.
-	1. Matrix is too large for solid-state simulation.
+	1. Matrix is too large for solid-state/slow-motion simulation.
 	2. Fast-motion simulation is not possible due to S > 1/2.
+	3. No transitions in the frequency range (frequency sweep).
 
 	Optional Parameters (with their defaults):
 
@@ -100,6 +161,9 @@ def simulate(Parameters):
 	Temperature 
 	Interpolative_Refinement 
 	Population 
+	max_memory				 None
+	Field					 None
+	mwRange					 None
 
 	References
 	----------
@@ -107,6 +171,9 @@ def simulate(Parameters):
 
 	.. [2] : N. M. Atherton, Principles of Electron Spin Resonance, 1993
 
+	.. [3] : D. J. Schneider, J. H. Freed, Biological Magnetic Resonance
+	   Vol. 8, 1989, 1-76
+
 	Examples
 	--------
 
@@ -161,6 +228,11 @@ def simulate(Parameters):
 	>>> tool.plot(B0, spc)
 
 	"""
+	if profiler is not None:
+		with profiler:
+			return simulate(Parameters, workers, executor, experiments=experiments)
+	if experiments is not None:
+		return simulate_experiments(Parameters, experiments, workers, executor)
 	st = time.time()
 	Params = []
 	Par = copy(Parameters)
@@ -172,34 +244,57 @@ def simulate(Parameters):
 	systems = len(Par)
 	for i in range(0, systems):
 		Par[i] = check_if_instance(Par[i])
+	if len(set(frequency_swept(P) for P in Par)) > 1:
+		raise ValueError(
+			"Frequency-swept (Field) and field-swept systems cannot be combined."
+		)
 	for i in range(0, systems):
 		Par[i] = check_if_instance(Par[i])
-		Val = Validate_Parameters(Par[i])
+		if frequency_swept(Par[i]) and Par[i].motion in ("fast", "slow"):
+			print("\nWARNING: Frequency sweeps are calculated in the solid state!")
+		with prof.stage("validation"):
+			Val = Validate_Parameters(Par[i])
 		Params.append(Val)
 
+	tasks = []
+	for i in range(0, systems):
+		for k in range(0, len(Params[i].Sim_objects)):
+			tasks.append((Par[i], Params[i].Sim_objects[k]))
+	results = map_kernels(tasks, workers, executor)
+	axis = results[0][0]
+	for Bfield, Int, warning_k in results:
+		if np.shape(Bfield) != np.shape(axis) or not np.allclose(Bfield, axis):
+			raise ValueError(
+				"All systems need the same field (or frequency) axis: check "
+				"Range, mwRange and Points."
+			)
+	offset = 0
 	for i in range(0, systems):
 		spectrum_tmp = 0
 		Param = Params[i]
-		for k in range(0, len(Param.Sim_objects)):
+		nsim = len(Param.Sim_objects)
+		# Results of the isotope combinations of this system
+		results_sys = results[offset : offset + nsim]
+		offset += nsim
+		for k in range(0, nsim):
 			SimPar = Param.Sim_objects[k]
-			if SimPar.motion == "fast":
-				Bfield, Int, warning = fm.fast_motion_kernel(Par[i], SimPar)
-			else:
-				Bfield, Int, warning = so.solid_state_kernel(Par[i], SimPar)
-			if warning == 1:
-				spectrum = Int
+			Bfield, Int, warning_k = results_sys[k]
+			if warning_k != 0:
+				warning = warning_k
+			if warning_k == 1:
 				break
-			if warning == 2:
+			if warning_k == 3:
+				print("\nWARNING: No transitions in the frequency range!")
+				break
+			if warning_k == 2:
 				print("\nWARNING: Electron spin was reduced to S = 1/2!")
 			spectrum_tmp += SimPar._w[k] * Int
-		weight = get_weighting_factor(Par[i])
-		spectrum_tmp = tool.normalize2area(spectrum_tmp, Par[i].Harmonic)
-		spectrum += weight * spectrum_tmp
-		spectrum = tool.modulation_amplitude(Par[i].ModAmp, Bfield, spectrum)
-		if Par[i].SNR is not None:
-			spectrum = tool.add_noise(spectrum, Par[i].SNR)
-		if Par[i].mwPhase != 0:
-			spectrum = tool.phase_offset(Par[i].mwPhase, spectrum)
+		else:
+			derivative = solid_derivative(Par[i], Param.Sim_objects[0])
+			spectrum += postprocess_spectrum(Par[i], Bfield, spectrum_tmp, derivative)
+	if np.isscalar(spectrum):
+		# No system contributed to the spectrum
+		spectrum = np.zeros(np.shape(Bfield))
 	if Par[0].verbosity:
 		eltime = time.time() - st
 		print("\nTotal time: " + str(round(eltime, 6)) + " s\n")
@@ -207,6 +302,780 @@ def simulate(Parameters):
 	return Bfield, spectrum, warning
 
 
+def simulate_experiments(Parameters, experiments, workers=None, executor="thread"):
+	"""
+	Simulation of several field-swept experiments (e.g. X-, Q- and W-band)
+	of the same spin system(s) in one pass.
+
+	Parameters
+	----------
+	Parameters : :class:`object`
+				Object with all simulation parameters or a list of them
+				(linear combination, see simulate()).
+	experiments : :class:`list`
+				List of (mwFreq, Range, Points) or dictionaries with these
+				keys, with the microwave frequency in GHz and the field range
+				in mT.
+	workers : :class:`int`, optional
+				Number of workers for the isotope combinations. Default is
+				None (serial).
+	executor : :class:`string`, optional
+				'thread' (default) or 'process'.
+
+	Returns
+	-------
+	fields : :class:`list`
+		Magnetic field vectors of the experiments.
+	spectra : :class:`list`
+		Intensity vectors of the experiments.
+	flags : :class:`list`
+		Warning codes of the experiments (see simulate()).
+
+	Notes
+	-----
+	For solid-state systems the presettings, the orientation grid and the
+	Hamiltonians of all orientations are set up once per isotope
+	combination, and the eigendecomposition is shared by all experiments
+	with the same field range (see SolidState.solid_state_experiments()).
+	The spectra are the same as those of separate simulate() calls.
+	Systems in the other motional regimes are simulated for each
+	experiment separately.
+
+	Examples
+	--------
+
+	>>> import EPRsim.EPRsim as sim
+	>>> P = sim.Parameters(g=[2.0083, 2.0061, 2.0022], A=[12, 13, 110],
+		Nucs='14N', lw=[0.5, 0.2])
+	>>> fields, spectra, flags = sim.simulate(P, experiments=[
+		(9.6, [335, 350], 1024), (34.0, [1205, 1220], 1024)])
+
+	"""
+	st = time.time()
+	Par = check_if_instance(copy(Parameters))
+	if not isinstance(Par, (list, tuple)):
+		Par = [Par]
+	Par = [check_if_instance(P) for P in Par]
+	experiments = [experiment_settings(Par[0], e) for e in experiments]
+	fields = [np.linspace(e[1][0], e[1][1], e[2]) for e in experiments]
+	spectra = [0] * len(experiments)
+	flags = [0] * len(experiments)
+	for P in Par:
+		if Hamiltonian_motion(experiment_parameters(P, experiments[0])) != "solid":
+			for j in range(0, len(experiments)):
+				B, spc, flag = simulate(experiment_parameters(P, experiments[j]))
+				spectra[j] = spectra[j] + spc
+				flags[j] = flag if flag != 0 else flags[j]
+			continue
+		with prof.stage("validation"):
+			Param = Validate_Parameters(P)
+		SimPars = Param.Sim_objects
+		with prof.stage("solid_state_kernel"):
+			results = map_experiments(P, SimPars, experiments, workers, executor)
+		spectra_tmp = [0] * len(experiments)
+		skip = [False] * len(experiments)
+		for k in range(0, len(SimPars)):
+			for j, (B, Int, warning) in enumerate(results[k]):
+				flags[j] = warning if warning != 0 else flags[j]
+				if warning in (1, 3):
+					# The system adds nothing to this experiment
+					skip[j] = True
+				spectra_tmp[j] = spectra_tmp[j] + SimPars[k]._w[k] * Int
+		derivative = solid_derivative(P, SimPars[0])
+		for j in range(0, len(experiments)):
+			if skip[j]:
+				continue
+			Pe = experiment_parameters(P, experiments[j])
+			spectra[j] = spectra[j] + postprocess_spectrum(
+				Pe, fields[j], spectra_tmp[j], derivative
+			)
+	for j in range(0, len(experiments)):
+		if np.isscalar(spectra[j]):
+			# No system contributed to the spectrum
+			spectra[j] = np.zeros(len(fields[j]))
+	if Par[0].verbosity:
+		eltime = time.time() - st
+		print("\nTotal time: " + str(round(eltime, 6)) + " s\n")
+	return fields, spectra, flags
+
+
+def experiment_settings(Param, experiment):
+	"""
+	(mwFreq, Range, Points) of one experiment of simulate_experiments().
+	Points defaults to Param.Points.
+
+	"""
+	if isinstance(experiment, dict):
+		mwFreq = experiment["mwFreq"]
+		Range = experiment["Range"]
+		Points = experiment.get("Points", Param.Points)
+	elif len(experiment) == 2:
+		mwFreq, Range = experiment
+		Points = Param.Points
+	else:
+		mwFreq, Range, Points = experiment
+	return float(mwFreq), [float(Range[0]), float(Range[1])], int(Points)
+
+
+def experiment_parameters(Param, experiment):
+	"""
+	Copy of the Parameters object with the settings of one (field-swept)
+	experiment.
+
+	"""
+	Pe = copy(Param)
+	Pe.mwFreq, Pe.Range, Pe.Points = experiment
+	Pe.Range = list(Pe.Range)
+	Pe.Field = None
+	return Pe
+
+
+def map_experiments(Param, SimPars, experiments, workers=None, executor="thread"):
+	"""
+	Evaluates SolidState.solid_state_experiments() for all isotope
+	combinations, serially or with a pool of workers (see map_kernels()).
+
+	"""
+	Params = [Param] * len(SimPars)
+	runs = [experiments] * len(SimPars)
+	harmonics = [0] * len(SimPars)
+	if workers is None or workers <= 1 or len(SimPars) <= 1:
+		return list(map(so.solid_state_experiments, Params, SimPars, runs, harmonics))
+	if executor == "process":
+		Pool = futures.ProcessPoolExecutor
+	else:
+		Pool = futures.ThreadPoolExecutor
+	with Pool(max_workers=min(workers, len(SimPars))) as pool:
+		results = list(
+			pool.map(so.solid_state_experiments, Params, SimPars, runs, harmonics)
+		)
+	return results
+
+
+def run_kernel(Param, SimPar):
+	"""
+	Calls the simulation kernel of the motional regime of one isotope
+	combination.
+
+	Parameters
+	----------
+	Param : :class:`object`
+		Parameters object of the system
+	SimPar : :class:`object`
+		Simulation_Params object of the isotope combination
+
+	Returns
+	-------
+	Bfield, Int, warning
+		Output of the kernel function
+
+	Notes
+	-----
+	The solid-state kernel returns the absorptive spectrum. Its derivative
+	is taken in postprocess_spectrum() (see solid_derivative()).
+
+	"""
+	if frequency_swept(Param):
+		with prof.stage("solid_state_kernel"):
+			return so.solid_state_frequency_kernel(Param, SimPar, Harmonic=0)
+	if SimPar.motion == "fast":
+		with prof.stage("fast_motion_kernel"):
+			return fm.fast_motion_kernel(Param, SimPar)
+	elif SimPar.motion == "slow":
+		with prof.stage("slow_motion_kernel"):
+			return sm.slow_motion_kernel(Param, SimPar)
+	with prof.stage("solid_state_kernel"):
+		return so.solid_state_kernel(Param, SimPar, Harmonic=0)
+
+
+def solid_derivative(Param, SimPar):
+	"""
+	True if the kernel of run_kernel() returns the absorptive spectrum of a
+	first-derivative simulation (solid state).
+
+	"""
+	if frequency_swept(Param):
+		return Param.Harmonic == 1
+	return Param.Harmonic == 1 and SimPar.motion not in ("fast", "slow")
+
+
+def frequency_swept(Param):
+	"""
+	True if Param defines a frequency-swept spectrum (fixed field
+	Param.Field, see simulate()).
+
+	"""
+	return getattr(Param, "Field", None) is not None
+
+
+def map_kernels(tasks, workers=None, executor="thread"):
+	"""
+	Evaluates run_kernel() for a list of (Parameters, Simulation_Params)
+	tasks, serially or with a pool of workers.
+
+	Parameters
+	----------
+	tasks : :class:`list`
+		list of tuples (Param, SimPar)
+	workers : :class:`int`
+		number of workers. None or 1 for a serial calculation.
+	executor : :class:`string`
+		'thread' or 'process'
+
+	Returns
+	-------
+	results : :class:`list`
+		kernel outputs in the order of the tasks
+
+	"""
+	if workers is None or workers <= 1 or len(tasks) <= 1:
+		return [run_kernel(Param, SimPar) for Param, SimPar in tasks]
+	if executor == "process":
+		Pool = futures.ProcessPoolExecutor
+	else:
+		Pool = futures.ThreadPoolExecutor
+	Params = [task[0] for task in tasks]
+	SimPars = [task[1] for task in tasks]
+	with Pool(max_workers=min(workers, len(tasks))) as pool:
+		results = list(pool.map(run_kernel, Params, SimPars))
+	return results
+
+
+def simulate_many(Parameters_list, workers=None, executor="process"):
+	"""
+	Simulation of many independent parameter sets, e.g. for grid scans or
+	population-based global optimizers.
+
+	Parameters
+	----------
+	Parameters_list : :class:`list`
+				List of Parameters objects. An element may also be a list of
+				Parameters objects (linear combination, see simulate()).
+	workers : :class:`int`, optional
+				Number of workers. Default is None (serial).
+	executor : :class:`string`, optional
+				'process' (default) for a process pool or 'thread' for a
+				thread pool. Only relevant if workers > 1.
+
+	Returns
+	-------
+	field : numpy.ndarray
+		Magnetic field vector of the first parameter set.
+
+	spectra : numpy.ndarray
+		Intensity matrix of shape (n_sets, Points) with one spectrum per row.
+
+	flags : list
+		Warning codes of all parameter sets (see simulate())
+
+	Notes
+	-----
+	Parameter sets which differ only in the broadening (lw, ModAmp, mwPhase,
+	SNR, weight) share the Hamiltonian. Such sets are grouped:
+
+	* solid state: the stick spectrum of each isotope combination is
+	  calculated once and broadened for all sets of the group.
+	* fast motion: the sets may additionally differ in tcorr/logtcorr.
+	  The group is calculated with the batched fast-motion kernel (see
+	  simulate_fast_motion_batch()).
+
+	All other sets and the groups are distributed over the pool of workers.
+	Sets with a different field axis are interpolated to the field axis of
+	the first set.
+
+	Examples
+	--------
+
+	>>> import numpy as np
+	>>> import EPRsim.EPRsim as sim
+	>>> sets = [sim.Parameters(Nucs='14N', A=[12, 13, 110], lw=[0.2, lwL],
+		g=[2.0083, 2.0061, 2.0022], Range=[330, 350]) for lwL in
+		np.linspace(0.1, 1, 100)]
+	>>> B0, spcs, flags = sim.simulate_many(sets, workers=4)
+
+	"""
+	st = time.time()
+	n = len(Parameters_list)
+	groups = {}
+	jobs = []
+	for i in range(0, n):
+		P = check_if_instance(Parameters_list[i])
+		if isinstance(P, (list, tuple)):
+			jobs.append(("single", [i], [P]))
+			continue
+		motion = Hamiltonian_motion(P)
+		key = Hamiltonian_key(P, motion)
+		if key is None:
+			jobs.append(("single", [i], [P]))
+			continue
+		if key not in groups:
+			groups[key] = (motion, [], [])
+			jobs.append(groups[key])
+		groups[key][1].append(i)
+		groups[key][2].append(P)
+	jobs = [
+		("single", job[1], job[2]) if len(job[1]) == 1 else job for job in jobs
+	]
+	if workers is None or workers <= 1 or len(jobs) <= 1:
+		results = [simulate_group(job) for job in jobs]
+	else:
+		if executor == "thread":
+			Pool = futures.ThreadPoolExecutor
+		else:
+			Pool = futures.ProcessPoolExecutor
+		with Pool(max_workers=min(workers, len(jobs))) as pool:
+			results = list(pool.map(simulate_group, jobs))
+	Bfield = None
+	spectra = None
+	flags = [0] * n
+	for job, result in zip(jobs, results):
+		for i, (B, spc, flag) in zip(job[1], result):
+			if Bfield is None:
+				first = B
+			flags[i] = flag
+			if spectra is None:
+				spectra = np.zeros((n, len(first)))
+				Bfield = first
+			if len(B) != len(Bfield) or not np.allclose(B, Bfield):
+				spc = np.interp(Bfield, B, spc)
+			spectra[i] = spc
+	verbose = check_if_instance(Parameters_list[0])
+	if isinstance(verbose, (list, tuple)):
+		verbose = verbose[0]
+	if verbose.verbosity:
+		eltime = time.time() - st
+		print("\nTotal time: " + str(round(eltime, 6)) + " s\n")
+	return Bfield, spectra, flags
+
+
+def Hamiltonian_motion(P):
+	"""
+	Returns the motional regime used for the grouping in simulate_many():
+	'solid', 'fast' (with tcorr), 'iso', 'slow' or 'frequency' (frequency
+	sweep, not grouped).
+
+	"""
+	if frequency_swept(P):
+		return "frequency"
+	if P.motion == "fast":
+		if P.tcorr is None and P.logtcorr is None:
+			return "iso"
+		return "fast"
+	if P.motion == "slow":
+		return "slow"
+	return "solid"
+
+
+def Hamiltonian_key(P, motion):
+	"""
+	Key of all attributes of a Parameters object which determine the
+	Hamiltonian (and the field axis). Returns None if the set can not be
+	grouped.
+
+	"""
+	if motion not in ("solid", "fast"):
+		return None
+	ignore = ["lw", "ModAmp", "mwPhase", "SNR", "weight", "verbosity"]
+	if motion == "fast":
+		ignore += ["tcorr", "logtcorr"]
+	items = []
+	for key in sorted(P.__dict__):
+		if key.startswith("_") or key in ignore:
+			continue
+		value = P.__dict__[key]
+		if isinstance(value, np.ndarray):
+			value = value.tolist()
+		items.append((key, repr(value)))
+	return (motion, tuple(items))
+
+
+def simulate_group(job):
+	"""
+	Simulates one job of simulate_many(). A job is a tuple (kind, indices,
+	list of Parameters) with kind 'single', 'solid' or 'fast'.
+
+	Returns
+	-------
+	results : :class:`list`
+		list with (field, spectrum, flag) for all parameter sets of the job
+
+	"""
+	kind, indices, Ps = job
+	if kind == "single":
+		return [simulate(Ps[0])]
+	Par = copy(Ps[0])
+	Par.verbosity = False
+	Param = Validate_Parameters(Par)
+	n = len(Ps)
+	spectra = [0] * n
+	warning = 0
+	if kind == "solid":
+		for k in range(0, len(Param.Sim_objects)):
+			SimPar = Param.Sim_objects[k]
+			ParS, intensity, resonance = so.solid_state_sticks(Par, SimPar)
+			if ParS.warning == 1:
+				Bfield = np.linspace(Par.Range[0], Par.Range[1], int(Par.Points))
+				return [(Bfield, np.zeros(int(Par.Points)), 1)] * n
+			for j in range(0, n):
+				Bfield, Int, ParB = so.solid_state_broadening(
+					ParS, intensity, resonance, list(Ps[j].lw), Harmonic=0
+				)
+				spectra[j] += SimPar._w[k] * Int
+			warning = ParS.warning
+	else:
+		tcorr = np.zeros(n)
+		lwL = np.zeros(n)
+		lwG = np.zeros(n)
+		for j in range(0, n):
+			SimPar = Validate_Parameters(Ps[j]).Sim_objects[0]
+			tcorr[j] = SimPar._tcorriso
+			lwL[j] = max(SimPar.lw[0], 0.01)
+			lwG[j] = SimPar.lw[1]
+		Int_all = 0
+		for k in range(0, len(Param.Sim_objects)):
+			SimPar = Param.Sim_objects[k]
+			Bfield, Int, warning = fm.fast_motion_batch_kernel(
+				Par, SimPar, tcorr, lwL, lwG
+			)
+			Int_all = Int_all + SimPar._w[k] * Int
+		spectra = list(Int_all)
+	results = []
+	derivative = kind == "solid" and Par.Harmonic == 1
+	for j in range(0, n):
+		spectrum = postprocess_spectrum(Ps[j], Bfield, spectra[j], derivative)
+		results.append((Bfield, spectrum, warning))
+	return results
+
+
+def postprocess_spectrum(Par, Bfield, spectrum_tmp, derivative=False):
+	"""
+	Derivative, normalization, weighting, field modulation, phase offset
+	and noise of the spectrum of one system (same steps as in simulate()).
+
+	Parameters
+	----------
+	Par : :class:`object`
+		Parameters object of the system
+	Bfield : :class:`numpy.ndarray`
+		magnetic field vector
+	spectrum_tmp : :class:`numpy.ndarray`
+		spectrum of the kernel. 2-D input is processed row by row.
+	derivative : :class:`bool`
+		True if spectrum_tmp is absorptive and Par.Harmonic == 1
+
+	Notes
+	-----
+	All steps except the noise are one spectral multiplication (see
+	Tools.fused_postprocessing()). The noise refers to the final spectrum.
+
+	"""
+	weight = get_weighting_factor(Par)
+	modamp = Par.ModAmp
+	if frequency_swept(Par):
+		# Modulation amplitude in mT on the frequency axis in GHz
+		modamp = tool.mT2GHz(modamp, so.isotropic_g(Par.g))
+	with prof.stage("modulation"):
+		spectrum = tool.fused_postprocessing(
+			Bfield, spectrum_tmp, Par.Harmonic, derivative, modamp,
+			Par.mwPhase, weight
+		)
+	if Par.SNR is not None:
+		spectrum = tool.add_noise(spectrum, Par.SNR)
+	return spectrum
+
+
+def fit(data_field, data_spec, Parameters, vary, workers=None, executor="thread",
+		diff_step=0.05, max_nfev=None, baseline=None, nonnegative=True):
+	"""
+	Least-squares fit of one or more spin systems to a cw-EPR spectrum.
+
+	Parameters
+	----------
+	data_field : :class:`numpy.ndarray` or :class:`eprsim.EPRload.eprload`
+				Magnetic field vector of the data in mT or an eprload object.
+				For eprload objects the field unit is converted to mT and
+				the microwave frequency of the file is used.
+	data_spec : :class:`numpy.ndarray`
+				Intensity vector of the data. Ignored (may be None) for
+				eprload objects.
+	Parameters : :class:`object` or :class:`list` of :class:`object`
+				Start parameters of the spin system(s). The field range and
+				number of points are taken from the data.
+	vary : :class:`dict` or :class:`list` of :class:`dict`
+				Vary ranges of the fitted parameters, e.g.
+				{'lw': [0.05, 0.05], 'g': [0, 0, 0.001]}. Every element is
+				bounded to its start value +- vary range, elements with a
+				vary range of zero are fixed. A list gives one dictionary
+				per system, a single dictionary is used for all systems.
+	workers : :class:`int`, optional
+				Number of workers for the Jacobian columns. Default is None
+				(serial).
+	executor : :class:`string`, optional
+				'thread' (default) or 'process'.
+	diff_step : :class:`float`, optional
+				Finite difference step as a fraction of the vary range.
+				The default is 0.05.
+	max_nfev : :class:`int`, optional
+				Maximum number of function evaluations.
+	baseline : :class:`int`, optional
+				Order of a polynomial baseline which is fitted together
+				with the spectrum. Default is None (no baseline).
+	nonnegative : :class:`bool`, optional
+				Restricts the weights of the systems to non-negative
+				values (default). Set to False for e.g. inverted spectra.
+
+	Returns
+	-------
+	result : :class:`eprsim.Fitting.Fit_Result`
+		Fitted Parameters, best-fit spectrum, residual, weights and
+		standard deviations of the varied parameters.
+
+	Notes
+	-----
+	The simulation is split into the stages Hamiltonian, sticks,
+	broadening, modulation and phase. Every varied parameter invalidates
+	only its own and the following stages (result.stages), the earlier
+	stages are taken from a cache. A fit of lw, ModAmp or mwPhase of a
+	solid-state spectrum therefore diagonalizes the Hamiltonian once, and
+	a fast-motion fit of tcorr/lw calculates the resonance fields once.
+
+	The amplitude, the weights of several systems and the baseline enter
+	the spectrum linearly. They are eliminated by variable projection:
+	every system is simulated once per nonlinear step and the linear
+	parameters are solved in closed form (NNLS or QR). weight and SNR of
+	the Parameters are ignored.
+
+	Examples
+	--------
+
+	>>> import EPRsim.EPRsim as sim
+	>>> from EPRsim.EPRload import eprload
+	>>> data = eprload('nitroxide.DSC')
+	>>> P = sim.Parameters(Nucs='14N', A=[12, 13, 110], lw=[0.3, 0.2],
+		g=[2.0083, 2.0061, 2.0022])
+	>>> result = sim.fit(data, None, P, vary={'lw': [0.2, 0.2],
+		'A': [0, 0, 10]})
+	>>> tool.plot(result.field, [result.data, result.spectrum])
+
+	"""
+	from . import Fitting
+
+	return Fitting.fit(
+		data_field, data_spec, Parameters, vary, workers=workers,
+		executor=executor, diff_step=diff_step, max_nfev=max_nfev,
+		baseline=baseline, nonnegative=nonnegative
+	)
+
+
+def plan(Parameters, max_memory=None):
+	"""
+	Estimates the peak memory and the runtime of a solid-state simulation
+	without running it (see eprsim.Planner.plan()).
+
+	Parameters
+	----------
+	Parameters : :class:`object` or :class:`list` of :class:`object`
+		Parameters object(s) of the simulation.
+	max_memory : :class:`float`
+		Memory limit in MB. Default is Parameters.max_memory.
+
+	Returns
+	-------
+	plan : :class:`dict`
+		Estimate per system and isotope combination ('systems') and the
+		'peak_memory' (bytes) and 'runtime' (s) of the simulation.
+
+	Examples
+	--------
+
+	>>> import EPRsim.EPRsim as sim
+	>>> P = sim.Parameters(Nucs='14N,1H', A=[[12, 13, 110], [8, 8, 12]],
+		g=[2.0083, 2.0061, 2.0022], Range=[330, 350])
+	>>> result = sim.plan(P, max_memory=100)
+	>>> sim.print_plan(result)
+
+	"""
+	from . import Planner
+
+	return Planner.plan(Parameters, max_memory)
+
+
+def print_plan(plan):
+	"""Prints the estimate of plan()."""
+	from . import Planner
+
+	return Planner.print_plan(plan)
+
+
+def simulate_fast_motion_batch(Parameters, tcorr, lw=None, lwG=None):
+	"""
+	Batched fast-motion simulation over a rotational correlation time and/or
+	linewidth axis.
+
+	Parameters
+	----------
+	Parameters : :class:`object` or :class:`list` of :class:`object`
+				Object(s) with all simulation parameters. tcorr, logtcorr
+				and motion are ignored.
+	tcorr : :class:`float` or :class:`numpy.ndarray`
+				Isotropic rotational correlation times in s.
+	lw : :class:`float` or :class:`numpy.ndarray`, optional
+				Lorentzian linewidths in mT (FWHM). If not given, the
+				Lorentzian linewidth of Parameters.lw is used.
+	lwG : :class:`float` or :class:`numpy.ndarray`, optional
+				Gaussian linewidths in mT (FWHM). If not given, the
+				Gaussian linewidth of Parameters.lw is used.
+
+	Returns
+	-------
+	field : numpy.ndarray
+		Magnetic field vector.
+
+	spectra : numpy.ndarray
+		Intensity matrix of shape (n, Points) with one cw-EPR spectrum per
+		row, where n is the broadcasted length of tcorr, lw and lwG.
+
+	flag : int
+		Warning code (see simulate())
+
+	Notes
+	-----
+	Every row is equal to the spectrum returned by simulate() for a
+	fast-motion simulation with the corresponding tcorr and lw values.
+	Validation, isotope expansion, resonance fields and the tensor part of
+	the Kivelson linewidths are calculated once for all spectra.
+
+	Examples
+	--------
+
+	>>> import numpy as np
+	>>> import EPRsim.EPRsim as sim
+	>>> P = sim.Parameters(Range=[335, 350], mwFreq=9.6, Nucs='14N',
+		g=[2.0083, 2.0061, 2.0022], A=[12, 13, 110], lw=[0.2, 0.2])
+	>>> tcorr = np.logspace(-11, -9, 200)
+	>>> B0, spcs, flag = sim.simulate_fast_motion_batch(P, tcorr)
+
+	"""
+	st = time.time()
+	Par = copy(Parameters)
+	if not isinstance(Par, (list, tuple)):
+		Par = [Par]
+	tcorr = np.atleast_1d(np.asarray(tcorr, dtype=float))
+	warning = 0
+	spectra = 0
+	for i in range(0, len(Par)):
+		Par[i] = copy(check_if_instance(Par[i]))
+		Par[i].motion = "fast"
+		Par[i].logtcorr = None
+		Par[i].tcorr = float(tcorr[0])
+		Param = Validate_Parameters(Par[i])
+		lwL_i = Param.Sim_objects[0].lw[0] if lw is None else lw
+		lwG_i = Param.Sim_objects[0].lw[1] if lwG is None else lwG
+		tcorr_b, lwL_i, lwG_i = np.broadcast_arrays(
+			tcorr, np.asarray(lwL_i, dtype=float), np.asarray(lwG_i, dtype=float)
+		)
+		lwL_i = np.maximum(lwL_i, 0.01)
+		spectrum_tmp = 0
+		for k in range(0, len(Param.Sim_objects)):
+			SimPar = Param.Sim_objects[k]
+			Bfield, Int, warning = fm.fast_motion_batch_kernel(
+				Par[i], SimPar, tcorr_b, lwL_i, lwG_i
+			)
+			if warning == 2:
+				print("\nWARNING: Electron spin was reduced to S = 1/2!")
+			spectrum_tmp += SimPar._w[k] * Int
+		spectra = spectra + postprocess_spectrum(Par[i], Bfield, spectrum_tmp)
+	if Par[0].verbosity:
+		eltime = time.time() - st
+		print("\nTotal time: " + str(round(eltime, 6)) + " s\n")
+	return Bfield, spectra, warning
+
+
+def simulate_jacobian(Parameters):
+	"""
+	Simulation of a fast-motion or isotropic cw-EPR spectrum together with its
+	analytic derivatives with respect to the model parameters.
+
+	Parameters
+	----------
+	Parameters : :class:`object`
+				Object with all simulation parameters of one spin system.
+				motion has to be 'fast'.
+
+	Returns
+	-------
+	field : numpy.ndarray
+		Magnetic field vector.
+
+	spectrum : numpy.ndarray
+		Intesity vector of the cw-EPR signal.
+
+	jacobian : numpy.ndarray
+		Derivatives of the spectrum, shape (Points, len(labels)).
+
+	labels : list
+		Parameter names of the Jacobian columns (see
+		FastMotion.fast_motion_jacobian_kernel()): giso, aiso_k, dg_x/y/z,
+		dA_k_x/y/z, tcorr, lw_L, lw_G. Hyperfine values are in MHz, tcorr in
+		s and linewidths in mT.
+
+	flag : int
+		Warning code (see simulate())
+
+	Notes
+	-----
+	The spectrum agrees with simulate() up to the binning of the resonance
+	positions to the field vector, which is omitted here to keep the
+	spectrum differentiable. Modulation amplitude and phase offset are
+	applied to the spectrum and the Jacobian, noise is not added.
+	One Jacobian replaces 2*len(labels) additional simulate() calls of a
+	finite difference scheme.
+
+	Examples
+	--------
+
+	>>> import EPRsim.EPRsim as sim
+	>>> P = sim.Parameters(Range=[335, 350], mwFreq=9.6, Nucs='14N',
+		g=[2.0083, 2.0061, 2.0022], A=[12, 13, 110], lw=[0.2, 0.2],
+		tcorr=1e-10, motion='fast')
+	>>> B0, spc, J, labels, flag = sim.simulate_jacobian(P)
+
+	"""
+	Par = copy(check_if_instance(copy(Parameters)))
+	if isinstance(Par, (list, tuple)):
+		Par = copy(Par[0])
+	Param = Validate_Parameters(Par)
+	warning = 0
+	spectrum = 0
+	jacobian = 0
+	for k in range(0, len(Param.Sim_objects)):
+		SimPar = Param.Sim_objects[k]
+		if SimPar.motion != "fast":
+			print("\nWARNING: Analytic derivatives require motion = 'fast'!")
+			return SimPar.Bfield, None, None, [], warning
+		Bfield, Int, Jac, labels, warning = fm.fast_motion_jacobian_kernel(
+			Par, SimPar
+		)
+		if warning == 2:
+			print("\nWARNING: Electron spin was reduced to S = 1/2!")
+		spectrum += SimPar._w[k] * Int
+		jacobian += SimPar._w[k] * Jac
+	weight = get_weighting_factor(Par)
+	spectrum, jacobian = tool.normalize2area_jacobian(
+		spectrum, jacobian, Par.Harmonic
+	)
+	spectrum = weight * spectrum
+	jacobian = weight * jacobian
+	spectrum = tool.modulation_amplitude(Par.ModAmp, Bfield, spectrum)
+	if Par.mwPhase != 0:
+		spectrum = tool.phase_offset(Par.mwPhase, spectrum)
+	for i in range(0, jacobian.shape[1]):
+		jacobian[:, i] = tool.modulation_amplitude(Par.ModAmp, Bfield, jacobian[:, i])
+		if Par.mwPhase != 0:
+			jacobian[:, i] = tool.phase_offset(Par.mwPhase, jacobian[:, i])
+	return Bfield, spectrum, jacobian, labels, warning
+
+
 # *****************************************************************************
 # Definition of the hyperfine couplings due to different isotopes
 # *****************************************************************************
@@ -236,8 +1105,8 @@ def redefine_nuclear_coupling(Param):
 	#. If 2 is true: Get an expansion with all combination of isotopes
 	#. Check if equivalent nuclei are defined with nonpure isotopes
 	#. If 4 is True: Do the same as in 2 and 3 for fast motion.
-	#. Remove all isotopes mixture below a given probability threshold
-	#. Remove uncessary permutation of isotopes within a equivalent group
+	#. Steps 3 and 5 only generate distinct compositions of equivalent groups
+	   above the abundance threshold (see get_isotope_combinations())
 	
 	Warnings
 	--------
@@ -256,15 +1125,13 @@ def redefine_nuclear_coupling(Param):
 		Force_expansion = True
 		check_eq_in_fast_motion(Param, Force_expansion)
 		get_isotope_combinations(Param)
-	remove_sub_threshold(Param, Param._Nucsvec, Param._w)
-	remove_permutations(Param, Param._Nucsvec, Param._w, Force_expansion)
 	return
 
 
 def get_isotope_combinations(Param):
 	"""
 	Takes the information of the user-defined spin system (Sys) and
-	returns a vector of strings with all permuation and combination of
+	returns a vector of strings with all distinct combinations of
 	isotopes (nuclei_string) and the weighting factor for the probability
 	of the isotopes combinations (weight).
 
@@ -280,24 +1147,138 @@ def get_isotope_combinations(Param):
 	weight
 		vector with corresponding weighting factors
 
+	Notes
+	-----
+	Groups of equivalent nuclei (Param._m, after the expansion in
+	check_eq_in_fast_motion()) are treated by their isotope composition
+	instead of all permutations. For a group of n nuclei with the isotopes
+	i = 1..r and the natural abundances p_i, the composition
+	(k_1, ..., k_r) has the multinomial weight
+
+	.. math:: w = \\frac{n!}{k_1! \\cdots k_r!} \\prod_i p_i^{k_i}
+
+	The isotopes within a group are listed in the order of the isotope
+	catalogue. Combinations of all groups with a weight below
+	abund_threshold are discarded during the generation (see
+	isotope_group_compositions() and combine_isotope_groups()).
+
 	"""
 	if Param.Nucs is None:
 		return
-	Nucs = Param.Nucs
 	Nuc = Param.Nucs.split(",")
-	try:
-		hyperfine_dim = len(Nuc)
-	except:
-		hyperfine_dim = 1
-		Nuc = [Nucs]
-	Indexvectors, NucIsotopes = get_indexvector_isotopes(Nuc, hyperfine_dim)
-	Indexvecfull = coupled_isotopes_indexvector(Indexvectors)
-	nuc_vec, weight = create_nucvec(Indexvecfull, NucIsotopes)
+	m = Param._m
+	if m is None:
+		m = [1] * len(Nuc)
+	elif isinstance(m, int):
+		m = [m]
+	if int(np.sum(m)) != len(Nuc):
+		m = [1] * len(Nuc)
+	groups = []
+	q = 0
+	for size in m:
+		isotopes = Nucdic.isotopes_catalogue(Nuc[q])
+		groups.append(
+			isotope_group_compositions(isotopes, size, Param.abund_threshold)
+		)
+		q += size
+	nuc_vec, weight = combine_isotope_groups(groups, Param.abund_threshold)
 	Param._Nucsvec = nuc_vec
 	Param._w = weight
 	return
 
 
+def isotope_group_compositions(isotopes, n, threshold=0):
+	"""
+	Distinct isotope compositions of a group of n equivalent nuclei with
+	their multinomial weights.
+
+	Parameters
+	----------
+	isotopes
+		list with the isotopes of the element (see Nucdic.isotopes_catalogue())
+	n
+		number of equivalent nuclei
+	threshold
+		compositions with a smaller weight are discarded
+
+	Returns
+	-------
+	compositions
+		list of tuples (list of n isotope strings, weight)
+
+	Notes
+	-----
+	If the element has only one isotope (or a single isotope was requested),
+	the weight is 1.
+
+	"""
+	if len(isotopes) == 1:
+		return [([isotopes[0]] * n, 1.0)]
+	p = [Nucdic.nuclear_properties(iso)[2] for iso in isotopes]
+	compositions = []
+
+	def recursion(i, left, counts):
+		if i == len(isotopes) - 1:
+			counts = counts + [left]
+			w = float(factorial(n))
+			for k in range(0, len(counts)):
+				w *= p[k] ** counts[k] / factorial(counts[k])
+			if w >= threshold:
+				strings = []
+				for k in range(0, len(counts)):
+					strings += [isotopes[k]] * counts[k]
+				compositions.append((strings, w))
+			return
+		for k in range(left, -1, -1):
+			recursion(i + 1, left - k, counts + [k])
+
+	recursion(0, n, [])
+	return compositions
+
+
+def combine_isotope_groups(groups, threshold=0):
+	"""
+	Combines the isotope compositions of all groups of equivalent nuclei.
+
+	Parameters
+	----------
+	groups
+		list with the compositions of each group
+		(see isotope_group_compositions())
+	threshold
+		combinations with a smaller weight are discarded
+
+	Returns
+	-------
+	nuc_vec
+		vector with nuclear strings of all isotopes comb.
+	weight
+		vector with corresponding weighting factors
+
+	Notes
+	-----
+	The weight of a partial combination is an upper bound for all its
+	completions, therefore branches below the threshold are pruned before
+	they are expanded.
+
+	"""
+	nuc_vec = []
+	weight = []
+
+	def recursion(g, strings, w):
+		if w < threshold:
+			return
+		if g == len(groups):
+			nuc_vec.append(",".join(strings))
+			weight.append(w)
+			return
+		for comp, wc in groups[g]:
+			recursion(g + 1, strings + comp, w * wc)
+
+	recursion(0, [], 1.0)
+	return nuc_vec, weight
+
+
 def check_eq_in_fast_motion(Param, Force=False):
 	"""
 
@@ -324,7 +1305,10 @@ def check_eq_in_fast_motion(Param, Force=False):
 	This is the general input for the fully system without treating nuclear
 	spins as equivalent. The function is not used in the isotropic limit.
 	If Force is set to True the expansion is carried out independent of the
-	requirement of a fast motion calculation.
+	requirement of a fast motion calculation. The sizes of the expanded groups
+	are kept in Sys._m, so that get_isotope_combinations() lists each isotope
+	composition of a group only once (see isotope_group_compositions() and
+	combine_isotope_groups()).
 	
 	Warnings
 	--------
@@ -407,204 +1391,6 @@ def new_Nucsvec_and_tensors(eqiuvec, Nuc, A, neqvec):
 	return new_A_tensors, expanded__Nucsvec
 
 
-def coupled_isotopes_indexvector(Indexvec):
-	"""
-	Takes the index vector of a single element (eg. N) and creates the
-	coupled vector using tensor products.
-
-	Parameters
-	----------
-	Indexvec
-		Vectors with indices according to the number of isotopes
-
-	Returns
-	-------
-	Indecvec
-		coupled index vector
-
-	Notes
-	-----
-	If the Sys.Nucs input is "N,H" the corresponding input Indexvector
-	(generated by the function get_indexvector_isotopes()) is :code:`[0,1],[0,1]`.
-	
-	The returned index vectors after applying a sequence of tensor products is
-	:code:`[0,0,1,1],[0,1,0,1]`.
-	
-	This coupled index vectors are returned. This index vectors are the basis
-	to set up nuclear spin systems with all combinations of isotopes.
-	
-	"""
-	dim = []
-	dimen = len(Indexvec)
-	for i in range(0, dimen):
-		dim.append(len(Indexvec[i]))
-	for i in range(0, dimen):
-		for k in range(0, dimen):
-			if k != i:
-				if i <= k:
-					Indexvec[i] = np.kron(Indexvec[i], np.ones(dim[k]))
-				else:
-					Indexvec[i] = np.kron(np.ones(dim[k]), Indexvec[i])
-	return Indexvec
-
-
-def create_nucvec(Ind, NucIso):
-	"""
-	Takes the index vectors from the tensor products (Ind) and
-	the corresponding vectors with the nuclear isotopes and creates
-	a mixture of all possible isotopes combinations.
-	
-	Parameters
-	----------
-	Ind:
-		indexvectors for each nuclei
-	NucIso:
-		vector of isotopes for the nuclei
-		
-	Returns
-	-------
-	Sys_String
-		vector with all isotopes combinations
-	Sys_isotope_weight
-		vector with corresponding weighting factors
-	
-	Notes
-	-----
-	If eg. "N,H" is passed for Sys.Nucs  than the index vectors (Ind) created
-	by the functions get_indexvector_isotopes() and coupled_isotopes_indexvector()
-	are :code:`[0,0,1,1],[0,1,0,1H]` with the NucIso vectors
-	:code:`["14N","15N"],["1H',"2H"]`.
-	
-	These functions now creates vectors (Sys_String) with all possinle isotopes
-	combinations :code:`["14N,1H"],["14N,2H"],["15N,1H"],["15N,2H"]`
-	and the corresponding probabilities of the isotope mixtures
-	(Sys_isotope_weight) :code:`[0.9962104048, 0.0001095952, 0.0036795952, 4.048e-07]`
-	
-	Less suprisingly is the isotope mixture with 14N and 1H by far the most
-	probable due to their natural abundance.
-	
-	"""
-	weight = 1
-	strings = []
-	tmp_key = []
-	tmp_val = []
-	for i in range(0, len(Ind)):
-		string = []
-		Ind_tmp = Ind[i]
-		NucIso_tmp = NucIso[i]
-		for k in range(0, len(Ind_tmp)):
-			string.append(NucIso_tmp[int(Ind_tmp[k])])
-		strings.append(string)
-	for k in range(0, len(NucIso)):
-		NucIso_tmp = NucIso[k]
-		for i in range(0, len(NucIso_tmp)):
-			Ind_tmp = NucIso_tmp[i]
-			Info = Nucdic.nuclear_properties(Ind_tmp)
-			tmp_key.append(Ind_tmp)
-			tmp_val.append(Info[2])
-	tmp_dictionary = dict(zip(tmp_key, tmp_val))
-	Sys_String = []
-	Sys_isotope_weight = []
-	s = 0
-	for i in range(0, len(strings[0])):
-		strings_tmp = ""
-		weight = 1.0
-		for k in range(0, len(strings)):
-			s += 1
-			if k == 0:
-				strings_tmp += str(strings[k][i])
-			else:
-				strings_tmp += "," + str(strings[k][i])
-			if max(Ind[k][:]) == 0:
-				pass
-			else:
-				weight_info = tmp_dictionary[strings[k][i]]
-				weight *= weight_info
-		Sys_String.append(strings_tmp)
-		Sys_isotope_weight.append(weight)
-	return Sys_String, Sys_isotope_weight
-
-
-def get_indexvector_isotopes(Nuc, hyperfine_dim):
-	"""
-	The function takes the input for a given Sys.Nucs string and a number
-	of couling nuclei and creates an indexvector for each nuclei.
-	
-	Parameters
-	----------
-	Nuc
-		String with couling nuclei
-	hyperfine_dim
-		number of treated nuclei
-	
-	Returns
-	-------
-	Indexvectors
-		indexvectors for each nuclei
-	NucIsotopes
-		vector with isotopes for each nuclei
-	
-	Notes
-	-----
-	The index vector runs from 0 to N-1, where N is the number of isotopes for
-	a nuclei. If for example the nuclei is a "H" (hydrogen) or a
-	"Mg" (magnesium) the indexvector is:
-	
-	.. code:: python3
-	
-		Indexvector["H"] = [0,1]
-		Indexvector["Mg"] = [0,1,2]
-	
-	This is because "H" has two stable isotopes and "Mg" has three stable
-	isotopes. The function also produces a vector where the isotopes (NucIsotopes)
-	for each nuclei are listed as strings. For a "Mg" or a "H" the NucIsotope
-	vector is:
-	
-	.. code:: python3
-	
-		NucIsotopes["H"] = ["1H,"2H"]
-		NucIsotopes["Mg"] = ["24Mg","25Mg","26Mg"]
-	
-	The Indexvectors (vector of indexvectors) as well as the NucIsotopes
-	(vector of NucIsotopes) are returned.
-	
-	"""
-	NucIsotopes = []
-	Indexvectors = []
-	for i in range(0, hyperfine_dim):
-		Iso = Nucdic.isotopes_catalogue(Nuc[i])
-		NucIsotopes.append(Iso)
-		Indexvector = np.linspace(0, len(Iso) - 1, len(Iso), dtype=np.int32)
-		Indexvectors.append(Indexvector)
-	return Indexvectors, NucIsotopes
-
-
-def remove_sub_threshold(Param, Sys__Nucsvec, w):
-	"""
-	Deletes all isotopes combinations with a combined probability below the
-	defined threshold. The threshold is defined as global variable at the top
-	of this file and is called abund_threshold.
-
-	Parameters
-	----------
-	Sys__Nucsvec
-		Vector with all isotope combinations)
-	w
-		Vector with the corresponding weighting factors)
-
-	Warnings
-	--------
-	Works directly on the passed variables due to call by reference.
-	
-	"""
-	s = len(Sys__Nucsvec) - 1
-	for s in range(s, -1, -1):
-		if w[s] < Param.abund_threshold:
-			del Sys__Nucsvec[s]
-			del w[s]
-	return
-
-
 def read_single_isotope_comb(Param, _Nucsvec):
 	if Param._nofA is None:
 		return
@@ -633,83 +1419,6 @@ def read_single_isotope_comb(Param, _Nucsvec):
 	return
 
 
-def remove_permutations(Par, _Nucsvec, w, Force=False):
-	"""
-	Removes permutations which are doubled. 
-	
-	Parameters
-	----------
-	Sys
-		One class with definitions of spin system parameters
-	Sys__Nucsvec
-		Vector with all combinations of isotopes
-	w
-		corresponding weighting factors
-	Force: bool
-		forces the operations independent of the conditions
-	
-	Warnings
-	--------
-	Caution - Works directly on the passed variables due to call by reference.
-
-	Notes
-	-----
-	Assume a spin system with n = [2,2], Nucs = "N,H" is transformed in
-	the fast-motion regime to a system "N,N,H,H". There requirement is
-	still that the coupling is to equivalent nuclei (in general the A-tensor is
-	identical within the H's and N's). The isotopes combiniations above the
-	probability threshhold will be
-
-	.. code::
-
-		1. "14N,14N,1H,1H"
-		2. "14N,15N,1H,1H"
-		3. "15N,14N,1H,1H"
-		4. "14N,14N,2H,1H"
-		5. "14N,14N,1H,2H"
-	
-	Since 2. and 3. (and 4 and 5) are indentical (just a perumation of an isotope
-	within the equivalent coupling nuclei group) one of them can be
-	removed and the other douled in weight. Leaving:
-	
-	.. code:: 
-
-		1. "14N,14N,1H,1H"
-		2. "14N,15N,1H,1H" weight*2
-		3. "14N,14N,1H,2H" weight*2
-	
-	This was a description using an example of the very general procedure
-	implemented in this function. The new reduced list of isotope combinations
-	as well as the new weighting factors are produced (call by reference).
-	
-	"""
-
-	if (Force or Par.tcorr is not None) and Par._m is not None:
-		s = len(_Nucsvec) - 1
-		if isinstance(Par._m, int):
-			Par._m = [Par._m]
-		for s in range(s, -1, -1):
-			str_tmp1 = _Nucsvec[s].split(",")
-			for k in range(0, s):
-				str_tmp2 = _Nucsvec[k].split(",")
-				q = 0
-				str1 = []
-				str2 = []
-				issame = True
-				for t in range(0, len(Par._m)):
-					str1.append(str_tmp1[q : q + Par._m[t]])
-					str2.append(str_tmp2[q : q + Par._m[t]])
-					if sorted(str1[t]) != sorted(str2[t]):
-						issame = False
-					q += Par._m[t]
-				if issame:
-					del _Nucsvec[s]
-					w[k] += w[s]
-					del w[s]
-					break
-	return
-
-
 # *****************************************************************************
 # Other functionalities and flags and erromessages
 # *****************************************************************************
@@ -733,16 +1442,6 @@ def get_weighting_factor(Sys):
 	return weight
 
 
-def warningflag(n=0):
-	if n == 0:
-		w0str = (
-			"\nTreating equivalent nuclei for isotopes mixtures"
-			+ " might be very slow!\n"
-		)
-		print(w0str)
-	return
-
-
 # *****************************************************************************
 # PUBLIC CLASSES
 # *****************************************************************************
@@ -833,6 +1532,21 @@ class Parameters(object):
 		Signal-to-noise ratio for addition of artificial white noise.
 		The default value is None (noise-free).
 	
+	max_memory : :class:`float`
+		Memory limit of the solid-state simulation in MB. If the
+		eigenvectors of all orientations would exceed it, they are
+		calculated in chunks of orientations (see plan()). The default
+		value is None (no limit).
+	
+	Field : :class:`float`
+		Fixed magnetic field in mT of a frequency-swept spectrum. The
+		default value is None (field sweep over Range).
+	
+	mwRange : :class:`list`
+		Microwave frequency range in GHz of a frequency-swept spectrum.
+		The default value is None (the g-values of the field sweep over
+		Range at mwFreq).
+	
 	Returns
 	-------
 	
@@ -912,6 +1626,7 @@ class Parameters(object):
 	>>> Pa.attributes()
 	A: None
 	abund_threshold: 0.0001
+	Field: None
 	g: 2.0023193
 	Harmonic: 1
 	LMKmax: [14, 2, 6]
@@ -921,6 +1636,7 @@ class Parameters(object):
 	motion: unknown
 	mwFreq: 9.6
 	mwPhase: 0
+	mwRange: None
 	n: 1
 	Nucs: None
 	Points: 1024
@@ -954,6 +1670,8 @@ class Parameters(object):
 		self.n = 1
 		self.abund_threshold = 1e-4
 		self.SNR = None
+		self.Solver = "Lanczos"
+		self.LMKmax = [14, 2, 6]
 		self._warningflag = 0
 		self._tcorriso = None
 		self._I = [0]
@@ -976,6 +1694,9 @@ class Parameters(object):
 		self.DPair = None
 		self.J = None
 		self.DirektConv = True
+		self.max_memory = None
+		self.Field = None
+		self.mwRange = None
 		for key, value in kwargs.items():
 			setattr(self, key, value)
 
@@ -1066,6 +1787,7 @@ class Simulation_Params:
 		self._Nucsvec = Par._Nucsvec[k]
 		self._equiv = Par._equiv
 		self._nofA = Par._nofA
+		self._m = Par._m
 		self.A = Par.A
 		self.g = Par.g
 		self.iso = Par.iso
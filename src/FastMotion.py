@@ -7,17 +7,11 @@ Created on Mon Mar 11 11:03:37 2019
 """
 # Load all external libraries
 import numpy as np
-from scipy import interpolate
 from . import Validate_input_parameter as Val
 from . import Tools as tool
 
 global Numba
-try:
-	from numba import jit, float64, int64
-
-	Numba = 1
-except ImportError:
-	Numba = 0
+Numba = 1 if tool.numba_available() else 0
 
 
 # *****************************************************************************
@@ -40,50 +34,37 @@ def dec_fm_lw_kernel():
 	"""
 	Creates a decorator for the function fast_motion_lw_kernel(). If Numba
 	is available the decorator is a Numba jit (just-in-time compilation),
-	otherwise the identity decorator is called (this decorator does nothing).
+	otherwise the Python function is called.
 	The jit decorator is called with defined static types to improve the
 	performance. Cashing is enabled to avoid avoid compilation times each time
-	you invoke a Python program.
-
-	"""
-	if Numba == 1:
-		return jit(
-			float64[:](
-				float64[:, :, :],
-				float64[:, :, :],
-				float64,
-				float64,
-				float64,
-				float64,
-				float64,
-				float64,
-				float64[:, :],
-				float64[:],
-				int64,
-			),
-			nopython=True,
-			cache=True,
-		)
-	else:
-		return dec_identity
+	you invoke a Python program. The compilation is carried out at the first
+	call (see Tools.lazy_jit()).
+
+	"""
+	return tool.lazy_jit(
+		"float64[:](float64[:, :, :], float64[:, :, :], float64, float64, "
+		"float64, float64, float64, float64, float64[:, :], float64[:], "
+		"int64)",
+		nopython=True,
+		cache=True,
+	)
 
 
 def dec_Lorentzian():
 	"""
 	Creates a decorator for the create_Lorentzian(). If Numba
 	is available the decorator is a Numba jit (just-in-time compilation),
-	otherwise the identity decorator is called (this decorator does nothing).
+	otherwise the Python function is called.
 	The jit decorator is called with defined static types to improve the
 	performance. Cashing is enabled to avoid avoid compilation times each time
-	you invoke a Python program.
+	you invoke a Python program. The compilation is carried out at the first
+	call (see Tools.lazy_jit()).
 
 	"""
-	if Numba == 1:
-		return jit(
-			float64[:](float64[:], float64, float64, int64), nopython=True, cache=True
-		)
-	else:
-		return dec_identity
+	return tool.lazy_jit(
+		"float64[:](float64[:], float64, float64, int64)", nopython=True,
+		cache=True
+	)
 
 
 def dec_identity(ob):
@@ -180,6 +161,195 @@ def fast_motion_kernel(Param, SimPar):
 	return SimPar.Bfield, Int, warning
 
 
+def fast_motion_batch_kernel(Param, SimPar, tcorr, lw, lwG):
+	"""
+	Kernel function for a batch of fast-motion spectra of one spin system
+
+	Parameters
+	----------
+	Param: eprsim.EPRsim.Parameters
+		Definitions of spin system and experimental parameters
+	SimPar: eprsim.EPRsim.Simulation_Params
+		Parameters of one isotope combination
+	tcorr: numpy.ndarray
+		rotational correlation times in s (one per spectrum)
+	lw: numpy.ndarray
+		Lorentzian linewidths in mT as FWHM (one per spectrum)
+	lwG: numpy.ndarray
+		Gaussian linewidths in mT as FWHM (one per spectrum)
+
+	Returns
+	-------
+	Bfield
+		Magnetic field vector
+	Int
+		Intensity matrix with one area-normalized spectrum per row
+	warning
+		warning code (see fast_motion_kernel())
+
+	Notes
+	-----
+	The resonance fields, the tensor readout and the correlation-time
+	independent part of the Kivelson linewidths are calculated once and
+	shared by all spectra of the batch. Only the prefactors of the
+	linewidth formula and the lineshapes are evaluated per spectrum, as
+	array operations over the batch.
+
+	"""
+	res, indices, DeltaA, Deltag, giso = calculate_resfields(
+		SimPar.A,
+		SimPar.g,
+		SimPar._Nucsvec,
+		SimPar._equiv,
+		SimPar.mwFreq,
+		SimPar._Iequiv,
+		SimPar._g_n,
+	)
+	Int = create_fastmotion_spectra(
+		SimPar.Bfield,
+		res,
+		indices,
+		SimPar._I,
+		Deltag,
+		DeltaA,
+		tcorr,
+		lw,
+		lwG,
+		giso,
+		SimPar.mwFreq,
+		Param.Harmonic,
+	)
+	Int = tool.normalize2area(Int, Param.Harmonic)
+	if Param.verbosity:
+		print_Info(SimPar)
+	warning = 0
+	if Param.S > 0.5:
+		warning = 2
+	return SimPar.Bfield, Int, warning
+
+
+def fast_motion_jacobian_kernel(Param, SimPar):
+	"""
+	Kernel function for a fast-motion or isotropic spectrum together with its
+	analytic derivatives with respect to the model parameters.
+
+	Parameters
+	----------
+	Param: eprsim.EPRsim.Parameters
+		Definitions of spin system and experimental parameters
+	SimPar: eprsim.EPRsim.Simulation_Params
+		Parameters of one isotope combination
+
+	Returns
+	-------
+	Bfield
+		Magnetic field vector
+	Int
+		Intensity vector of the area-normalized spectrum
+	Jac
+		Jacobian matrix of shape (len(Bfield), len(labels))
+	labels
+		list with parameter names of the Jacobian columns (see Notes)
+	warning
+		warning code (see fast_motion_kernel())
+
+	Notes
+	-----
+	The columns of the Jacobian are the derivatives with respect to
+
+	* giso: isotropic g-value
+	* aiso_k: isotropic hyperfine coupling of nucleus (group) k in MHz
+	* dg_x, dg_y, dg_z: principal values of g-giso*1 (fast motion only)
+	* dA_k_x, dA_k_y, dA_k_z: principal values of A-aiso*1 in MHz (fast
+	  motion only)
+	* tcorr: isotropic rotational correlation time in s (fast motion only)
+	* lw_L: Lorentzian linewidth in mT
+	* lw_G: Gaussian linewidth in mT (zero if no Gaussian broadening is used)
+
+	The isotropic and anisotropic parts are treated as independent
+	parameters. Equivalent nuclei, which are expanded to single nuclei in the
+	fast-motion regime, share one aiso and one set of dA columns.
+	In contrast to fast_motion_kernel(), the resonance positions are not
+	binned to the field vector, so that the spectrum is a smooth function of
+	the parameters. The spectrum and all derivatives are calculated in
+	closed form: the resonance field derivatives by implicit differentiation
+	of the Breit-Rabi fixpoint, the linewidth derivatives from the Kivelson
+	formula and the lineshape derivatives from the Lorentzian.
+
+	"""
+	Bfield = SimPar.Bfield
+	res, indices, DeltaA, Deltag, giso = calculate_resfields(
+		SimPar.A,
+		SimPar.g,
+		SimPar._Nucsvec,
+		SimPar._equiv,
+		SimPar.mwFreq,
+		SimPar._Iequiv,
+		SimPar._g_n,
+	)
+	dres = resfield_derivatives(
+		SimPar.A, SimPar.g, SimPar.mwFreq, SimPar._Iequiv, SimPar._g_n
+	)
+	nA = dres.shape[1] - 1
+	lwL = SimPar.lw[0]
+	lwG = SimPar.lw[1]
+	if SimPar.iso:
+		fac = 1
+		if np.max(SimPar._equiv) > 1:
+			for i in range(0, len(indices)):
+				fac = np.kron(fac, tool.generalized_Pascal(int(SimPar._equiv[i]), SimPar._I[i]))
+		else:
+			fac = np.ones(len(res))
+		lw_s = np.full(len(res), lwL)
+		dlw = np.zeros((len(res), nA + 1))
+		dres_full = dres
+		labels = ["giso"] + ["aiso_" + str(k + 1) for k in range(0, nA)]
+	else:
+		fac = np.ones(len(res))
+		lw_s, dlw = fast_motion_lw_derivatives(
+			Deltag, DeltaA, SimPar._I, indices, giso, SimPar._tcorriso, SimPar.mwFreq,
+			len(res)
+		)
+		lw_s += lwL
+		dres_full = np.zeros_like(dlw)
+		dres_full[:, : nA + 1] = dres
+		labels = (
+			["giso"]
+			+ ["aiso_" + str(k + 1) for k in range(0, nA)]
+			+ ["dg_x", "dg_y", "dg_z"]
+			+ [
+				"dA_" + str(k + 1) + "_" + ax
+				for k in range(0, nA)
+				for ax in ("x", "y", "z")
+			]
+			+ ["tcorr"]
+		)
+	dL_dx0, dL_dlw = Lorentzian_derivatives(
+		Bfield, res[:, None], lw_s[:, None], Param.Harmonic
+	)
+	Int = fac @ create_Lorentzians(Bfield, res[:, None], lw_s[:, None], Param.Harmonic)
+	Jac = (fac[:, None] * dL_dx0).T @ dres_full + (fac[:, None] * dL_dlw).T @ dlw
+	Jac = np.column_stack((Jac, fac @ dL_dlw, np.zeros(len(Bfield))))
+	labels += ["lw_L", "lw_G"]
+	if lwG > 0:
+		Int, dInt_dlwG = convolution_G_derivative(lwG, Bfield, Int)
+		for i in range(0, Jac.shape[1] - 1):
+			Jac[:, i] = tool.convolution_G(lwG, Bfield, Jac[:, i])
+		Jac[:, -1] = dInt_dlwG
+	Int, Jac = tool.normalize2area_jacobian(Int, Jac, Param.Harmonic)
+	# Hyperfine columns from Hz to MHz
+	for i in range(0, len(labels)):
+		if labels[i].startswith("aiso") or labels[i].startswith("dA"):
+			Jac[:, i] *= 1e6
+	Jac, labels = merge_equivalent_columns(Jac, labels, SimPar._m, nA)
+	if Param.verbosity:
+		print_Info(SimPar)
+	warning = 0
+	if Param.S > 0.5:
+		warning = 2
+	return Bfield, Int, Jac, labels, warning
+
+
 # *****************************************************************************
 # Functions for the fast-motion and isotropic calculations
 # *****************************************************************************
@@ -250,6 +420,75 @@ def create_fastmotion_spectrum(Bfield,resonances,indices,I,Deltag,DeltaA,tcorr,
 	return Int
 
 
+def create_fastmotion_spectra(Bfield, resonances, indices, I, Deltag, DeltaA, tcorr,
+	lw, lwG, giso, mfreq, Harmonic=1):
+	"""
+	Batched version of create_fastmotion_spectrum() for vectors of
+	correlation times and linewidths.
+
+	Parameters
+	----------
+	Bfield
+		magnetic field vector in mT
+	resonances
+		vector with resonance fields in mT
+	indices
+		list with all index vectors of the coupled system
+	I
+		vector with nuclear spin quantum number for all nuclei
+	Deltag
+		g-giso*1 tensor
+	DeltaA
+		A-Aiso*1 tensor
+	tcorr
+		vector with rotational correlation times in s
+	lw
+		vector with Lorentzian linewidths given in mT as FWHM
+	lwG
+		vector with Gaussian linewidths given in mT as FWHM
+	giso
+		Isotropic g-value of the system
+	mfreq
+		Experimental microwave fequency in Hz
+	Harmonic: int{0,1}
+		Sets harmonic to simulate(1 = first derivative. 0 = absorptive)
+
+	Returns
+	-------
+	Int
+		Intensity matrix of shape (len(tcorr), len(Bfield))
+
+	Notes
+	-----
+	The Kivelson linewidths of all spectra are obtained as one matrix product
+	of the correlation-time independent basis (fast_motion_lw_basis()) with
+	the prefactors of all correlation times (kivelson_prefactors()). The
+	lineshapes are evaluated for all spectra at once for each resonance.
+	Gaussian broadening is done by a FFT convolution along the field axis.
+
+	"""
+	Biso = mfreq * (con.h / (con.beta * giso))
+	omega_0 = giso * Biso * con.beta / con.h
+	field_dep = con.beta * Biso / con.h
+	MHz2mT = (1e9 * con.h) / (giso * con.beta)
+	basis = fast_motion_lw_basis(
+		DeltaA, Deltag, indices, I, field_dep, len(resonances)
+	)
+	prefactors = kivelson_prefactors(tcorr, omega_0)
+	lw_s = (prefactors @ basis.T) * (1e-6 * MHz2mT) + lw[:, None]
+	Int = np.zeros((len(tcorr), len(Bfield)))
+	resonances = np.digitize(resonances, Bfield)
+	for i in range(0, len(resonances)):
+		g1 = resonances[i]
+		if g1 >= len(Bfield):
+			continue
+		Int += create_Lorentzians(Bfield, Bfield[g1], lw_s[:, i, None], Harmonic)
+	broadened = lwG > 0
+	if np.any(broadened):
+		Int[broadened] = tool.convolution_G(lwG[broadened], Bfield, Int[broadened])
+	return Int
+
+
 def create_isotropic_spectrum(Bfield, resonances, indices, equiv, I, Harmonic, lw, lwG):
 	"""
 	Kernel function for the calculation of a isotropic spectrum using
@@ -454,27 +693,21 @@ def Biso(giso:float, mfreq:float, unit:str="mT"):
 	Parameters
 	----------
 
-	giso: float
+	giso: float or numpy.ndarray
 		isotropic g-value
-	mfreq: float
+	mfreq: float or numpy.ndarray
 		experimental frequency in Hz
 	unit: str{'mT','T','G'}
 		unit in which the magnetic field value is returned
 
 	Returns
 	-------
-	B_iso: float
-		magnetic field value for the given giso
+	B_iso: float or numpy.ndarray
+		magnetic field value for the given giso (arrays are broadcast)
 
 	"""
-	B_iso = (con.h * mfreq) / (giso * con.beta)
-	if unit == "mT":
-		pass
-	elif unit == "T":
-		B_iso *= 1e-3
-	elif unit == "G":
-		B_iso *= 10
-	return B_iso
+	B_iso = (con.h * np.asarray(mfreq)) / (np.asarray(giso) * con.beta)
+	return B_iso * con.field_units[unit]
 
 
 def do_hf_splitting(indices_list, resfield_list):
@@ -602,16 +835,8 @@ def fast_motion_lw(Deltag, DeltaA, I, mI, Biso, giso, tcorr, Nresonances):
 	lw_s = np.zeros(Nresonances)
 	omega_0 = giso * Biso * con.beta / con.h
 	MHz2mT = (1e9 * con.h) / (giso * con.beta)
-	# Do all possible precalculation which are index independent
-	j0 = tcorr * 2 * np.pi
-	j1 = j0 / (1 + (omega_0 ** 2) * (j0 ** 2))
 	field_dep = con.beta * Biso / con.h
-	# Formulas according to N.M.Atherton (p.331-332)
-	a11 = (2.0 / 15) * j0 + (j1 * 1.0) / 10
-	a22 = (1.0 / 20) * j0 + (j1 * 7.0) / 60
-	b11 = (4.0 / 15) * j0 + (1.0 / 5) * j1
-	c11 = (1.0 / 12) * j0 - (1.0 / 60) * j1
-	d11 = (4.0 / 15) * j0 + (1.0 / 10) * j1
+	a11, a22, b11, c11, d11 = kivelson_prefactors(tcorr, omega_0)
 	DeltaA = np.asarray(DeltaA)
 	Deltag = np.asarray(Deltag)
 	I = np.asarray(I)
@@ -622,6 +847,91 @@ def fast_motion_lw(Deltag, DeltaA, I, mI, Biso, giso, tcorr, Nresonances):
 	return lw_s
 
 
+def kivelson_prefactors(tcorr, omega_0):
+	"""
+	Spectral-density prefactors of the Kivelson linewidth formula.
+
+	Parameters
+	----------
+	tcorr: float or numpy.ndarray
+		rotational correlation time(s) in s
+	omega_0
+		electron Larmor frequency in Hz
+
+	Returns
+	-------
+	prefactors: numpy.ndarray
+		array with the trailing axis [a11, a22, b11, c11, d11]. For a scalar
+		tcorr this is a vector with five elements, for a vector of N
+		correlation times the shape is (N, 5).
+
+	Notes
+	-----
+	The prefactors are the only part of the anisotropic linewidth which
+	depends on the rotational correlation time. Formulas according to
+	N.M.Atherton (p.331-332).
+
+	"""
+	j0 = np.asarray(tcorr, dtype=np.float64) * 2 * np.pi
+	j1 = j0 / (1 + (omega_0 ** 2) * (j0 ** 2))
+	a11 = (2.0 / 15) * j0 + (j1 * 1.0) / 10
+	a22 = (1.0 / 20) * j0 + (j1 * 7.0) / 60
+	b11 = (4.0 / 15) * j0 + (1.0 / 5) * j1
+	c11 = (1.0 / 12) * j0 - (1.0 / 60) * j1
+	d11 = (4.0 / 15) * j0 + (1.0 / 10) * j1
+	return np.stack((a11, a22, b11, c11, d11), axis=-1)
+
+
+def fast_motion_lw_basis(DeltaA, Deltag, mI, I, field_dep, Nresonances):
+	"""
+	Correlation-time independent part of the Kivelson linewidths.
+
+	Parameters
+	----------
+	DeltaA
+		vector with with A-Aiso*1 tensors
+	Deltag
+		g-giso*1 tensor
+	mI
+		list with mI projection quantum numbers
+	I
+		list with nuclear spin quantum numbers
+	field_dep
+		scalar factor for Kivelson formula
+	Nresonances
+		number of resonances
+
+	Returns
+	-------
+	basis: numpy.ndarray
+		Matrix of shape (Nresonances, 5). The anisotropic linewidths in Hz
+		(FWHM) are obtained as basis @ kivelson_prefactors(tcorr, omega_0).
+
+	Notes
+	-----
+	The linewidth formula of fast_motion_lw_kernel() is linear in the five
+	prefactors a11, a22, b11, c11 and d11. The tensor contractions and mI
+	products are collected once in this matrix, so that linewidths for many
+	correlation times only require a matrix product.
+
+	"""
+	mI = np.asarray(mI)
+	DeltaA = np.asarray(DeltaA)
+	Deltag = np.asarray(Deltag)
+	I = np.asarray(I)
+	n = len(mI)
+	basis = np.zeros((Nresonances, 5))
+	basis[:, 0] = field_dep ** 2 * np.sum(Deltag[0] * Deltag[0])
+	for j in range(0, n):
+		DeltaAA = np.sum(DeltaA[j] * DeltaA[j])
+		basis[:, 1] += I[j] * (I[j] + 1) * DeltaAA
+		basis[:, 2] += field_dep * np.sum(DeltaA[j] * Deltag[j]) * mI[j, :]
+		basis[:, 3] += DeltaAA * mI[j, :] ** 2
+		for k in range(j + 1, n):
+			basis[:, 4] += np.sum(DeltaA[j] * DeltaA[k]) * mI[k, :] * mI[j, :]
+	return 2 * basis
+
+
 @dec_fm_lw_kernel()
 def fast_motion_lw_kernel_expired(
 	DeltaA, Deltag, a11, a22, b11, c11, d11, field_dep, mI, I, Nresonances):
@@ -786,6 +1096,21 @@ def create_Lorentzian(x, x0, lw, Harmonic=1):
 	return L
 
 
+def create_Lorentzians(x, x0, lw, Harmonic=1):
+	"""
+	Generates Lorentzian signals for an array of linewidths. Same as
+	create_Lorentzian(), but lw may be an array broadcastable against x
+	(e.g. a column vector with one linewidth per spectrum).
+
+	"""
+	res = x - x0
+	if Harmonic == 0:
+		L = ((0.5 * lw) / np.pi) / (res ** 2 + (0.5 * lw) ** 2)
+	else:
+		L = -16.0 * ((res * lw) / np.pi) / (4.0 * (res) ** 2 + lw ** 2) ** 2
+	return L
+
+
 def field_interpolation(Int, Points, Bfield):
 	"""
 	Takes aribtray intensity vector and produces a cubic spline
@@ -809,6 +1134,8 @@ def field_interpolation(Int, Points, Bfield):
 		interpolated intensity vector with Points elements
 
 	"""
+	from scipy import interpolate
+
 	Range = [np.min(Bfield), np.max(Bfield)]
 	k1 = np.linspace(Range[0], Range[1], Points, endpoint=True)
 	spl = interpolate.splrep(Bfield, Int, k=3)
@@ -859,6 +1186,271 @@ def do_default_range(resfield, lw, lwG, tcorr=None):
 	return Bfield
 
 
+# *****************************************************************************
+# Analytic parameter derivatives of fast-motion and isotropic spectra
+# *****************************************************************************
+
+
+def Breit_Rabi_derivatives(aiso, giso, I, g_n, mfreq, B0, mI):
+	"""
+	Derivatives of the Breit-Rabi resonance fields with respect to aiso and
+	giso by implicit differentiation of the fixpoint equation used in
+	Breit_Rabi_iteration().
+
+	Parameters
+	----------
+	aiso
+		isotropic hyperfine constant in Hz
+	giso
+		isotropic g-value
+	I
+		nuclear spin quantum number
+	g_n
+		nuclear g-value for the used isotope
+	mfreq
+		experimental microwave frequency in Hz
+	B0
+		vector with converged resonance fields in T
+	mI
+		vector with the corresponding mI quantum numbers
+
+	Returns
+	-------
+	dB_da
+		derivatives of the resonance fields in T/Hz
+	dB_dg
+		derivatives of the resonance fields with respect to giso in T
+
+	"""
+	a = aiso + 1e-5
+	if a < 0:
+		fac = -1.0
+	else:
+		fac = 1.0
+	c = con.beta_n * g_n / con.h
+	D = mfreq + c * B0
+	eps = (a / 2.0) / D
+	gamma = giso * con.beta + g_n * con.beta_n
+	Q = np.power(2 * eps, -2.0) - (I + 1.0 / 2) ** 2
+	S = np.sqrt(mI ** 2 + (1 - eps ** 2) * Q)
+	P = (con.h * a) / (gamma * (1 - eps ** 2))
+	Phi = P * (-1.0 * mI + fac * S)
+	dS_deps = (-2 * eps * Q - (1 - eps ** 2) / (2 * eps ** 3)) / (2 * S)
+	dPhi_deps = Phi * 2 * eps / (1 - eps ** 2) + P * fac * dS_deps
+	denom = 1 + dPhi_deps * eps * c / D
+	dB_da = (Phi / a + dPhi_deps / (2 * D)) / denom
+	dB_dg = (-1.0 * Phi * con.beta / gamma) / denom
+	return dB_da, dB_dg
+
+
+def resfield_derivatives(A, g, mfreq, Iequiv, g_n):
+	"""
+	Derivatives of the resonance fields of calculate_resfields() with respect
+	to giso and the isotropic hyperfine constants.
+
+	Parameters
+	----------
+	A
+		vector of hyperfine tensors
+	g
+		g-tensor
+	mfreq
+		experimental microwave frequency in Hz
+	Iequiv
+		vector with (equivalent) nuclear spin quantum numbers
+	g_n
+		vector with nuclear g-values
+
+	Returns
+	-------
+	dres: numpy.ndarray
+		Matrix with the columns d(res)/d(giso) in mT and
+		d(res)/d(aiso_k) in mT/Hz for all nuclei k.
+
+	"""
+	hyperfine_dim = len(Iequiv)
+	dg_list = []
+	da_list = []
+	for k in range(0, hyperfine_dim):
+		if hyperfine_dim == 1:
+			giso, aiso, DeltaA, Deltag = tensor_readout(A, g)
+		else:
+			giso, aiso, DeltaA, Deltag = tensor_readout(A[k], g)
+		resfields, mI = Breit_Rabi_iteration(aiso, giso, Iequiv[k], g_n[k], mfreq)
+		dB_da, dB_dg = Breit_Rabi_derivatives(
+			aiso, giso, Iequiv[k], g_n[k], mfreq, resfields / con.T2mT, mI
+		)
+		if k > 0:
+			# Derivative of the subtracted Biso resonance position
+			dB_dg += Biso(giso, mfreq) / giso
+		dg_list.append(dB_dg * con.T2mT)
+		da_list.append(dB_da * con.T2mT)
+	indices = [np.zeros(len(d)) for d in dg_list]
+	dres = [do_hf_splitting(list(indices), list(dg_list))[0]]
+	for k in range(0, hyperfine_dim):
+		da_k = [np.zeros(len(d)) for d in da_list]
+		da_k[k] = da_list[k]
+		dres.append(do_hf_splitting(list(indices), da_k)[0])
+	return np.column_stack(dres)
+
+
+def fast_motion_lw_derivatives(Deltag, DeltaA, I, mI, giso, tcorr, mfreq, Nresonances):
+	"""
+	Anisotropic Kivelson linewidths and their derivatives.
+
+	Parameters
+	----------
+	Deltag
+		vector with g-giso*1 tensors
+	DeltaA
+		vector with A-Aiso*1 tensors
+	I
+		list with nuclear spin quantum numbers
+	mI
+		list with mI projection quantum numbers
+	giso
+		isotropic g-value
+	tcorr
+		rotational correlation time, given in s
+	mfreq
+		experimental microwave frequency in Hz
+	Nresonances
+		number of resonances
+
+	Returns
+	-------
+	lw_s
+		vector with anisotropic linewidths in mT as FWHM
+	dlw
+		Matrix with the derivatives of lw_s with respect to
+		[giso, aiso_1..n, dg_x, dg_y, dg_z, dA_1_x, ..., dA_n_z, tcorr]
+		(the aiso columns are zero). Hyperfine derivatives are given per Hz.
+
+	"""
+	mI = np.asarray(mI)
+	DeltaA = np.asarray(DeltaA)
+	dg = np.diag(np.asarray(Deltag)[0])
+	I = np.asarray(I)
+	n = len(mI)
+	dA = np.array([np.diag(DeltaA[j]) for j in range(0, n)])
+	Biso = mfreq * (con.h / (con.beta * giso))
+	omega_0 = giso * Biso * con.beta / con.h
+	field_dep = con.beta * Biso / con.h
+	scale = 1e-6 * (1e9 * con.h) / (giso * con.beta)
+	basis = fast_motion_lw_basis(DeltaA, Deltag, mI, I, field_dep, Nresonances)
+	prefactors = kivelson_prefactors(tcorr, omega_0)
+	lw_Hz = basis @ prefactors
+	dlw = np.zeros((Nresonances, 1 + n + 3 + 3 * n + 1))
+	# giso: field_dep and the MHz to mT conversion depend on giso
+	dlw_Hz_dg = (-2 * basis[:, 0] * prefactors[0] - basis[:, 2] * prefactors[2]) / giso
+	dlw[:, 0] = dlw_Hz_dg * scale - lw_Hz * scale / giso
+	# Anisotropic g-tensor
+	for i in range(0, 3):
+		d = np.full(Nresonances, 4 * field_dep ** 2 * dg[i] * prefactors[0])
+		for j in range(0, n):
+			d += 2 * field_dep * dA[j, i] * mI[j, :] * prefactors[2]
+		dlw[:, 1 + n + i] = d * scale
+	# Anisotropic hyperfine tensors
+	for j in range(0, n):
+		for i in range(0, 3):
+			d = 4 * I[j] * (I[j] + 1) * dA[j, i] * prefactors[1]
+			d = d + 2 * field_dep * dg[i] * mI[j, :] * prefactors[2]
+			d = d + 4 * dA[j, i] * mI[j, :] ** 2 * prefactors[3]
+			for k in range(0, n):
+				if k != j:
+					d = d + 2 * dA[k, i] * mI[k, :] * mI[j, :] * prefactors[4]
+			dlw[:, 1 + n + 3 + 3 * j + i] = d * scale
+	# Rotational correlation time
+	j0 = tcorr * 2 * np.pi
+	dj1 = (1 - (omega_0 * j0) ** 2) / (1 + (omega_0 * j0) ** 2) ** 2
+	dprefactors = 2 * np.pi * (
+		np.array([2.0 / 15, 1.0 / 20, 4.0 / 15, 1.0 / 12, 4.0 / 15])
+		+ np.array([1.0 / 10, 7.0 / 60, 1.0 / 5, -1.0 / 60, 1.0 / 10]) * dj1
+	)
+	dlw[:, -1] = (basis @ dprefactors) * scale
+	return lw_Hz * scale, dlw
+
+
+def Lorentzian_derivatives(x, x0, lw, Harmonic=1):
+	"""
+	Derivatives of create_Lorentzians() with respect to the resonance
+	position x0 and the linewidth lw.
+
+	Returns
+	-------
+	dL_dx0
+		derivative with respect to the resonance position
+	dL_dlw
+		derivative with respect to the linewidth (FWHM)
+
+	"""
+	res = x - x0
+	if Harmonic == 0:
+		E = res ** 2 + (0.5 * lw) ** 2
+		dL_dx0 = (res * lw) / (np.pi * E ** 2)
+		dL_dlw = (res ** 2 - (0.5 * lw) ** 2) / (2 * np.pi * E ** 2)
+	else:
+		D = 4.0 * res ** 2 + lw ** 2
+		dL_dx0 = 16.0 * lw * (D - 16.0 * res ** 2) / (np.pi * D ** 3)
+		dL_dlw = -16.0 * res * (D - 4.0 * lw ** 2) / (np.pi * D ** 3)
+	return dL_dx0, dL_dlw
+
+
+def convolution_G_derivative(width, field, spectrum):
+	"""
+	Convolution with a Gaussian function (see Tools.convolution_G()) and the
+	derivative of the convoluted signal with respect to the Gaussian FWHM.
+
+	"""
+	npoints = len(spectrum)
+	mid = npoints // 2
+	k = 2 * np.sqrt(2 * np.log(2))
+	std = width / k
+	dist = (field - field[mid]) ** 2
+	G = tool.cached_multiplier("gaussian", npoints, field[1] - field[0], width)
+	dG = G * dist / (std ** 3 * k)
+	spectrum_conv = np.convolve(spectrum, G, mode="same")
+	dspectrum = np.convolve(spectrum, dG, mode="same")
+	return spectrum_conv, dspectrum
+
+
+def merge_equivalent_columns(Jac, labels, m, nA):
+	"""
+	Sums the hyperfine columns of equivalent nuclei, which were expanded to
+	single nuclei for the fast-motion calculation, into one column per group
+	of equivalent nuclei.
+
+	"""
+	if m is None:
+		return Jac, labels
+	if isinstance(m, int):
+		m = [m]
+	if int(np.sum(m)) != nA or len(m) == nA:
+		return Jac, labels
+	group = np.repeat(np.arange(len(m)), m)
+	cols = []
+	new_labels = []
+	done = []
+	for i in range(0, len(labels)):
+		name = labels[i]
+		if name.startswith("aiso_") or name.startswith("dA_"):
+			parts = name.split("_")
+			g = group[int(parts[1]) - 1]
+			parts[1] = str(g + 1)
+			new_name = "_".join(parts)
+			if new_name in done:
+				cols[done.index(new_name)] = cols[done.index(new_name)] + Jac[:, i]
+				continue
+			done.append(new_name)
+			cols.append(Jac[:, i].copy())
+			new_labels.append(new_name)
+		else:
+			done.append(None)
+			cols.append(Jac[:, i])
+			new_labels.append(name)
+	return np.column_stack(cols), new_labels
+
+
 def print_Info(SimPar):
 	"""
 	Prints information about the simulation pass, equivalent to __str__	
@@ -0,0 +1,595 @@
+#! python3
+# -*- coding: utf-8 -*-
+"""
+Least-squares fitting of cw-EPR spectra with stage-cached simulations.
+
+The simulation pipeline of a spin system is split into stages. A varied
+parameter only invalidates its own stage and all later stages, so that e.g.
+a linewidth fit reuses the diagonalization and the stick spectrum of the
+solid-state kernel.
+
+"""
+# Load all external libraries
+import threading
+from copy import copy
+from concurrent import futures
+import numpy as np
+from scipy import linalg, optimize
+from . import Tools as tool
+from . import FastMotion as fm
+from . import SolidState as so
+
+
+# *****************************************************************************
+# Global default settings
+# *****************************************************************************
+
+# Stages of the simulation pipeline in the order of their evaluation
+Stages = ["Hamiltonian", "sticks", "broadening", "modulation", "phase"]
+# Stages of parameters which do not invalidate the Hamiltonian
+Parameter_stages = {
+	"nKnots": "sticks",
+	"lw": "broadening",
+	"ModAmp": "modulation",
+	"mwPhase": "phase",
+}
+# Parameters which are ignored by the fitting
+Ignored_parameters = ["SNR", "weight", "verbosity"]
+Diff_step = 0.05  # Finite difference step as a fraction of the vary range
+Cache_size = 64  # Maximum number of cached entries per stage and system
+
+
+def fit(
+	data_field,
+	data_spec,
+	Parameters,
+	vary,
+	workers=None,
+	executor="thread",
+	diff_step=Diff_step,
+	max_nfev=None,
+	baseline=None,
+	nonnegative=True,
+):
+	"""
+	Least-squares fit of the parameters of one or more spin systems to a
+	cw-EPR spectrum.
+
+	Parameters
+	----------
+	data_field : :class:`numpy.ndarray` or :class:`eprsim.EPRload.eprload`
+				Magnetic field vector of the data in mT or an eprload object.
+	data_spec : :class:`numpy.ndarray`
+				Intensity vector of the data. Ignored for eprload objects.
+	Parameters : :class:`object` or :class:`list` of :class:`object`
+				Start parameters of the spin system(s).
+	vary : :class:`dict` or :class:`list` of :class:`dict`
+				Vary ranges of the fitted parameters, one dictionary per
+				system. A single dictionary is used for all systems.
+	workers : :class:`int`, optional
+				Number of workers for the Jacobian columns. Default is None
+				(serial).
+	executor : :class:`string`, optional
+				'thread' (default) or 'process'. Worker processes use
+				copies of the stage caches.
+	diff_step : :class:`float`, optional
+				Finite difference step as a fraction of the vary range.
+	max_nfev : :class:`int`, optional
+				Maximum number of function evaluations.
+	baseline : :class:`int`, optional
+				Order of a polynomial baseline. Default is None (no
+				baseline).
+	nonnegative : :class:`bool`, optional
+				Non-negative weights of the systems (default).
+
+	Returns
+	-------
+	result : :class:`Fit_Result`
+		Fitted parameters, best-fit spectrum and fit statistics.
+
+	"""
+	field, spectrum, mwFreq = experimental_data(data_field, data_spec)
+	problem = Fit_Problem(
+		field, spectrum, Parameters, vary, mwFreq, baseline, nonnegative
+	)
+	problem.workers = workers
+	problem.executor = executor
+	problem.diff_step = diff_step
+	if len(problem.x0) == 0:
+		return problem.result(problem.x0, None)
+	opt = optimize.least_squares(
+		problem.residual,
+		problem.x0,
+		jac=problem.jacobian,
+		bounds=(problem.lower, problem.upper),
+		x_scale=problem.scale,
+		max_nfev=max_nfev,
+	)
+	result = problem.result(opt.x, opt)
+	if problem.Pars[0].verbosity:
+		print_Info(result)
+	return result
+
+
+# *****************************************************************************
+# Experimental data and parameter vectors
+# *****************************************************************************
+
+def experimental_data(data_field, data_spec=None):
+	"""
+	Reads the magnetic field (in mT), the real-valued spectrum and the
+	microwave frequency (in GHz, None if unknown) from arrays or an eprload
+	object.
+
+	"""
+	mwFreq = None
+	field = data_field
+	data = getattr(data_field, "__dict__", {})
+	if "Spec" in data:
+		field = data.get("AbscCorr", data["Absc"])
+		data_spec = data.get("SpecCorr", data["Spec"])
+		Param = data.get("Param", {})
+		unit = str(Param.get("XUNI", ["mT"])[0]).strip("'\"")
+		field = np.asarray(field, dtype=float) * field_unit(unit)
+		if "MWFQ" in Param:
+			mwFreq = float(Param["MWFQ"][0]) * 1e-9
+	field = np.asarray(field, dtype=float)
+	spectrum = np.real(np.asarray(data_spec))
+	if field.ndim != 1 or spectrum.shape != field.shape:
+		raise ValueError("Only one-dimensional spectra can be fitted.")
+	order = np.argsort(field)
+	return field[order], spectrum[order].astype(float), mwFreq
+
+
+def field_unit(unit):
+	"""Conversion factor of a field unit to mT."""
+	factors = {"G": 0.1, "mT": 1.0, "T": 1e3, "kG": 100.0}
+	if unit not in factors:
+		print("\nWARNING: Unknown field unit " + unit + ", mT is assumed!")
+	return factors.get(unit, 1.0)
+
+
+def parameter_stage(name, motion):
+	"""
+	Returns the first pipeline stage which is invalidated by a change of the
+	parameter 'name'.
+
+	"""
+	if name in ("tcorr", "logtcorr") and motion == "fast":
+		return "broadening"
+	return Parameter_stages.get(name, "Hamiltonian")
+
+
+def stage_key(P, stage, motion):
+	"""
+	Key of all attributes of a Parameters object which are needed up to (and
+	including) the given stage.
+
+	"""
+	last = Stages.index(stage)
+	items = []
+	for name in sorted(P.__dict__):
+		if name.startswith("_") or name in Ignored_parameters:
+			continue
+		if Stages.index(parameter_stage(name, motion)) > last:
+			continue
+		value = P.__dict__[name]
+		if isinstance(value, np.ndarray):
+			value = value.tolist()
+		items.append((name, repr(value)))
+	return tuple(items)
+
+
+def parameter_vector(Pars, vary):
+	"""
+	Flattens the varied parameters to a vector.
+
+	Returns
+	-------
+	x0, lower, upper
+		start values and bounds
+	index
+		list of (system, name, flat index, shape) tuples of the elements
+	labels
+		names of the vector elements
+	"""
+	if vary is None or isinstance(vary, dict):
+		vary = [vary] * len(Pars)
+	x0, lower, upper, index, labels = [], [], [], [], []
+	for i in range(0, len(Pars)):
+		if vary[i] is None:
+			continue
+		for name in sorted(vary[i]):
+			value = np.asarray(getattr(Pars[i], name), dtype=float)
+			delta = np.broadcast_to(np.abs(np.asarray(vary[i][name], dtype=float)),
+									value.shape)
+			for k in range(0, value.size):
+				d = delta.flat[k]
+				if d == 0:
+					continue
+				x0.append(value.flat[k])
+				lower.append(value.flat[k] - d)
+				upper.append(value.flat[k] + d)
+				index.append((i, name, k, value.shape))
+				label = name
+				if value.ndim > 0:
+					label += str([int(j) for j in np.unravel_index(k, value.shape)])
+				if len(Pars) > 1:
+					label = "Sys" + str(i + 1) + "." + label
+				labels.append(label)
+	return np.array(x0), np.array(lower), np.array(upper), index, labels
+
+
+def apply_vector(Pars, x, index):
+	"""Returns copies of the Parameters objects with the values of x."""
+	Pars = [copy(P) for P in Pars]
+	values = {}
+	for (i, name, k, shape), xk in zip(index, x):
+		if (i, name) not in values:
+			values[(i, name)] = np.array(getattr(Pars[i], name), dtype=float)
+		values[(i, name)].flat[k] = xk
+	for (i, name), value in values.items():
+		setattr(Pars[i], name, float(value) if value.ndim == 0 else value.tolist())
+	return Pars
+
+
+# *****************************************************************************
+# Stage-cached model spectra
+# *****************************************************************************
+
+class Fit_System:
+	"""
+	Model spectrum of one spin system with cached pipeline stages.
+
+	Notes
+	-----
+	The diagonalization and the stick spectrum are evaluated together in the
+	solid-state kernel, so that the stages 'Hamiltonian' and 'sticks' share
+	one cache. In the fast-motion regime tcorr and the linewidths only enter
+	the broadening stage. Slow-motion and isotropic spectra are cached up to
+	the broadening stage.
+
+	"""
+
+	def __init__(self, Par):
+		from . import EPRsim as sim
+
+		self.motion = sim.Hamiltonian_motion(Par)
+		self._sticks = {}
+		self._broadening = {}
+		self._lock = threading.Lock()
+		self.evaluations = dict((stage, 0) for stage in Stages)
+
+	def __getstate__(self):
+		# The lock cannot be pickled (executor='process')
+		state = self.__dict__.copy()
+		del state["_lock"]
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._lock = threading.Lock()
+
+	def spectrum(self, P):
+		"""Area-normalized spectrum of the system on its field axis."""
+		P = copy(P)
+		P.lw = copy(P.lw)
+		P.verbosity = False
+		P.SNR = None
+		key = stage_key(P, "sticks", self.motion)
+		sticks = self._cached(self._sticks, key, self.sticks, P)
+		key = stage_key(P, "broadening", self.motion)
+		Bfield, spectrum = self._cached(
+			self._broadening, key, self.broadening, P, sticks
+		)
+		self.evaluations["modulation"] += 1
+		spectrum = tool.modulation_amplitude(P.ModAmp, Bfield, spectrum)
+		if P.mwPhase != 0:
+			self.evaluations["phase"] += 1
+			spectrum = tool.phase_offset(P.mwPhase, spectrum)
+		return Bfield, spectrum
+
+	def _cached(self, cache, key, function, *args):
+		with self._lock:
+			if key in cache:
+				return cache[key]
+		value = function(*args)
+		with self._lock:
+			cache[key] = value
+			while len(cache) > Cache_size:
+				cache.pop(next(iter(cache)))
+		return value
+
+	def sticks(self, P):
+		"""Validation and (for solid state) the stick spectra of all isotope
+		combinations."""
+		from . import EPRsim as sim
+
+		self.evaluations["Hamiltonian"] += 1
+		self.evaluations["sticks"] += 1
+		if self.motion not in ("solid", "fast"):
+			return None
+		Param = sim.Validate_Parameters(P)
+		if self.motion == "fast":
+			return Param
+		sticks = []
+		for k in range(0, len(Param.Sim_objects)):
+			SimPar = Param.Sim_objects[k]
+			sticks.append((SimPar._w[k], so.solid_state_sticks(P, SimPar)))
+		return sticks
+
+	def broadening(self, P, sticks):
+		"""Broadened and area-normalized spectrum without modulation and
+		phase offset."""
+		from . import EPRsim as sim
+
+		self.evaluations["broadening"] += 1
+		Bfield = np.linspace(P.Range[0], P.Range[1], int(P.Points))
+		spectrum = 0
+		if self.motion == "solid":
+			for w, (ParS, intensity, resonance) in sticks:
+				if ParS.warning == 1:
+					return Bfield, np.zeros(int(P.Points))
+				Bfield, Int, ParB = so.solid_state_broadening(
+					ParS, intensity, resonance, P.lw
+				)
+				spectrum += w * Int
+		elif self.motion == "fast":
+			tcorr, lwL, lwG = fast_motion_broadening(P)
+			for k in range(0, len(sticks.Sim_objects)):
+				SimPar = sticks.Sim_objects[k]
+				Bfield, Int, warning = fm.fast_motion_batch_kernel(
+					P, SimPar, np.array([tcorr]), np.array([lwL]), np.array([lwG])
+				)
+				spectrum += SimPar._w[k] * Int[0]
+		else:
+			P = copy(P)
+			P.ModAmp = 0
+			P.mwPhase = 0
+			P.weight = 1
+			Bfield, spectrum, warning = sim.simulate(P)
+		return Bfield, tool.normalize2area(spectrum, P.Harmonic)
+
+
+def fast_motion_broadening(P):
+	"""
+	Isotropic rotational correlation time in s and the Lorentzian and
+	Gaussian linewidths in mT (FWHM) of a fast-motion system, with the same
+	conventions as the validation of the input parameters.
+
+	"""
+	lw = P.lw
+	if isinstance(lw, (int, float)):
+		lw = [lw, 0]
+	lw = list(lw) + [0.0] * (2 - len(lw))
+	tcorr = P.tcorr
+	if P.logtcorr is not None:
+		tcorr = np.power(10, float(P.logtcorr))
+	tcorr = np.atleast_1d(np.asarray(tcorr, dtype=float))
+	if len(tcorr) == 2:
+		tcorr = (1 / 3) * (tcorr[0] * 2 + tcorr[1])
+	return float(np.ravel(tcorr)[0]), max(lw[1], 0.01), lw[0]
+
+
+# *****************************************************************************
+# Fit problem (residual, Jacobian and results)
+# *****************************************************************************
+
+class Fit_Problem:
+	"""
+	Residual and Jacobian of a fit with linear weights of the spin systems.
+
+	Notes
+	-----
+	For fixed nonlinear parameters the spectrum is a linear combination of
+	the area-normalized spectra of the systems and of the polynomial
+	baseline (variable projection). The coefficients (weights, amplitude
+	and baseline) are solved in closed form in every evaluation, so that
+	only the nonlinear parameters are varied by the optimizer and every
+	system is simulated once per nonlinear step.
+
+	The baseline is projected out with a QR decomposition of the baseline
+	polynomials, which is calculated once. The weights are then solved by
+	NNLS (nonnegative) or QR of the projected component spectra.
+
+	"""
+
+	def __init__(
+		self, field, spectrum, Parameters, vary, mwFreq=None, baseline=None,
+		nonnegative=True
+	):
+		from . import EPRsim as sim
+
+		Pars = sim.check_if_instance(copy(Parameters))
+		if not isinstance(Pars, (list, tuple)):
+			Pars = [Pars]
+		Pars = [copy(sim.check_if_instance(P)) for P in Pars]
+		for P in Pars:
+			P.Range = [float(field[0]), float(field[-1])]
+			P.Points = len(field)
+			if mwFreq is not None:
+				P.mwFreq = mwFreq
+		self.Pars = Pars
+		self.field = field
+		self.data = spectrum
+		self.systems = [Fit_System(P) for P in Pars]
+		x0, lower, upper, index, labels = parameter_vector(Pars, vary)
+		self.x0 = x0
+		self.lower = lower
+		self.upper = upper
+		self.index = index
+		self.labels = labels
+		self.scale = (upper - lower) / 2
+		self.stages = dict(
+			(label, parameter_stage(ind[1], self.systems[ind[0]].motion))
+			for label, ind in zip(labels, index)
+		)
+		self.nonnegative = nonnegative
+		self.Qbase = None
+		if baseline is not None:
+			xs = np.linspace(-1, 1, len(field))
+			if field[-1] != field[0]:
+				xs = 2 * (field - field[0]) / (field[-1] - field[0]) - 1
+			self.Qbase, self.Rbase = np.linalg.qr(
+				np.polynomial.legendre.legvander(xs, int(baseline))
+			)
+		self.workers = None
+		self.executor = "thread"
+		self.diff_step = Diff_step
+
+	def components(self, x):
+		"""Area-normalized spectra of all systems on the data field axis."""
+		Pars = apply_vector(self.Pars, x, self.index)
+		basis = np.zeros((len(self.field), len(Pars)))
+		for i in range(0, len(Pars)):
+			Bfield, spectrum = self.systems[i].spectrum(Pars[i])
+			basis[:, i] = np.interp(self.field, Bfield, spectrum)
+		return basis
+
+	def project_baseline(self, y):
+		"""Removes the baseline polynomials from the columns of y."""
+		if self.Qbase is None:
+			return y
+		return y - self.Qbase @ (self.Qbase.T @ y)
+
+	def linear_weights(self, basis):
+		"""
+		Weights of the component spectra and the baseline of the data.
+
+		Returns
+		-------
+		weights
+			coefficients of the component spectra
+		baseline
+			baseline vector (zeros without baseline)
+
+		"""
+		C = self.project_baseline(basis)
+		y = self.project_baseline(self.data)
+		if self.nonnegative:
+			weights = optimize.nnls(C, y)[0]
+		else:
+			Q, R = np.linalg.qr(C)
+			weights = np.linalg.lstsq(R, Q.T @ y, rcond=None)[0]
+		rest = self.data - basis @ weights
+		return weights, rest - self.project_baseline(rest)
+
+	def baseline_coefficients(self, baseline):
+		"""Legendre coefficients of a baseline vector."""
+		if self.Qbase is None:
+			return np.zeros(0)
+		return linalg.solve_triangular(self.Rbase, self.Qbase.T @ baseline)
+
+	def residual(self, x):
+		basis = self.components(x)
+		weights, baseline = self.linear_weights(basis)
+		return basis @ weights + baseline - self.data
+
+	def jacobian(self, x):
+		"""
+		Finite difference Jacobian of the residual. The columns are evaluated
+		with a pool of workers if workers > 1.
+
+		"""
+		steps = self.diff_step * self.scale
+		steps = np.where(x + steps > self.upper, -steps, steps)
+		r0 = self.residual(x)
+		columns = []
+		for j in range(0, len(x)):
+			xj = np.array(x, dtype=float)
+			xj[j] += steps[j]
+			columns.append(xj)
+		if self.workers is None or self.workers <= 1 or len(columns) <= 1:
+			residuals = [self.residual(xj) for xj in columns]
+		else:
+			if self.executor == "process":
+				Pool = futures.ProcessPoolExecutor
+			else:
+				Pool = futures.ThreadPoolExecutor
+			with Pool(max_workers=min(self.workers, len(columns))) as pool:
+				residuals = list(pool.map(self.residual, columns))
+		Jac = np.zeros((len(r0), len(x)))
+		for j in range(0, len(x)):
+			Jac[:, j] = (residuals[j] - r0) / steps[j]
+		return Jac
+
+	def result(self, x, opt):
+		"""Creates the Fit_Result of the parameter vector x."""
+		basis = self.components(x)
+		weights, baseline = self.linear_weights(basis)
+		Pars = apply_vector(self.Pars, x, self.index)
+		result = Fit_Result()
+		result.x = np.array(x)
+		result.labels = self.labels
+		result.stages = self.stages
+		result.field = self.field
+		result.data = self.data
+		result.components = basis * weights
+		result.baseline = baseline
+		result.baseline_coefficients = self.baseline_coefficients(baseline)
+		result.spectrum = basis @ weights + baseline
+		result.residual = result.spectrum - self.data
+		result.rmsd = np.sqrt(np.mean(result.residual**2))
+		result.amplitude = np.sum(weights)
+		result.weights = weights
+		if result.amplitude != 0:
+			result.weights = weights / result.amplitude
+		for i in range(0, len(Pars)):
+			Pars[i].weight = float(result.weights[i])
+		result.Parameters = Pars[0] if len(Pars) == 1 else Pars
+		result.std = np.zeros(len(x))
+		if opt is not None:
+			result.nfev = opt.nfev
+			result.success = opt.success
+			result.message = opt.message
+			nlin = len(weights) + len(result.baseline_coefficients)
+			dof = max(len(self.data) - len(x) - nlin, 1)
+			cov = np.linalg.pinv(opt.jac.T @ opt.jac) * np.sum(opt.fun**2) / dof
+			result.std = np.sqrt(np.abs(np.diag(cov)))
+		result.evaluations = [system.evaluations for system in self.systems]
+		return result
+
+
+class Fit_Result:
+	"""
+	Result of fit().
+
+	Attributes
+	----------
+	Parameters
+		Fitted Parameters object (list for several systems). The weights
+		are set to the fitted relative weights.
+	x, labels, std
+		fitted values, names and standard deviations of the varied elements
+	stages
+		first invalidated pipeline stage of each varied element
+	field, data, spectrum, residual, rmsd
+		field axis, data, best fit, residual and root-mean-square deviation
+	components, weights, amplitude
+		weighted component spectra, relative weights and total amplitude
+	baseline, baseline_coefficients
+		fitted baseline and its Legendre coefficients (field axis scaled
+		to [-1, 1])
+	evaluations
+		number of evaluations of each pipeline stage per system
+	nfev, success, message
+		information of the optimizer
+
+	"""
+
+	def __init__(self):
+		self.nfev = 0
+		self.success = True
+		self.message = "No parameters varied."
+
+
+def print_Info(result):
+	print("\n********Fitting information********")
+	for label, value, std in zip(result.labels, result.x, result.std):
+		print(label + ": " + str(value) + " +- " + str(std))
+	if len(result.weights) > 1:
+		print("Weights: " + str(result.weights))
+	print("RMSD: " + str(result.rmsd))
+	print("Function evaluations: " + str(result.nfev))
+	print(result.message)
+	return
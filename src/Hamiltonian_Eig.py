@@ -6,38 +6,35 @@ Created on Sat Oct 21 14:35:34 2017
 """
 
 # External libraries
+import functools
 import numpy as np
 import math as math
-from scipy import linalg as LAS
 from . import Tools as tool
 from . import Nucdic as Nucdic
 from . import Pauli_generators
+from . import Profiler as prof
+
+con = tool.physical_constants()
 
 create_Pauli_matrices = Pauli_generators.create_Pauli_matrices
 create_Pauli_matrices_Nuc = Pauli_generators.create_Pauli_matrices_Nuc
 create_seperate_Pauli_matrices_Nuc = Pauli_generators.create_seperate_Pauli_matrices_Nuc
 
-try:
-	from numba import complex64, int32, jit
-
-	Numba = 1
-except ImportError:
-	Numba = 0
+Numba = 1 if tool.numba_available() else 0
 
 
 def dec_eigvector_phase():
 	"""
-	Creates a decorator for the function preselect_off_res(). If Numba
+	Creates a decorator for the function phase_eigenvectors(). If Numba
 	is available, the decorator is a Numba jit (just-in-time compilation),
-	otherwise the identity decorator is called (this decorator does nothing).
+	otherwise the Python function is called (see Tools.lazy_jit()).
 	The jit decorator is called with defined static types to improve the
 	performance. Cashing is enabled to avoid avoid compilation each time
 	the Python program is invoked.
 	"""
-	if Numba == 1:
-		return jit(complex128[:, :](complex128[:, :], int64), nopython=True, cache=True)
-	else:
-		return dec_identity
+	return tool.lazy_jit(
+		"complex128[:, :](complex128[:, :], int64)", nopython=True, cache=True
+	)
 
 
 def dec_identity(ob):
@@ -230,7 +227,7 @@ def ZFS_Hamiltonian(Par):
 	(c) Stephan Rein, 31.10.2017
 	"""
 	# Conversion constants
-	mT2Hzperg = 1e9 * tool.mT2GHz(1.0, 1.0)
+	mT2Hzperg = con.mT2Hzperg
 	# Allocations
 	Par.Pauli = create_Pauli_matrices(Par)
 	dimension = len(Par.Pauli[0, 0, :])
@@ -242,84 +239,152 @@ def ZFS_Hamiltonian(Par):
 	Par.Ham_ZFS = np.zeros(
 		(1, Par.nKnots, phiKnots, dimension, dimension), dtype=np.complex64, order="C"
 	)
-	Ham = np.zeros((dimension, dimension), dtype=np.complex64, order="C")
 	Par.Ham_FD = np.zeros(
 		(1, Par.nKnots, phiKnots, dimension, dimension), dtype=np.complex64, order="C"
 	)
 	randmatrix = define_I(Par, dimension)
-	# Run the Loop over theta and phi for setting up the Hamiltonian
+	# Interactions as (tensor, operators) pairs, see interaction_terms()
+	ZFS_terms = []
+	FD_terms = []
+	FD_isotropic = 0
+	if Par.D is not None:
+		for i in range(0, Par.coupled_e_dim):
+			ZFS_terms.append(bilinear_term(Par.D_tensor, Par.Pauli[i], Par.Pauli[i]))
+	if Par.DPair is not None:
+		ZFS_terms.append(bilinear_term(Par.DPair_tensor, Par.Pauli[0], Par.Pauli[1], 2))
+	if Par.J is not None:
+		ZFS_terms.append(bilinear_term(Par.J_tensor, Par.Pauli[0], Par.Pauli[1], -1))
+	if Par.A is not None:
+		for i in range(0, Par.number_of_nuclei):
+			if Par.number_of_nuclei > 1:
+				nucstring = Par.Nucs[i]  # each nuclei seperately
+			else:
+				nucstring = Par.Nucs
+			for s in range(0, Par.coupled_e_dim):
+				# Define coupling to different nuclei for electrons
+				I = hyperfine_operator(Par, s, i)
+				if I is not None:
+					ZFS_terms.append(bilinear_term(Par.A_tensor[i], Par.Pauli[s], I))
+			zeeman = 1.0 * Nucdic.nuclear_properties(nucstring)[0]
+			if Par.coupled_e_dim == 1:
+				FD_isotropic = FD_isotropic + create_Isotrop_Hamiltonian(Par.I[i, 2], zeeman)
+	# Add the Zeeman interaction
+	for i in range(0, Par.coupled_e_dim):
+		FD_terms.append(linear_term(Par.g_tensor[i, :, :] * mT2Hzperg, Par.Pauli[i]))
+	# Set up the Hamiltonian for all orientations of the theta/phi grid
+	rotations = orientation_rotations(Par.nKnots, Knots_theta_vec, phiKnots, Par.nOctants)
+	valid = (np.arange(0, phiKnots) < Knots_theta_vec[:, None])[:, :, None, None]
+	ZFS = interaction_terms(ZFS_terms, rotations, dimension)
+	FD = interaction_terms(FD_terms, rotations, dimension)
 	for k in range(0, Par.nKnots):
-		theta = (math.pi / 2) * ((k) / (Par.nKnots - 1))
-		for q in range(0, Knots_theta_vec[k]):
-			phi = (Par.nOctants * np.pi / 2) * ((q) / (Knots_theta_vec[k] * 1.0 - 1))
-			Ham = 0
-			eulermatrix = tool.Eulermatrix(phi, theta)
-			if Par.D is not None:
-				for i in range(0, Par.coupled_e_dim):
-					Ham_tmp = create_Bilinear_Hamiltonian(
-						Par.D_tensor, Par.Pauli[i], Par.Pauli[i], eulermatrix
-					)
-					Ham += Ham_tmp
-			if Par.DPair is not None:
-				Ham_tmp = create_Bilinear_Hamiltonian(
-					Par.DPair_tensor, Par.Pauli[0], Par.Pauli[1], eulermatrix
-				)
-				Ham += 2 * Ham_tmp
-			if Par.J is not None:
-				Ham_tmp = create_Bilinear_Hamiltonian(
-					Par.J_tensor, Par.Pauli[0], Par.Pauli[1], eulermatrix
-				)
-				Ham -= Ham_tmp
-			# Add the Zeeman interaction
-			if Par.A is not None:
-				for i in range(0, Par.number_of_nuclei):
-					if Par.number_of_nuclei > 1:
-						nucstring = Par.Nucs[i]  # each nuclei seperately
-					else:
-						nucstring = Par.Nucs
-					for s in range(0, Par.coupled_e_dim):
-						# Define coupling to different nuclei for electrons
-						if hasattr(Par, "ENucCoupling"):
-							if Par.ENucCoupling[s, i]:
-								if Par.SepHilbertspace:
-									arg = [
-										Par.A_tensor[i],
-										Par.Pauli[s],
-										Par.I[s, i],
-										eulermatrix,
-									]
-									Ham_tmp = create_Bilinear_Hamiltonian(*arg)
-									Ham += Ham_tmp
-								else:
-									arg = [
-										Par.A_tensor[i],
-										Par.Pauli[s],
-										Par.I[i],
-										eulermatrix,
-									]
-									Ham_tmp = create_Bilinear_Hamiltonian(*arg)
-									Ham += Ham_tmp
-						else:
-							arg = [Par.A_tensor[i], Par.Pauli[s], Par.I[i], eulermatrix]
-							Ham_tmp = create_Bilinear_Hamiltonian(*arg)
-							Ham += Ham_tmp
-					zeeman = 1.0 * Nucdic.nuclear_properties(nucstring)[0]
-					if Par.coupled_e_dim > 1:
-						pass
-					else:
-						Ham_tmp = create_Isotrop_Hamiltonian(Par.I[i, 2], zeeman)
-						Par.Ham_FD[0, k, q, :, :] = Par.Ham_FD[0, k, q, :, :] + Ham_tmp
-			# Add the Zeeman interaction
-			for i in range(0, Par.coupled_e_dim):
-				args = [Par.g_tensor[i, :, :] * mT2Hzperg, Par.Pauli[i], eulermatrix]
-				Ham_tmp = create_linear_Hamiltonian(*args)
-				Par.Ham_FD[0, k, q] = Par.Ham_FD[0, k, q] + Ham_tmp
-			Ham += randmatrix
-			Par.Ham_ZFS[0, k, q] = Ham
+		Par.Ham_ZFS[0, k] = orientation_Hamiltonians(ZFS, k) + valid[k] * randmatrix
+		Par.Ham_FD[0, k] = orientation_Hamiltonians(FD, k) + valid[k] * FD_isotropic
 	zero_field_diag(Par, Knots_theta_vec, phiKnots)
 	return
 
 
+def hyperfine_operator(Par, s, i):
+	"""
+	Nuclear spin operators of nucleus i for the hyperfine coupling to
+	electron s (None if they are not coupled, see Par.ENucCoupling).
+
+	"""
+	if hasattr(Par, "ENucCoupling"):
+		if not Par.ENucCoupling[s, i]:
+			return None
+		if Par.SepHilbertspace:
+			return Par.I[s, i]
+	return Par.I[i]
+
+
+def bilinear_term(Tensor, S, I, factor=1.0):
+	"""
+	Tensor and operators factor * S_i I_j (shape (3, 3, dim, dim)) of a
+	bilinear interaction S*T'*I (see create_Bilinear_Hamiltonian()).
+
+	"""
+	return Tensor, factor * np.einsum("iab,jbc->ijac", S, I)
+
+
+def linear_term(Tensor, S):
+	"""
+	Tensor and operators of a linear interaction S*T'*u_z (see
+	create_linear_Hamiltonian()).
+
+	"""
+	operators = np.zeros((3, 3) + S.shape[1:], dtype=S.dtype)
+	operators[:, 2] = S
+	return Tensor, operators
+
+
+def orientation_rotations(nKnots, Knots_theta_vec, phiKnots, nOctants):
+	"""
+	Euler matrices of the theta/phi grid (see define_nKnots_pattern()).
+
+	Returns
+	-------
+	rotations
+		Read-only array (nKnots, phiKnots, 3, 3). The entries with
+		q >= Knots_theta_vec[k] are zero.
+
+	Notes
+	-----
+	The stacks are cached per orientation grid.
+
+	"""
+	key = tuple(int(n) for n in Knots_theta_vec)
+	return _orientation_rotations(int(nKnots), key, int(phiKnots), nOctants)
+
+
+@functools.lru_cache(maxsize=16)
+def _orientation_rotations(nKnots, Knots_theta_vec, phiKnots, nOctants):
+	k = np.arange(0, nKnots)[:, None]
+	q = np.arange(0, phiKnots)[None, :]
+	nphi = np.asarray(Knots_theta_vec)[:, None]
+	theta = (math.pi / 2) * ((k) / (nKnots - 1))
+	phi = (nOctants * np.pi / 2) * ((q) / np.maximum(nphi * 1.0 - 1, 1.0))
+	rotations = tool.Eulermatrices(phi, theta)
+	rotations[np.broadcast_to(q >= nphi, (nKnots, phiKnots))] = 0
+	rotations.setflags(write=False)
+	return rotations
+
+
+def interaction_terms(terms, rotations, dimension):
+	"""
+	Coefficients of the rotated tensors on the orientation grid
+	(nKnots, phiKnots, 9 * len(terms)) and the corresponding operators
+	(9 * len(terms), dimension ** 2) of a list of (tensor, operators) terms.
+	The Hamiltonians follow with orientation_Hamiltonians().
+
+	"""
+	nKnots, phiKnots = rotations.shape[0:2]
+	if not terms:
+		return np.zeros((nKnots, phiKnots, 0)), np.zeros((0, dimension ** 2))
+	coefficients = np.concatenate(
+		[
+			tool.tensor_rotations(Tensor, rotations).reshape(nKnots, phiKnots, 9)
+			for Tensor, operators in terms
+		],
+		axis=-1,
+	)
+	operators = np.concatenate(
+		[np.reshape(operators, (9, dimension ** 2)) for Tensor, operators in terms]
+	)
+	return coefficients, operators
+
+
+def orientation_Hamiltonians(terms, k):
+	"""
+	Hamiltonians (phiKnots, dim, dim) of the theta row k for the output of
+	interaction_terms().
+
+	"""
+	coefficients, operators = terms
+	dimension = int(round(math.sqrt(operators.shape[1])))
+	Ham = coefficients[k] @ operators
+	return Ham.reshape(-1, dimension, dimension)
+
+
 def zero_field_diag(Par, Knots_theta_vec, phiKnots):
 	"""
 	input: Par, Knots_theta_vec, phiKnots
@@ -329,65 +394,40 @@ def zero_field_diag(Par, Knots_theta_vec, phiKnots):
 	The function stores the zero-field density matrices as a list of
 	zero-field matrices
 	"""
+	from scipy import linalg as LAS
+
 	rho_0 = np.zeros((1, Par.nKnots, phiKnots), dtype=object)
 	# Do only calculate the zero Par.field eigenvectors for spin-polarization
 	if Par.ispopu:
 		rho_init, rho_0_tmp = set_up_density_mat(Par)
+		if not Par.Singlet and not Par.Triplet:
+			terms = []
+			S = Par.Pauli[0]
+			if Par.D is not None:
+				terms.append(bilinear_term(Par.D_tensor, S, S))
+			if Par.DPair is not None:
+				terms.append(bilinear_term(Par.D_tensor, S, S, 2))
+			if Par.J is not None:
+				terms.append(bilinear_term(Par.J_tensor, S, S, -1))
+			# Add the hyperfine interaction
+			if Par.A is not None:
+				for i in range(0, Par.number_of_nuclei):
+					for s in range(0, Par.coupled_e_dim):
+						# Coupling different nuclei for diff. electrons
+						I = hyperfine_operator(Par, s, i)
+						if I is not None:
+							terms.append(bilinear_term(Par.A_tensor[i], Par.Pauli[s], I))
+			rotations = orientation_rotations(
+				Par.nKnots, Knots_theta_vec, phiKnots, Par.nOctants
+			)
+			ZF = interaction_terms(terms, rotations, len(S[0]))
 		# Run the Loop over theta and phi for setting up the ZF density matrix
 		for k in range(0, Par.nKnots):
-			theta = (math.pi / 2) * ((k) / (Par.nKnots - 1))
+			if not Par.Singlet and not Par.Triplet:
+				Ham_row = orientation_Hamiltonians(ZF, k)
 			for q in range(0, Knots_theta_vec[k]):
-				phi = (Par.nOctants * np.pi / 2) * (
-					(q) / (Knots_theta_vec[k] * 1.0 - 1)
-				)
-				Ham = 0
-				eulermatrix = tool.Eulermatrix(phi, theta)
-				args = [None, Par.Pauli[0], Par.Pauli[0], eulermatrix]
 				if not Par.Singlet and not Par.Triplet:
-					if Par.D is not None:
-						args[0] = Par.D_tensor
-						Ham_tmp = create_Bilinear_Hamiltonian(*args)
-						Ham += Ham_tmp
-					if Par.DPair is not None:
-						args[0] = Par.D_tensor
-						Ham_tmp = create_Bilinear_Hamiltonian(*args)
-						Ham += 2 * Ham_tmp
-					if Par.J is not None:
-						args[0] = Par.J_tensor
-						Ham_tmp = create_Bilinear_Hamiltonian(*args)
-						Ham_tmp = create_Bilinear_Hamiltonian(*args)
-						Ham -= Ham_tmp
-					# Add the hyperfine interaction
-					if Par.A is not None:
-						for i in range(0, Par.number_of_nuclei):
-							for s in range(0, Par.coupled_e_dim):
-								# Coupling different nuclei for diff. electrons
-								if hasattr(Par, "ENucCoupling"):
-									if Par.ENucCoupling[s, i]:
-										if Par.SepHilbertspace:
-											ags = (
-												Par.A_tensor[i],
-												Par.Pauli[s],
-												Par.I[s, i],
-												eulermatrix,
-											)
-										else:
-											ags = (
-												Par.A_tensor[i],
-												Par.Pauli[s],
-												Par.I[i],
-												eulermatrix,
-											)
-								else:
-									ags = (
-										Par.A_tensor[i],
-										Par.Pauli[s],
-										Par.I[i],
-										eulermatrix,
-									)
-								Ham_tmp = create_Bilinear_Hamiltonian(*ags)
-								Ham += Ham_tmp
-					w, v = LAS.eigh(Ham, driver="evd", check_finite=True) #driver="gvd"
+					w, v = LAS.eigh(Ham_row[q], driver="evd", check_finite=True) #driver="gvd"
 					w = np.real(w)
 					tmp = np.sum(v.real, axis=0)
 					s = np.where(tmp < 0)[0]
@@ -433,7 +473,8 @@ def set_up_density_mat(Par):
 
 
 def FD_diagonalization(
-	nKnots, Knots_theta_vec, phiKnots, Ham_ZFS, field, dimension, Ham_FD, ispopu=False
+	nKnots, Knots_theta_vec, phiKnots, Ham_ZFS, field, dimension, Ham_FD, ispopu=False,
+	vectors=True
 ):
 	"""
 	Core diagonalization routine for a field-dependent Hamiltonian
@@ -462,6 +503,9 @@ def FD_diagonalization(
 	Ham_FD: :class:`np.array`
 			Multidimensional array with all field-dependent Hamiltionian parts
 
+	vectors: :class:`bool`
+			 If False, the eigenvectors are not stored (eigvec is None).
+
 	Returns
 	-------
 	eigvec :  :class:`np.array`
@@ -483,11 +527,13 @@ def FD_diagonalization(
 	"""
 	# Allocations
 	n_explicit = len(field)
-	eigvec = np.zeros(
-		(dimension, nKnots, phiKnots, n_explicit, dimension),
-		dtype=np.complex64,
-		order="C",
-	)
+	eigvec = None
+	if vectors:
+		eigvec = np.zeros(
+			(dimension, nKnots, phiKnots, n_explicit, dimension),
+			dtype=np.complex64,
+			order="C",
+		)
 	eigval = np.zeros(
 		(dimension, nKnots, phiKnots, n_explicit), dtype=np.float64, order="C"
 	)
@@ -496,19 +542,45 @@ def FD_diagonalization(
 		for q in range(0, Knots_theta_vec[k]):
 			for m in range(0, n_explicit):
 				Hamilonian = Ham_ZFS[k, q] + Ham_FD[k, q] * field[m]
-				w, v = LAS.eigh(
-					Hamilonian, overwrite_a=True, driver="evd", check_finite=False
-				) # `driver = "gvd"` can replace `turbo=true` but "input b array to be supplied for generalized eigenvalue problems". Unsure how to implement.
-				if ispopu:
-					eigvec[:, k, q, m, :] = phase_eigenvectors(v, dimension)
-				else:
-					eigvec[:, k, q, m, :] = np.transpose(v)
+				w, v = diagonalize(Hamilonian, dimension, ispopu)
+				if vectors:
+					eigvec[:, k, q, m, :] = v
 				eigval[:, k, q, m] = w
 	return eigvec, eigval
 
 
-# @dec_eigvector_phase()
-@jit(nopython=True,cache=True) if Numba==1 else None
+def diagonalize(Hamilonian, dimension, ispopu=False):
+	"""
+	Eigendecomposition of one Hamiltonian. Returns the eigenvalues and the
+	(rephased, if ispopu) eigenvectors as rows.
+	"""
+	from scipy import linalg as LAS
+
+	w, v = LAS.eigh(
+		Hamilonian, overwrite_a=True, driver="evd", check_finite=False
+	) # `driver = "gvd"` can replace `turbo=true` but "input b array to be supplied for generalized eigenvalue problems". Unsure how to implement.
+	if ispopu:
+		v = phase_eigenvectors(v, dimension)
+	else:
+		v = np.transpose(v)
+	return w, v
+
+
+def orientation_eigvec(Par, Knots_theta_vec, k, q, m):
+	"""
+	Eigenvectors (as rows) of the Hamiltonian for one orientation (k, q) at
+	the field point Par.field[m]. Same as Par.eigvec[:, k, q, m] but
+	without storing the eigenvectors of all orientations.
+	"""
+	dimension = Par.Hilbert_dim
+	if q >= Knots_theta_vec[k]:
+		return np.zeros((dimension, dimension), dtype=np.complex64)
+	Hamilonian = Par.Ham_ZFS[0, k, q] + Par.Ham_FD[0, k, q] * Par.field[m]
+	w, v = diagonalize(Hamilonian, dimension, Par.ispopu)
+	return v.astype(np.complex64)
+
+
+@dec_eigvector_phase()
 def phase_eigenvectors(v, dimension):
 	# Previous method for phase change in eigenvectors
 	for j in range(0, dimension):
@@ -523,7 +595,32 @@ def phase_eigenvectors(v, dimension):
 	return v
 
 
-def HF_Eig(Par):
+def fixed_field_Eig(Par, field):
+	"""
+	Eigenvalues and -vectors of all orientations at one magnetic field (in
+	mT) for a frequency-swept spectrum. They are stored in Par.eigval and
+	Par.eigvec (with one field point, Par.field = [field]) as in HF_Eig(),
+	but no field bisection is needed.
+	"""
+	Knots_theta_vec = define_nKnots_pattern(Par)
+	dimension = len(Par.Pauli[0, 0, :])
+	Par.field = np.array([float(field)])
+	Par.n_explicit = 1
+	Par.eigvec, Par.eigval = FD_diagonalization(
+		Par.nKnots,
+		Knots_theta_vec,
+		Par.phinKnots,
+		Par.Ham_ZFS[0],
+		Par.field,
+		dimension,
+		Par.Ham_FD[0],
+		Par.ispopu,
+	)
+	prof.record_array("fixed_field_Eig", Par.eigvec)
+	return
+
+
+def HF_Eig(Par, max_bytes=None):
 	"""
 	Core algorithm for field bisection and eigenvalue determination
 
@@ -532,6 +629,12 @@ def HF_Eig(Par):
 	Par :	  :class:`object`
 			  Object with all user-defined parameters.
 
+	max_bytes : :class:`int`
+			  Memory for the eigenvalues and -vectors (including the copies
+			  during the bisection). If exceeded, the eigenvectors are not
+			  stored (Par.eigvec is None) and have to be calculated in chunks
+			  of orientations later on. Default is no limit.
+
 	Notes
 	-----
 	This function is the core function for high-field diagonalization.
@@ -559,6 +662,16 @@ def HF_Eig(Par):
 	# Allocations
 	dimension = len(Par.Pauli[0, 0, :])
 	Par.field = np.linspace(Par.Range[0], Par.Range[1], Par.n_explicit, endpoint=True)
+
+	def fits(n_explicit):
+		# Eigenvalues and -vectors, their copies during np.append() and
+		# sorting and those of the two new field points
+		if max_bytes is None:
+			return True
+		size = Par.nKnots * Par.phinKnots * dimension * (dimension + 1)
+		return 8 * size * (2 * n_explicit + 2) <= max_bytes
+
+	vectors = fits(Par.n_explicit)
 	# Initial calcualtion at three magnetic Par.field points
 	Par.eigvec, Par.eigval = FD_diagonalization(
 		Par.nKnots,
@@ -569,6 +682,7 @@ def HF_Eig(Par):
 		dimension,
 		Par.Ham_FD[0],
 		Par.ispopu,
+		vectors,
 	)
 	eigaverage = (Par.eigval[:, :, :, 2] + Par.eigval[:, :, :, 0]) * 0.5
 	eigdiffmax = np.amax(eigaverage - Par.eigval[:, :, :, 1])
@@ -586,6 +700,10 @@ def HF_Eig(Par):
 				field_tmp1 = (Par.field[i] + Par.field[i + 1]) / 2
 				field_tmp2 = (Par.field[i + 1] + Par.field[i + 2]) / 2
 				field_tmp = np.array([field_tmp1, field_tmp2])
+				if vectors and not fits(len(Par.field) + 2):
+					# Drop the eigenvectors to stay below max_bytes
+					vectors = False
+					Par.eigvec = None
 				eigvec, eigval = FD_diagonalization(
 					Par.nKnots,
 					Knots_theta_vec,
@@ -595,15 +713,17 @@ def HF_Eig(Par):
 					dimension,
 					Par.Ham_FD[0],
 					Par.ispopu,
+					vectors,
 				)
 				eigdiff = np.amax(eigaverage - eigval[:, :, :, 0])
 				Par.field = np.append(Par.field, field_tmp)
 				Par.eigval = np.append(Par.eigval, eigval, axis=3)
-				Par.eigvec = np.append(Par.eigvec, eigvec, axis=3)
 				idx = np.argsort(Par.field, axis=-1, kind="quicksort")
 				Par.field = Par.field[idx]
-				Par.eigvec = Par.eigvec[:, :, :, idx]
 				Par.eigval = Par.eigval[:, :, :, idx]
+				if vectors:
+					Par.eigvec = np.append(Par.eigvec, eigvec, axis=3)
+					Par.eigvec = Par.eigvec[:, :, :, idx]
 				eigaverage = (Par.eigval[:, :, :, i] + Par.eigval[:, :, :, i + 2]) * 0.5
 				eigdiff = np.amax(eigaverage - Par.eigval[:, :, :, i + 1])
 				if eigdiff > eigdiffmax:
@@ -617,4 +737,6 @@ def HF_Eig(Par):
 				Par.n_explicit = len(Par.field)
 				j += 2
 				counter += 1
+	prof.count("HF_Eig bisection rounds", counter)
+	prof.record_array("HF_Eig", Par.eigval if Par.eigvec is None else Par.eigvec)
 	return
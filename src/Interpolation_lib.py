@@ -12,6 +12,7 @@ with a probality function either about theta or ph (or both).
 
 Main functions:
 spline_interpolation_angle_grid()
+spline_interpolation_chunks()
 spline_interpolation_analytical_resInt()
 spline_interpol_phi_proj()
 field_interpol()
@@ -25,7 +26,6 @@ make_orientationdepency_theta()
 
 import numpy as np
 import math as math
-from scipy import interpolate
 
 
 def spline_interpolation_angle_grid(Par, intensity, res):
@@ -63,6 +63,7 @@ def spline_interpolation_angle_grid(Par, intensity, res):
 
 	(c) Stephan Rein, University of Freiburg, 31.10.2017
 	"""
+	from scipy import interpolate
 
 	# Allocation of theta and phi grids
 	res_inter = np.zeros((Par.Transdim, Par._ntheta, Par._nphi), dtype=np.float64)
@@ -105,6 +106,66 @@ def spline_interpolation_angle_grid(Par, intensity, res):
 	return intensity, res, theta, phi
 
 
+def spline_interpolation_chunks(Par, intensity, res, rows, intensities=True):
+	"""
+	Interpolation of spline_interpolation_angle_grid() in chunks of rows
+	theta angles of one transition.
+
+	Parameters
+	----------
+	Par
+		must have Par._nphi and Par._ntheta
+	intensity, res
+		Sticks on the orientation grid
+	rows
+		Number of theta angles per chunk
+	intensities
+		If False, only the resonance fields are interpolated.
+
+	Yields
+	------
+	k, t, intensity, res
+		Transition k, index t of the first theta angle and the interpolated
+		intensities (None if not intensities) and resonance fields of the
+		chunk (rows x Par._nphi).
+
+	"""
+	from scipy import interpolate
+
+	k1 = np.linspace(0, math.pi / 2, num=Par.nKnots, endpoint=True)
+	k2 = np.linspace(0, Par.nOctants * np.pi / 2, num=Par.phinKnots, endpoint=True)
+	k3 = np.linspace(0, math.pi / 2, num=Par._ntheta, endpoint=True)
+	k4 = np.linspace(0, Par.nOctants * np.pi / 2, num=Par._nphi, endpoint=True)
+	# Bilinear for intensities if the spectrum exceeds field range
+	order = 1 if Par.field_warning else 3
+	weights = None
+	if intensities and (hasattr(Par, "oritheta") or hasattr(Par, "oriphi")):
+		# Orientation dependent weighting of the full angle grid
+		weights = np.ones((1, Par._ntheta, Par._nphi))
+		if hasattr(Par, "oritheta"):
+			weights = make_orientationdepency_theta(
+				weights, k3, Par.oritheta[0], Par.oritheta[1]
+			)
+		if hasattr(Par, "oriphi"):
+			weights = make_orientationdepency_phi(
+				weights, k4, Par.oriphi[0], Par.oriphi[1]
+			)
+	for k in range(0, Par.Transdim):
+		f2 = interpolate.RectBivariateSpline(k1, k2, res[k], kx=3, ky=3)
+		if intensities:
+			f1 = interpolate.RectBivariateSpline(
+				k1, k2, intensity[k], kx=order, ky=order
+			)
+		for t in range(0, Par._ntheta, rows):
+			theta = k3[t : t + rows]
+			inten = None
+			if intensities:
+				inten = f1(theta, k4)
+				if weights is not None:
+					inten *= weights[0, t : t + rows]
+			yield k, t, inten, f2(theta, k4)
+
+
 def make_orientationdepency_theta(intensity, theta, pos_theta, sigma_theta):
 	"""
 	Parameters
@@ -225,6 +286,8 @@ def spline_interpolation_analytical_resInt(Par, intensity, resonance, ntransitio
 
 	(c) Stephan Rein, University of Freiburg, 31.10.2017
 	"""
+	from scipy import interpolate
+
 	# Allocation of the zero matrices
 	phimax = max(phi)
 	intensity2 = np.zeros((ntransitions, Par._nphi, Par._ntheta))
@@ -301,6 +364,8 @@ def field_interpol(field, signal, Par):
 	-----
 	(c) Stephan Rein, University of Freiburg, 31.10.2017
 	"""
+	from scipy import interpolate
+
 	# Allocation
 	k1 = np.linspace(Par.Range[0], Par.Range[1], Par.Points, endpoint=True)
 	spl = interpolate.splrep(field, signal, k=3)
@@ -0,0 +1,561 @@
+#! python3
+# -*- coding: utf-8 -*-
+"""
+Memory and runtime planning of solid-state simulations.
+
+Before a simulation, plan() estimates the size of the large arrays
+(Hamiltonians, eigenvectors, eigenvalues, resonance differences and the
+interpolated angle grid) from the Hilbert space dimension, the orientation
+grid of the Hamiltonian point group and the number of field points of the
+bisection, and the runtime from the number of diagonalizations.
+
+During a simulation with a memory limit (Parameters.max_memory in MB), the
+functions of this module decide whether the eigenvectors are stored for
+all orientations or calculated in chunks of theta angles, and whether the
+interpolation to the angle grid is carried out in chunks of theta angles.
+
+"""
+# Load all external libraries
+import time as time
+from copy import copy
+import numpy as np
+from . import Tools as tool
+
+# *****************************************************************************
+# Physical constants and unit conversion factors + global default settings
+# *****************************************************************************
+# Load physical constans
+con = tool.physical_constants()
+MB = 1e6  # Bytes per MB (unit of max_memory)
+Max_bisections = 512  # Maximal number of bisection rounds (see HF_Eig())
+Hamiltonian_time = 4e-5  # s per orientation and interaction (set up)
+Resonance_time = 2e-5  # s per orientation and transition (resonance loop)
+Max_angles = 500  # Maximal number of interpolated theta/phi values
+Max_angles_Dhinfty = 700  # Maximal number of interpolated theta values (Dhinfty)
+Histogram_block = 65536  # Sticks per block of np.histogram()
+Histogram_bytes = 48  # Bytes per stick of a block of np.histogram()
+Chunk_bytes = 32  # Bytes per interpolated angle of one spline evaluation
+Rendering_bytes = 320  # Bytes per field point of the broadening
+Overhead = 1e5  # Bytes of the spin operators and small arrays of a simulation
+_timings = {}  # Measured times of a diagonalization and a product per dim
+
+
+# *****************************************************************************
+# Array sizes
+# *****************************************************************************
+
+
+def array_bytes(
+	dimension, nKnots, phinKnots, n_explicit, transitions, grid=(0, 0), Points=0
+):
+	"""
+	Sizes (in bytes) of the large arrays of a solid-state simulation.
+
+	Parameters
+	----------
+	dimension : :class:`int`
+		Hilbert space dimension
+	nKnots, phinKnots : :class:`int`
+		Number of theta and phi values of the orientation grid
+	n_explicit : :class:`int`
+		Number of field points after the bisection
+	transitions : :class:`int`
+		Number of transitions in the resonance field range
+	grid : :class:`tuple`
+		Number of interpolated theta and phi values (see
+		spectral_processing.interpolation_number())
+	Points : :class:`int`
+		Number of field points of the spectrum
+
+	Returns
+	-------
+	sizes : :class:`dict`
+		Bytes of 'Hamiltonian' (zero-field and field-dependent part),
+		'eigvec', 'eigval', 'Delta_t' (resonance differences of all
+		transitions, as allocated by the preselection), 'sticks'
+		(resonance fields and intensities), 'interpolation' (resonance
+		fields and intensities on the interpolated angle grid) and
+		'broadening' (rendering, convolution and interpolation to the
+		field points).
+
+	"""
+	orientations = nKnots * phinKnots
+	all_transitions = dimension * (dimension - 1) // 2
+	return {
+		"Hamiltonian": 2 * 8 * dimension ** 2 * orientations,
+		"eigvec": 8 * dimension ** 2 * orientations * n_explicit,
+		"eigval": 8 * dimension * orientations * n_explicit,
+		"Delta_t": 8 * all_transitions * orientations * n_explicit,
+		"sticks": 4 * 8 * transitions * orientations,
+		"interpolation": 2 * 8 * transitions * grid[0] * grid[1],
+		"broadening": Rendering_bytes * Points,
+	}
+
+
+def peak_bytes(
+	sizes, rows=None, nKnots=None, transitions=None, grid=(0, 0), grid_rows=None
+):
+	"""
+	Peak memory of the stages of a solid-state simulation.
+
+	Without rows, all eigenvectors are stored. With rows, the eigenvectors
+	and resonance differences are calculated in chunks of rows theta
+	angles (of nKnots) for the given number of transitions. With grid_rows,
+	the interpolation to the angle grid (grid = (theta, phi) values) is
+	carried out in chunks of grid_rows theta angles of one transition (see
+	interpolation_bytes()).
+
+	"""
+	sticks = stick_bytes(sizes, rows, nKnots, transitions)
+	return max(sticks, interpolation_bytes(sizes, grid, grid_rows))
+
+
+def stick_bytes(sizes, rows=None, nKnots=None, transitions=None):
+	"""
+	Peak memory of the bisection and the stick spectrum (see peak_bytes()).
+	In chunks, the preselection of the transitions compares the energy
+	differences of all orientations (about 1.5 times the eigenvalues).
+
+	"""
+	if rows is None:
+		bisection = sizes["Hamiltonian"] + 2 * (sizes["eigvec"] + sizes["eigval"])
+		sticks = sizes["eigvec"] + sizes["eigval"] + sizes["Delta_t"]
+		return Overhead + max(bisection, sticks + sizes["sticks"])
+	bisection = sizes["Hamiltonian"] + 2 * sizes["eigval"]
+	preselection = sizes["Hamiltonian"] + 5 * sizes["eigval"] // 2
+	chunks = bisection + sizes["sticks"] + rows * row_bytes(sizes, nKnots, transitions)
+	return Overhead + max(preselection, chunks)
+
+
+def interpolation_bytes(sizes, grid, grid_rows=None):
+	"""
+	Peak memory of the interpolation to the angle grid (grid = (theta, phi)
+	values), the binning of the sticks and the broadening. Without
+	grid_rows, the angle grid of all transitions is stored. With grid_rows,
+	the interpolation is carried out in chunks of grid_rows theta angles of
+	one transition.
+
+	"""
+	if grid_rows is None:
+		stored = sizes["interpolation"]
+		chunk = grid[0] * grid[1]
+		sticks = stored // 16
+	else:
+		stored = 0
+		chunk = grid_rows * grid[1]
+		sticks = chunk
+	interpolation = stored + Chunk_bytes * chunk
+	interpolation += Histogram_bytes * min(sticks, Histogram_block)
+	return Overhead + max(sizes["sticks"] + interpolation, sizes["broadening"])
+
+
+def row_bytes(sizes, nKnots, transitions):
+	"""Bytes of the eigenvectors and resonance differences of one theta."""
+	dimension = max(sizes["eigvec"] // max(sizes["eigval"], 1), 1)
+	delta_bytes = sizes["eigval"] * transitions // dimension
+	return (sizes["eigvec"] + sizes["eigval"] + delta_bytes) // nKnots
+
+
+# *****************************************************************************
+# Decisions during a simulation with Parameters.max_memory
+# *****************************************************************************
+
+
+def max_memory(Par):
+	"""Memory limit in bytes (None without limit)."""
+	if not hasattr(Par, "max_memory") or Par.max_memory is None:
+		return None
+	return Par.max_memory * MB
+
+
+def eigen_budget(Par):
+	"""
+	Memory (in bytes) for the eigenvalues and -vectors during HF_Eig()
+	after the set up of the Hamiltonians, or None without limit.
+
+	"""
+	limit = max_memory(Par)
+	if limit is None:
+		return None
+	return limit - Overhead - Par.Ham_ZFS.nbytes - Par.Ham_FD.nbytes
+
+
+def use_chunks(Par):
+	"""
+	True if the resonance fields have to be calculated in chunks of
+	orientations to stay below Parameters.max_memory.
+
+	"""
+	limit = max_memory(Par)
+	if limit is None:
+		return False
+	if Par.eigvec is None:
+		return True
+	dimension = len(Par.eigval)
+	sizes = array_bytes(
+		dimension, Par.nKnots, Par.phinKnots, Par.n_explicit, expected_transitions(Par)
+	)
+	stored = sizes["eigvec"] + sizes["eigval"] + sizes["Delta_t"] + sizes["sticks"]
+	return Overhead + stored > limit
+
+
+def theta_rows(Par, transitions):
+	"""
+	Number of theta angles per chunk for the given number of transitions
+	in the resonance field range.
+
+	"""
+	dimension = len(Par.eigval)
+	sizes = array_bytes(
+		dimension, Par.nKnots, Par.phinKnots, Par.n_explicit, transitions
+	)
+	limit = max_memory(Par)
+	rows = chunk_rows(sizes, limit, Par.nKnots, transitions)
+	peak = stick_bytes(sizes, rows, Par.nKnots, transitions)
+	if peak > limit:
+		print(
+			"\nWarning: max_memory = " + str(Par.max_memory) + " MB is too small."
+			+ " The orientations are processed in chunks of " + str(rows)
+			+ " theta angles (about " + str(round(peak / MB, 1)) + " MB).\n"
+		)
+	return rows
+
+
+def chunk_rows(sizes, limit, nKnots, transitions):
+	"""
+	Number of theta angles (of nKnots) per chunk of the eigenvectors and
+	resonance differences to stay below limit (bytes), at least one.
+
+	"""
+	fixed = Overhead + sizes["Hamiltonian"] + 2 * sizes["eigval"] + sizes["sticks"]
+	rows = int((limit - fixed) // max(row_bytes(sizes, nKnots, transitions), 1))
+	return min(max(rows, 1), nKnots)
+
+
+def grid_rows(sizes, limit, ntheta, nphi):
+	"""
+	Number of interpolated theta angles per chunk of one transition to
+	stay below limit (bytes), or None if the interpolated angle grid of all
+	transitions fits.
+
+	"""
+	if interpolation_bytes(sizes, (ntheta, nphi)) <= limit:
+		return None
+	row = (Chunk_bytes + Histogram_bytes) * nphi
+	rows = int((limit - Overhead - sizes["sticks"]) // row)
+	return min(max(rows, 1), ntheta)
+
+
+def interpolation_rows(Par, sticks):
+	"""
+	Number of interpolated theta angles per chunk of one transition (see
+	Direct_conversion_to_Field.chunked_stick_spectrum()) or None if the
+	interpolation to the angle grid fits into Parameters.max_memory.
+	sticks are the bytes of the stick spectrum on the orientation grid.
+
+	"""
+	limit = max_memory(Par)
+	if limit is None:
+		return None
+	sizes = {
+		"sticks": sticks,
+		"interpolation": 2 * 8 * Par.Transdim * Par._ntheta * Par._nphi,
+		"broadening": Rendering_bytes * Par.Points,
+	}
+	rows = grid_rows(sizes, limit, Par._ntheta, Par._nphi)
+	peak = interpolation_bytes(sizes, (Par._ntheta, Par._nphi), rows)
+	if peak > limit:
+		print(
+			"\nWarning: max_memory = " + str(Par.max_memory) + " MB is too small."
+			+ " The interpolation to the angle grid and the broadening need"
+			+ " about " + str(round(peak / MB, 1)) + " MB.\n"
+		)
+	return rows
+
+
+# *****************************************************************************
+# Estimates before a simulation
+# *****************************************************************************
+
+
+def expected_field_points(Par):
+	"""
+	Number of field points after the bisection of HF_Eig().
+
+	Notes
+	-----
+	The bisection of HF_Eig() is carried out with the eigenvalues of all
+	orientations (the Hamiltonians are set up, but no eigenvectors are
+	calculated), so the number of field points is the same as in the
+	simulation. The deviations from linearity are dominated by the level
+	crossings of the orientations, which cannot be estimated from the
+	zero-field energies.
+
+	"""
+	from .Hamiltonian_Eig import ZFS_Hamiltonian, define_nKnots_pattern
+
+	Work = copy(Par)
+	ZFS_Hamiltonian(Work)
+	Knots_theta_vec = define_nKnots_pattern(Work)
+
+	def eigenvalues(field):
+		# Eigenvalues (levels, orientations, field points)
+		eigval = []
+		for k in range(0, Work.nKnots):
+			q = Knots_theta_vec[k]
+			Ham_ZFS = Work.Ham_ZFS[0, k, :q]
+			Ham_FD = Work.Ham_FD[0, k, :q]
+			Ham = Ham_ZFS[None] + Ham_FD[None] * field[:, None, None, None]
+			eigval.append(np.linalg.eigvalsh(Ham))
+		return np.transpose(np.concatenate(eigval, axis=1), (2, 1, 0))
+
+	def deviation(i):
+		return np.amax((eigval[:, :, i] + eigval[:, :, i + 2]) * 0.5 - eigval[:, :, i + 1])
+
+	Range = Par.Range
+	field = np.linspace(Range[0], Range[1], Par.n_explicit, endpoint=True)
+	eigval = eigenvalues(field)
+	threshold = 2e4 * (Range[1] - Range[0])
+	eigdiffmax = deviation(0)
+	j = 1
+	counter = 0
+	while eigdiffmax > threshold and counter < Max_bisections:
+		eigdiffmax = 0
+		for i in range(0, j, 2):
+			if deviation(i) > threshold:
+				field_tmp = np.array(
+					[(field[i] + field[i + 1]) / 2, (field[i + 1] + field[i + 2]) / 2]
+				)
+				field = np.append(field, field_tmp)
+				eigval = np.append(eigval, eigenvalues(field_tmp), axis=2)
+				idx = np.argsort(field, axis=-1, kind="quicksort")
+				field = field[idx]
+				eigval = eigval[:, :, idx]
+				eigdiffmax = max(eigdiffmax, deviation(i), deviation(i + 2))
+				j += 2
+				counter += 1
+	return len(field)
+
+
+def expected_grid(Par):
+	"""
+	Largest number of interpolated theta and phi values (see
+	spectral_processing.interpolation_number()).
+
+	"""
+	ntheta = Max_angles
+	nphi = Max_angles
+	if Par.Point_Group == "O3":
+		ntheta = 4
+		nphi = 4
+	elif Par.Point_Group == "Dhinfty":
+		ntheta = Max_angles_Dhinfty
+		nphi = 4
+	nphi = nphi * Par.nOctants
+	if hasattr(Par, "Interpolative_Refinement"):
+		ntheta = int(round(Par.Interpolative_Refinement * ntheta))
+		nphi = int(round(Par.Interpolative_Refinement * nphi))
+	return max(ntheta, 4), max(nphi, 4)
+
+
+def expected_transitions(Par):
+	"""
+	Expected number of transitions in the resonance field range (all
+	electron spin transitions with all nuclear sublevels).
+
+	"""
+	all_transitions = Par.e_dimension * Par.dim_nuc_tot
+	all_transitions = all_transitions * (all_transitions - 1) // 2
+	return min(all_transitions, (Par.e_dimension - 1) * Par.dim_nuc_tot ** 2)
+
+
+def timings(dimension):
+	"""
+	Measured times (in s) of one diagonalization and of one matrix product
+	of the given dimension.
+
+	"""
+	from scipy import linalg as LAS
+
+	if dimension not in _timings:
+		rng = np.random.default_rng(0)
+		H = rng.standard_normal((dimension, dimension)) * (1 + 1j)
+		H = H + H.conj().T
+		H64 = H.astype(np.complex64)
+		times = [[], []]
+		for r in range(0, 5):
+			st = time.perf_counter()
+			LAS.eigh(H.copy(), overwrite_a=True, driver="evd", check_finite=False)
+			times[0].append(time.perf_counter() - st)
+			st = time.perf_counter()
+			np.dot(H64, H64)
+			times[1].append(time.perf_counter() - st)
+		_timings[dimension] = (min(times[0]), min(times[1]))
+	return _timings[dimension]
+
+
+def plan_system(Par):
+	"""
+	Estimate for one isotope combination. Par is a Solid_State_Workspace
+	after the presettings (see plan()).
+
+	"""
+	from .Hamiltonian_Eig import define_nKnots_pattern
+
+	dimension = Par.e_dimension * Par.dim_nuc_tot
+	orientations = int(np.sum(define_nKnots_pattern(Par)))
+	n_explicit = expected_field_points(Par)
+	transitions = expected_transitions(Par)
+	resonances = transitions
+	if transitions > 30 and Par.Point_Group != "Dhinfty":
+		resonances = min(transitions, Par.allowed_EPR_trans)
+	grid = expected_grid(Par)
+	sizes = array_bytes(
+		dimension, Par.nKnots, Par.phinKnots, n_explicit, transitions, grid, Par.Points
+	)
+	rows = None
+	angle_rows = None
+	limit = max_memory(Par)
+	if limit is not None:
+		if stick_bytes(sizes) > limit:
+			rows = chunk_rows(sizes, limit, Par.nKnots, transitions)
+		angle_rows = grid_rows(sizes, limit, grid[0], grid[1])
+	peak = peak_bytes(sizes, rows, Par.nKnots, transitions, grid, angle_rows)
+	diagonalizations = orientations * n_explicit
+	if rows is not None:
+		diagonalizations *= 2
+	interactions = 2 + Par.number_of_nuclei
+	diagonalization, product = timings(dimension)
+	runtime = (
+		diagonalizations * diagonalization
+		+ orientations * interactions * (Hamiltonian_time + 9 * product)
+		+ orientations * resonances * Resonance_time
+	)
+	return {
+		"Hilbert_dim": dimension,
+		"Point_Group": Par.Point_Group,
+		"nKnots": Par.nKnots,
+		"phinKnots": Par.phinKnots,
+		"orientations": orientations,
+		"n_explicit": n_explicit,
+		"bisection_rounds": (n_explicit - Par.n_explicit) // 2,
+		"transitions": transitions,
+		"grid": grid,
+		"arrays": sizes,
+		"theta_rows": rows,
+		"interpolation_rows": angle_rows,
+		"peak_memory": peak,
+		"diagonalizations": diagonalizations,
+		"runtime": runtime,
+	}
+
+
+def plan(Parameters, max_memory=None):
+	"""
+	Estimates the peak memory and the runtime of a solid-state simulation
+	without running it.
+
+	Parameters
+	----------
+	Parameters : :class:`object` or :class:`list` of :class:`object`
+		Parameters object(s) of the simulation.
+	max_memory : :class:`float`
+		Memory limit in MB. Default is Parameters.max_memory.
+
+	Returns
+	-------
+	plan : :class:`dict`
+		'systems': list with one estimate per system and isotope
+		combination (Hilbert_dim, Point_Group, orientations, n_explicit,
+		bisection_rounds, transitions, grid (interpolated theta and phi
+		values), arrays (bytes), theta_rows (None if all orientations are
+		processed at once), interpolation_rows (None if the angle grid is
+		interpolated at once), peak_memory (bytes), diagonalizations,
+		runtime (s)), 'peak_memory' (bytes) and 'runtime' (s) of a serial
+		simulation.
+
+	Notes
+	-----
+	The bisection of the field is carried out with the eigenvalues of all
+	orientations (see expected_field_points()), so the Hamiltonians are
+	set up and diagonalized. The interpolated angle grid and the number of
+	transitions are upper bounds, so the peak memory is usually
+	overestimated. The runtime is estimated from a measured diagonalization
+	time. Systems which are not
+	simulated in the solid state (motion 'fast' or 'slow') or exceed the
+	maximal Hilbert space dimension are listed with their motion or
+	warning only.
+
+	Examples
+	--------
+
+	>>> import EPRsim.EPRsim as sim
+	>>> P = sim.Parameters(Nucs='14N,1H,1H', A=[[12, 13, 110], [8, 8, 12],
+		[5, 5, 9]], g=[2.0083, 2.0061, 2.0022], Range=[330, 350])
+	>>> result = sim.plan(P, max_memory=200)
+	>>> sim.print_plan(result)
+
+	"""
+	from . import EPRsim as sim
+	from . import SolidState as so
+	from .Presettings import convert_user_input_and_Set_up_defaults
+
+	Pars = Parameters
+	if not isinstance(Pars, (list, tuple)):
+		Pars = [Pars]
+	systems = []
+	for P in Pars:
+		P = copy(sim.check_if_instance(P))
+		P.lw = copy(P.lw)
+		if max_memory is not None:
+			P.max_memory = max_memory
+		Param = sim.Validate_Parameters(P)
+		for SimPar in Param.Sim_objects:
+			if SimPar.motion != "solid":
+				systems.append({"motion": SimPar.motion})
+				continue
+			Par = so.Solid_State_Workspace(P)
+			Par, SimPar = convert_user_input_and_Set_up_defaults(Par, SimPar)
+			if Par.warning == 1:
+				systems.append({"motion": "solid", "warning": 1})
+				continue
+			entry = plan_system(Par)
+			entry["motion"] = "solid"
+			systems.append(entry)
+	solid = [entry for entry in systems if "runtime" in entry]
+	return {
+		"systems": systems,
+		"peak_memory": max([entry["peak_memory"] for entry in solid], default=0),
+		"runtime": sum([entry["runtime"] for entry in solid]),
+	}
+
+
+def print_plan(plan):
+	"""Prints the estimate of plan()."""
+	print("\n********Plan********")
+	for i, entry in enumerate(plan["systems"]):
+		if "runtime" not in entry:
+			line = "System " + str(i) + ": motion " + entry["motion"]
+			if entry.get("warning") == 1:
+				line += ", Hilbert space too large"
+			print(line)
+			continue
+		print("System " + str(i) + ": Hilbert space dimension "
+		      + str(entry["Hilbert_dim"]) + ", point group " + entry["Point_Group"])
+		print("  Orientations: " + str(entry["orientations"]) + " ("
+		      + str(entry["nKnots"]) + " theta values)")
+		print("  Field points: " + str(entry["n_explicit"]) + " ("
+		      + str(entry["bisection_rounds"]) + " bisection rounds)")
+		print("  Transitions: " + str(entry["transitions"]))
+		for name, size in entry["arrays"].items():
+			print("  " + name + ": " + str(round(size / MB, 3)) + " MB")
+		if entry["theta_rows"] is not None:
+			print("  Chunks of " + str(entry["theta_rows"]) + " theta values")
+		if entry["interpolation_rows"] is not None:
+			print("  Interpolation in chunks of " + str(entry["interpolation_rows"])
+			      + " of " + str(entry["grid"][0]) + " theta values")
+		print("  Peak memory: " + str(round(entry["peak_memory"] / MB, 3)) + " MB")
+		print("  Runtime: " + str(round(entry["runtime"], 3)) + " s")
+	print("Peak memory: " + str(round(plan["peak_memory"] / MB, 3)) + " MB")
+	print("Runtime: " + str(round(plan["runtime"], 3)) + " s")
+	return
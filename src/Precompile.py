@@ -0,0 +1,97 @@
+#! python3
+# -*- coding: utf-8 -*-
+"""
+Ahead-of-time compilation of all Numba kernels into the Numba cache.
+
+Command line use (e.g. in a container build step)::
+
+	python -m eprsim.Precompile --cache-dir /opt/eprsim-cache
+
+At runtime the same directory is used with the environment variable
+EPRSIM_CACHE_DIR (or Tools.set_cache_dir()).
+
+"""
+# Load all external libraries
+import argparse
+import sys
+from . import Tools as tool
+
+# Modules with Numba kernels
+Kernel_modules = [
+	"FastMotion",
+	"Direct_conversion_to_Field",
+	"resfield_full",
+	"Hamiltonian_Eig",
+]
+
+
+def precompile(cache_dir=None, verbose=True):
+	"""
+	Compiles all Numba kernels with their typed signatures and writes them
+	to the Numba cache.
+
+	Parameters
+	----------
+	cache_dir : :class:`string`, optional
+				Directory of the Numba cache. Default is EPRSIM_CACHE_DIR or
+				the Numba default (next to the installed sources).
+	verbose : :class:`bool`, optional
+				Prints the report.
+
+	Returns
+	-------
+	report : :class:`list` of :class:`dict`
+		One entry per kernel with the keys 'name', 'module', 'signature',
+		'status' ('compiled', 'cached' or 'python') and 'fallback' (reason
+		for the fallback to the Python function or None).
+
+	"""
+	from importlib import import_module
+
+	if cache_dir is not None:
+		tool.set_cache_dir(cache_dir)
+	for name in Kernel_modules:
+		import_module("." + name, __package__)
+	report = []
+	for function in tool._jit_functions:
+		function.compile()
+		report.append({
+			"name": function.__name__,
+			"module": function.__module__,
+			"signature": function.signature,
+			"status": function.status(),
+			"fallback": function.fallback,
+		})
+	if verbose:
+		print_report(report)
+	return report
+
+
+def print_report(report):
+	print("\n********Numba kernels********")
+	if tool._cache_dir is not None:
+		print("Cache directory: " + tool._cache_dir)
+	for entry in report:
+		line = entry["module"] + "." + entry["name"] + ": " + entry["status"]
+		if entry["fallback"] is not None:
+			line += " (" + entry["fallback"] + ")"
+		print(line)
+	python = [entry["name"] for entry in report if entry["status"] == "python"]
+	if python:
+		print("\nWARNING: " + str(len(python)) + " kernels run as pure Python!")
+	return
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		description="Compile all EPRsim Numba kernels into the Numba cache."
+	)
+	parser.add_argument("--cache-dir", help="directory of the Numba cache")
+	parser.add_argument("--quiet", action="store_true")
+	args = parser.parse_args(argv)
+	report = precompile(args.cache_dir, not args.quiet)
+	return int(any(entry["status"] == "python" for entry in report))
+
+
+if __name__ == "__main__":
+	sys.exit(main())
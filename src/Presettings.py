@@ -298,13 +298,10 @@ def rotate_coordsystems(Par):
 			Par.A_tensor = tool.tensor_rotation(Par.A_tensor, eulermatrix)
 		else:
 			Par.AFrame = np.asarray(Par.AFrame)
-			for i in range(Par.number_of_nuclei):
-				eulermatrix = tool.Eulermatrix(
-					Par.AFrame[i, 2], Par.AFrame[i, 1], Par.AFrame[i, 0]
-				)
-				Par.A_tensor[i, :] = tool.tensor_rotation(
-					Par.A_tensor[i, :], eulermatrix
-				)
+			eulermatrices = tool.Eulermatrices(
+				Par.AFrame[:, 2], Par.AFrame[:, 1], Par.AFrame[:, 0]
+			)
+			Par.A_tensor = tool.tensor_rotations(Par.A_tensor, eulermatrices)
 	if hasattr(Par, "DFrame"):
 		eulermatrix = tool.Eulermatrix(Par.DFrame[2], Par.DFrame[1], Par.DFrame[0])
 		Par.D_tensor = tool.tensor_rotation(Par.D_tensor, eulermatrix)
@@ -0,0 +1,169 @@
+#! python3
+# -*- coding: utf-8 -*-
+"""
+Profiling of the simulation stages (wall time, call counts and peak array
+sizes).
+
+The simulation modules mark their stages with stage() and record_array().
+Without an active Profiler these calls return immediately.
+
+"""
+# Load all external libraries
+import threading
+import time as time
+import numpy as np
+
+_active = []  # Stack of active Profiler objects
+_lock = threading.Lock()
+
+
+class Profiler:
+	"""
+	Records wall time, call counts and peak array sizes of the simulation
+	stages.
+
+	Notes
+	-----
+	A Profiler is active inside a with statement or during a simulation
+	with simulate(..., profiler=prof). Stages of all threads are recorded,
+	stages in worker processes (executor='process') are not. Times of
+	nested stages are inclusive.
+
+	Examples
+	--------
+
+	>>> import EPRsim.EPRsim as sim
+	>>> from EPRsim.Profiler import Profiler
+	>>> P = sim.Parameters(Nucs='14N', A=[12, 13, 110], lw=[0.2, 0.3],
+		g=[2.0083, 2.0061, 2.0022], Range=[330, 350])
+	>>> with Profiler() as prof:
+	>>>     B0, spc, flag = sim.simulate(P)
+	>>> prof.print_report()
+
+	"""
+
+	def __init__(self):
+		self.stages = {}
+		self.counters = {}
+		self._start = None
+		self.total_time = 0.0
+
+	def __enter__(self):
+		with _lock:
+			_active.append(self)
+		self._start = time.perf_counter()
+		return self
+
+	def __exit__(self, *args):
+		self.total_time += time.perf_counter() - self._start
+		with _lock:
+			_active.remove(self)
+		return False
+
+	def _entry(self, name):
+		if name not in self.stages:
+			self.stages[name] = {
+				"time": 0.0, "calls": 0, "peak_bytes": 0, "peak_shape": ()
+			}
+		return self.stages[name]
+
+	def add_time(self, name, elapsed):
+		with _lock:
+			entry = self._entry(name)
+			entry["time"] += elapsed
+			entry["calls"] += 1
+
+	def add_array(self, name, array):
+		array = np.asarray(array)
+		with _lock:
+			entry = self._entry(name)
+			if array.nbytes > entry["peak_bytes"]:
+				entry["peak_bytes"] = array.nbytes
+				entry["peak_shape"] = array.shape
+
+	def add_count(self, name, n):
+		with _lock:
+			self.counters[name] = self.counters.get(name, 0) + n
+
+	def report(self):
+		"""
+		Returns the profile as a dictionary with the keys 'total_time',
+		'stages' (name: time, calls, peak_bytes, peak_shape) and 'counters'.
+
+		"""
+		with _lock:
+			stages = dict((name, dict(entry)) for name, entry in self.stages.items())
+			counters = dict(self.counters)
+		return {"total_time": self.total_time, "stages": stages, "counters": counters}
+
+	def print_report(self):
+		report = self.report()
+		print("\n********Profile********")
+		print("Total time: " + str(round(report["total_time"], 6)) + " s")
+		for name, entry in report["stages"].items():
+			line = name + ": " + str(round(entry["time"], 6)) + " s, "
+			line += str(entry["calls"]) + " calls"
+			if entry["peak_bytes"] > 0:
+				line += ", peak array " + str(entry["peak_shape"]) + " ("
+				line += str(round(entry["peak_bytes"] / 1e6, 3)) + " MB)"
+			print(line)
+		for name, n in report["counters"].items():
+			print(name + ": " + str(n))
+		return
+
+
+class _Stage:
+	"""Context manager which adds its wall time to all active profilers."""
+
+	__slots__ = ("name", "profilers", "start")
+
+	def __init__(self, name, profilers):
+		self.name = name
+		self.profilers = profilers
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *args):
+		elapsed = time.perf_counter() - self.start
+		for prof in self.profilers:
+			prof.add_time(self.name, elapsed)
+		return False
+
+
+class _Null_stage:
+	"""Context manager without effect (no active profiler)."""
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		return False
+
+
+_null_stage = _Null_stage()
+
+
+def stage(name):
+	"""Context manager which records the wall time of a stage."""
+	if not _active:
+		return _null_stage
+	return _Stage(name, list(_active))
+
+
+def record_array(name, *arrays):
+	"""Records the size of the largest array of a stage."""
+	if not _active:
+		return
+	array = max(arrays, key=lambda a: np.asarray(a).nbytes)
+	for prof in list(_active):
+		prof.add_array(name, array)
+
+
+def count(name, n=1):
+	"""Adds n to a counter (e.g. bisection rounds)."""
+	if not _active:
+		return
+	for prof in list(_active):
+		prof.add_count(name, n)
@@ -0,0 +1,926 @@
+#! python3
+# -*- coding: utf-8 -*-
+"""
+Slow-motion cw-EPR simulations based on the stochastic Liouville equation
+(SLE) in a basis of Wigner rotation functions.
+
+"""
+# Load all external libraries
+from math import exp, lgamma, log
+import numpy as np
+from . import Tools as tool
+from . import FastMotion as fm
+
+
+# *****************************************************************************
+# Physical constants and unit conversion factors + global default settings
+# *****************************************************************************
+
+# Load physical constans
+con = tool.physical_constants()
+hbar = con.h / (2 * np.pi)
+# Define specific default values for the slow motion program
+defLMKmax = [14, 2, 6]  # Default maximum L, M and K of the spatial basis
+defSolver = "Lanczos"  # Default solver of the SLE
+Lanczos_thresh = 1e-6  # Relative convergence threshold of continued fraction
+CG_thresh = 1e-8  # Relative residual threshold of the CG solver
+max_Liouville_dim = 250000  # Maximum dimension of the pruned Liouville space
+nQuad = 12  # Number of quadrature nodes per Euler angle for the projection
+Basis_truncation = True  # Truncate the basis by the Krylov space weights
+Basis_weight_thresh = 1e-6  # Relative weight threshold for the truncation
+Cache_size = 16  # Maximum number of cached spin systems
+_template_cache = {}  # Liouville templates keyed by (LMKmax, nuclear spins)
+_Liouville_cache = {}  # Pruned templates keyed additionally by symmetry
+
+
+def slow_motion_kernel(Param, SimPar):
+	"""
+	Kernel function for the calculation of one slow-motion cw-EPR spectrum
+
+	Parameters
+	----------
+	Param: eprsim.EPRsim.Parameters
+		Definitions of spin system and experimental parameters
+	SimPar: eprsim.EPRsim.Simulation_Params
+		Parameters of one isotope combination
+
+	Returns
+	-------
+	Bfield
+		Magnetic field vector
+	Int
+		Intensity of one cw-EPR spectrum
+	warning
+		0 = no warning, 1 = Liouville space too large,
+		2 = electron spin was reduced to S = 1/2
+
+	Notes
+	-----
+	The stochastic Liouville equation is set up in the high-field
+	approximation for the electron coherence :math:`|\\alpha\\rangle\\langle
+	\\beta|`. The orientational part is expanded in normalized Wigner
+	functions :math:`D^L_{MK}` up to LMKmax, the nuclear part in the full
+	nuclear Liouville space. Secular and pseudo-secular hyperfine terms, the
+	anisotropic electron Zeeman interaction and the nuclear Zeeman
+	interaction are included. All tensors need to be in the principal axis
+	system of the rotational diffusion tensor. The steps in the calculation
+	are:
+
+	1. Set up the Liouville matrix as weighted sum of cached templates
+	   in the basis pruned to all functions coupled to the starting vector
+	2. Truncate the basis if a previous run of the same spin system allows it
+	3. Lanczos tridiagonalization (or CG solution for each field point)
+	4. Evaluation of the spectrum as continued fraction for all field points
+	5. Convolution with a Gaussian lineshape function if required
+	6. Pseudo-field modulation and normalization
+
+	The anisotropic Zeeman interaction is evaluated at the isotropic
+	resonance field, so that the field sweep is equivalent to a shift of the
+	frequency offset. Thereby one Krylov space is used for all field points.
+
+	References
+	----------
+	.. [1] : D. J. Schneider, J. H. Freed, Biological Magnetic Resonance
+	   Vol. 8, 1989, 1-76
+
+	"""
+	warning = 0
+	if SimPar._tcorriso is None:
+		print(
+			"\nWARNING: A slow-motion simulation requires tcorr!"
+			" An isotropic spectrum is calculated."
+		)
+		Bfield, Int, warning = fm.fast_motion_kernel(Param, SimPar)
+		return Bfield, Int, warning
+	if Param.S > 0.5:
+		warning = 2
+	LMKmax = getattr(Param, "LMKmax", defLMKmax)
+	Solver = getattr(Param, "Solver", defSolver)
+	Bfield = SimPar.Bfield
+	giso = np.mean(SimPar.g)
+	B0 = fm.Biso(giso, SimPar.mwFreq)
+	Liou, v, info = Liouville_matrix(SimPar, LMKmax, B0)
+	if Liou is None:
+		print(
+			"\nWARNING: Liouville space is too large for slow-motion simulation"
+			" (dim = " + str(info["dim"]) + ")!"
+		)
+		return Bfield, np.zeros(len(Bfield)), 1
+	# Frequency offsets (rad/s) for all field points
+	omega = 2 * np.pi * SimPar.mwFreq - giso * con.beta * Bfield * 1e-3 / hbar
+	z = 1j * omega
+	if Solver == "CG":
+		f = cocg_resolvent(Liou, v, z)
+	else:
+		alpha, beta, weight = lanczos_tridiagonal(Liou, v, z)
+		f = continued_fraction(alpha, beta, z)
+		truncate_basis(info, weight)
+	Int = np.real(f)
+	if SimPar.lw[1] > 0:
+		Int = tool.convolution_G(SimPar.lw[1], Bfield, Int)
+	if Param.Harmonic == 1:
+		Int = tool.pseudo_field_modulation(0.001, Bfield, Int)
+	Int = tool.normalize2area(Int, Param.Harmonic)
+	if Param.verbosity:
+		print_Info(SimPar, LMKmax, Solver, info)
+	return Bfield, Int, warning
+
+
+# *****************************************************************************
+# Wigner rotation functions and angular momentum coupling
+# *****************************************************************************
+
+
+def Wigner_d(j, mp, m, beta):
+	"""
+	Wigner small-d function :math:`d^j_{m'm}(\\beta)`
+
+	Parameters
+	----------
+	j, mp, m: int
+		rank and projections
+	beta
+		second Euler angle in rad (float or numpy.ndarray)
+
+	Returns
+	-------
+	d
+		Value(s) of the Wigner small-d function
+
+	"""
+	from scipy.special import eval_jacobi
+
+	beta = np.asarray(beta)
+	mu = abs(m - mp)
+	nu = abs(m + mp)
+	n = j - (mu + nu) // 2
+	if n < 0:
+		return np.zeros(np.shape(beta))
+	sign = (-1) ** (mp - m) if mp > m else 1
+	pre = 0.5 * (
+		log_factorial(n) + log_factorial(n + mu + nu)
+		- log_factorial(n + mu) - log_factorial(n + nu)
+	)
+	return (
+		sign * exp(pre) * np.sin(beta / 2) ** mu * np.cos(beta / 2) ** nu
+		* eval_jacobi(n, mu, nu, np.cos(beta))
+	)
+
+
+def Wigner_D(j, mp, m, alpha, beta, gamma):
+	"""
+	Wigner rotation function :math:`D^j_{m'm}(\\alpha,\\beta,\\gamma) =
+	e^{-im'\\alpha} d^j_{m'm}(\\beta) e^{-im\\gamma}`
+
+	"""
+	return np.exp(-1j * mp * alpha) * Wigner_d(j, mp, m, beta) * np.exp(-1j * m * gamma)
+
+
+def Clebsch_Gordan(j1, m1, j2, m2, J, M):
+	"""
+	Clebsch-Gordan coefficient :math:`\\langle j_1 m_1 j_2 m_2|J M\\rangle`
+	for integer angular momenta (Racah formula).
+
+	"""
+	if m1 + m2 != M or J < abs(j1 - j2) or J > j1 + j2:
+		return 0.0
+	if abs(m1) > j1 or abs(m2) > j2 or abs(M) > J:
+		return 0.0
+	pre = 0.5 * (
+		log(2 * J + 1) + log_factorial(J + j1 - j2) + log_factorial(J - j1 + j2)
+		+ log_factorial(j1 + j2 - J) - log_factorial(j1 + j2 + J + 1)
+		+ log_factorial(J + M) + log_factorial(J - M) + log_factorial(j1 - m1)
+		+ log_factorial(j1 + m1) + log_factorial(j2 - m2) + log_factorial(j2 + m2)
+	)
+	s = 0.0
+	for k in range(0, j1 + j2 - J + 1):
+		n = [j1 + j2 - J - k, j1 - m1 - k, j2 + m2 - k, J - j2 + m1 + k, J - j1 - m2 + k]
+		if min(n) < 0:
+			continue
+		den = log_factorial(k) + sum(log_factorial(x) for x in n)
+		s += (-1) ** k * exp(pre - den)
+	return s
+
+
+def log_factorial(n):
+	"""
+	Logarithm of n! (avoids the overflow of float(factorial(n)) for the
+	Wigner functions and Clebsch-Gordan coefficients of large rank).
+
+	"""
+	return lgamma(n + 1)
+
+
+def spatial_basis(LMKmax):
+	"""
+	Set of orientational basis functions :math:`|L M K\\rangle` with
+	:math:`L \\leq L_{max}`, :math:`|M| \\leq M_{max}` and
+	:math:`|K| \\leq K_{max}`.
+
+	Returns
+	-------
+	basis: numpy.ndarray
+		Matrix with one row [L, M, K] per basis function
+
+	"""
+	Lmax, Mmax, Kmax = [int(x) for x in LMKmax]
+	basis = []
+	for L in range(0, Lmax + 1):
+		for M in range(-min(L, Mmax), min(L, Mmax) + 1):
+			for K in range(-min(L, Kmax), min(L, Kmax) + 1):
+				basis.append([L, M, K])
+	return np.array(basis, dtype=int)
+
+
+def spatial_matrix(basis, L, m, k):
+	"""
+	Matrix representation of the multiplication with :math:`D^L_{mk}` in the
+	normalized Wigner basis
+
+	.. math:: \\langle L_1 M_1 K_1|D^L_{mk}|L_2 M_2 K_2\\rangle =
+		\\sqrt{\\frac{2L_2+1}{2L_1+1}}
+		\\langle L_2 M_2 L m|L_1 M_1\\rangle \\langle L_2 K_2 L k|L_1 K_1\\rangle
+
+	"""
+	from scipy import sparse
+
+	index = {}
+	for i in range(0, len(basis)):
+		index[tuple(basis[i])] = i
+	rows = []
+	cols = []
+	vals = []
+	for j in range(0, len(basis)):
+		L2, M2, K2 = basis[j]
+		for L1 in range(abs(L2 - L), L2 + L + 1):
+			i = index.get((L1, M2 + m, K2 + k))
+			if i is None:
+				continue
+			val = (
+				np.sqrt((2 * L2 + 1) / (2 * L1 + 1))
+				* Clebsch_Gordan(L2, M2, L, m, L1, M2 + m)
+				* Clebsch_Gordan(L2, K2, L, k, L1, K2 + k)
+			)
+			if val != 0:
+				rows.append(i)
+				cols.append(j)
+				vals.append(val)
+	n = len(basis)
+	return sparse.csr_matrix((vals, (rows, cols)), shape=(n, n))
+
+
+def project_Wigner(func):
+	"""
+	Expansion coefficients of a function of the Euler angles in Wigner
+	functions of rank 0 and 2
+
+	Parameters
+	----------
+	func
+		Function of the Euler angles (alpha, beta, gamma) which accepts
+		numpy arrays
+
+	Returns
+	-------
+	coeff: dict
+		Coefficients :math:`c_{Lmk}` with :math:`f = \\sum c_{Lmk} D^L_{mk}`.
+		Only coefficients with a magnitude above 1e-12 of the largest one are
+		returned.
+
+	Notes
+	-----
+	The projection uses an exact quadrature (uniform in alpha and gamma,
+	Gauss-Legendre in cos(beta)) for functions of rank <= 2.
+
+	"""
+	x, wx = np.polynomial.legendre.leggauss(nQuad)
+	ang = np.arange(nQuad) * 2 * np.pi / nQuad
+	alpha, beta, gamma = np.meshgrid(ang, np.arccos(x), ang, indexing="ij")
+	w = np.meshgrid(np.ones(nQuad), wx, np.ones(nQuad), indexing="ij")[1]
+	w = w * (2 * np.pi / nQuad) ** 2
+	f = func(alpha, beta, gamma)
+	coeff = {}
+	for L in (0, 2):
+		for m in range(-L, L + 1):
+			for k in range(-L, L + 1):
+				D = Wigner_D(L, m, k, alpha, beta, gamma)
+				c = (2 * L + 1) / (8 * np.pi ** 2) * np.sum(w * f * np.conj(D))
+				coeff[(L, m, k)] = c
+	cmax = max([abs(c) for c in coeff.values()] + [0])
+	return {key: c for key, c in coeff.items() if abs(c) > 1e-12 * cmax}
+
+
+def lab_tensor_component(tensor, row, col):
+	"""
+	Returns a function of the Euler angles which gives one element of a
+	diagonal tensor (principal values) rotated to the laboratory frame.
+
+	"""
+	tensor = np.asarray(tensor, dtype=float)
+
+	def component(alpha, beta, gamma):
+		R = rotation_matrices(alpha, beta, gamma)
+		return np.sum(R[..., row, :] * tensor * R[..., col, :], axis=-1)
+
+	return component
+
+
+def rotation_matrices(alpha, beta, gamma):
+	"""
+	Rotation matrices :math:`R_z(\\alpha)R_y(\\beta)R_z(\\gamma)` for arrays
+	of Euler angles. The columns are the molecular axes in the laboratory
+	frame.
+
+	"""
+	ca, sa = np.cos(alpha), np.sin(alpha)
+	cb, sb = np.cos(beta), np.sin(beta)
+	cg, sg = np.cos(gamma), np.sin(gamma)
+	R = np.empty(np.shape(alpha) + (3, 3))
+	R[..., 0, 0] = ca * cb * cg - sa * sg
+	R[..., 0, 1] = -ca * cb * sg - sa * cg
+	R[..., 0, 2] = ca * sb
+	R[..., 1, 0] = sa * cb * cg + ca * sg
+	R[..., 1, 1] = -sa * cb * sg + ca * cg
+	R[..., 1, 2] = sa * sb
+	R[..., 2, 0] = -sb * cg
+	R[..., 2, 1] = sb * sg
+	R[..., 2, 2] = cb
+	return R
+
+
+# *****************************************************************************
+# Spin operators and superoperators
+# *****************************************************************************
+
+
+def nuclear_operators(I):
+	"""
+	Nuclear spin operators Iz, I+ and I- of all nuclei in the product space
+
+	Parameters
+	----------
+	I
+		list with nuclear spin quantum numbers
+
+	Returns
+	-------
+	ops: list
+		list with one tuple (Iz, Iplus, Iminus) of dense matrices per nucleus
+
+	"""
+	dims = [int(2 * i + 1) for i in I]
+	ops = []
+	for n in range(0, len(I)):
+		m = I[n] - np.arange(dims[n])
+		Iz = np.diag(m)
+		Ip = np.diag(np.sqrt(I[n] * (I[n] + 1) - m[1:] * (m[1:] + 1)), 1)
+		single = []
+		for op in (Iz, Ip, Ip.T):
+			full = np.ones((1, 1))
+			for k in range(0, len(I)):
+				full = np.kron(full, op if k == n else np.eye(dims[k]))
+			single.append(full)
+		ops.append(tuple(single))
+	return ops
+
+
+def anticommutator_superop(O):
+	"""
+	Superoperator of :math:`X \\rightarrow \\frac{1}{2}(OX + XO)` for
+	row-major vectorized operators X.
+
+	"""
+	eye = np.eye(O.shape[0])
+	return 0.5 * (np.kron(O, eye) + np.kron(eye, O.T))
+
+
+def commutator_superop(O):
+	"""
+	Superoperator of :math:`X \\rightarrow OX - XO` for row-major vectorized
+	operators X.
+
+	"""
+	eye = np.eye(O.shape[0])
+	return np.kron(O, eye) - np.kron(eye, O.T)
+
+
+# *****************************************************************************
+# Liouville matrix templates, basis pruning and caching
+# *****************************************************************************
+
+
+def diffusion_rates(tcorr):
+	"""
+	Perpendicular and parallel rotational diffusion rates in 1/s from the
+	rotational correlation time(s) :math:`R = 1/(6\\tau_c)`.
+
+	"""
+	if isinstance(tcorr, (int, float)):
+		return 1 / (6 * tcorr), 1 / (6 * tcorr)
+	tcorr = list(tcorr)
+	if len(tcorr) == 1:
+		return 1 / (6 * tcorr[0]), 1 / (6 * tcorr[0])
+	return 1 / (6 * tcorr[0]), 1 / (6 * tcorr[1])
+
+
+def Liouville_templates(LMKmax, I):
+	"""
+	Parameter independent matrix templates of the Liouville matrix.
+
+	Parameters
+	----------
+	LMKmax
+		maximum L, M and K of the spatial basis
+	I
+		tuple with nuclear spin quantum numbers
+
+	Returns
+	-------
+	templates: dict
+		Sparse matrices in the full basis. "g" holds one template per
+		principal axis of the g-tensor, "A" one list of three templates
+		per nucleus and "nz" one nuclear Zeeman template per nucleus.
+		"perp" and "par" are the diagonals of the diffusion operator and
+		"start" the (unnormalized) starting vector.
+
+	Notes
+	-----
+	The orientation dependent interactions are linear in the principal values
+	of the tensors. The templates are the Liouville matrices of unit tensors
+	along the principal axes, built from Clebsch-Gordan products of the
+	Wigner basis (see spatial_matrix()) and the nuclear spin superoperators.
+	A Liouville matrix for a given parameter set is therefore only a
+	weighted sum of the templates (see assemble_Liouville()).
+
+	"""
+	from scipy import sparse
+
+	basis = spatial_basis(LMKmax)
+	nspat = len(basis)
+	dims = [int(2 * i + 1) for i in I]
+	dim_n = int(np.prod(dims)) if len(I) > 0 else 1
+	ops = nuclear_operators(list(I))
+	spatial_cache = {}
+
+	def spatial(coeff):
+		spat = sparse.csr_matrix((nspat, nspat), dtype=complex)
+		for key, c in coeff.items():
+			if key not in spatial_cache:
+				spatial_cache[key] = spatial_matrix(basis, *key)
+			spat = spat + c * spatial_cache[key]
+		return spat
+
+	unit = np.eye(3)
+	zz = []
+	plus = []
+	minus = []
+	for i in range(0, 3):
+		fzz = lab_tensor_component(unit[i], 2, 2)
+		fzx = lab_tensor_component(unit[i], 2, 0)
+		fzy = lab_tensor_component(unit[i], 2, 1)
+
+		def fplus(alpha, beta, gamma, fzx=fzx, fzy=fzy):
+			return 0.5 * (fzx(alpha, beta, gamma) - 1j * fzy(alpha, beta, gamma))
+
+		def fminus(alpha, beta, gamma, fzx=fzx, fzy=fzy):
+			return 0.5 * (fzx(alpha, beta, gamma) + 1j * fzy(alpha, beta, gamma))
+
+		zz.append(spatial(project_Wigner(fzz)))
+		plus.append(spatial(project_Wigner(fplus)))
+		minus.append(spatial(project_Wigner(fminus)))
+	eye_n = sparse.identity(dim_n ** 2, format="csr")
+	templates = {"g": [], "A": [], "nz": []}
+	for i in range(0, 3):
+		templates["g"].append(sparse.kron(zz[i], eye_n, format="csr"))
+	for n in range(0, len(I)):
+		Iz, Ip, Im = [sparse.csr_matrix(anticommutator_superop(O)) for O in ops[n]]
+		templates["A"].append(
+			[
+				sparse.kron(zz[i], Iz, format="csr")
+				+ sparse.kron(plus[i], Ip, format="csr")
+				+ sparse.kron(minus[i], Im, format="csr")
+				for i in range(0, 3)
+			]
+		)
+		templates["nz"].append(
+			sparse.kron(
+				sparse.identity(nspat),
+				sparse.csr_matrix(commutator_superop(ops[n][0])),
+				format="csr",
+			)
+		)
+	L = basis[:, 0]
+	K = basis[:, 2]
+	templates["perp"] = np.kron(L * (L + 1) - K ** 2, np.ones(dim_n ** 2))
+	templates["par"] = np.kron(K ** 2, np.ones(dim_n ** 2))
+	start = np.zeros(nspat * dim_n ** 2)
+	start[0 : dim_n ** 2] = np.eye(dim_n).flatten()
+	templates["start"] = start
+	return templates
+
+
+def tensor_symmetry(values):
+	"""
+	Symmetry class of a diagonal tensor for the basis pruning:
+	-1 = zero, 0 = isotropic, 1 = axial (z unique), 2 = rhombic.
+
+	"""
+	values = np.asarray(values, dtype=float)
+	scale = np.max(np.abs(values))
+	if scale == 0:
+		return -1
+	aniso = values - np.mean(values)
+	if np.max(np.abs(aniso)) < 1e-12 * scale:
+		return 0
+	if abs(aniso[0] - aniso[1]) < 1e-12 * scale:
+		return 1
+	return 2
+
+
+def representative_tensor(symmetry, iso):
+	"""
+	Generic principal values of a given symmetry class. Used to determine
+	the basis pruning independently of accidental cancellations.
+
+	"""
+	aniso = {-1: [0, 0, 0], 0: [0, 0, 0], 1: [1, 1, -2], 2: [1.3, -0.31, -0.99]}
+	rep = np.array(aniso[symmetry], dtype=float)
+	if symmetry >= 0 and iso:
+		rep += 0.37
+	return rep
+
+
+def interaction_scales(SimPar, B0):
+	"""
+	Weights of the Liouville templates in rad/s for one parameter set.
+
+	Returns
+	-------
+	gscale
+		weights of the three g templates
+	Ascale
+		list with the weights of the three A templates per nucleus
+	nzscale
+		weights of the nuclear Zeeman templates
+
+	"""
+	g = np.asarray(SimPar.g, dtype=float)
+	gscale = con.beta * B0 / hbar * (g - np.mean(g))
+	I = list(SimPar._I) if SimPar._nofA is not None else []
+	A = np.reshape(np.asarray(SimPar.A, dtype=float), (-1, 3))
+	Ascale = [2 * np.pi * A[n] for n in range(0, len(I))]
+	nzscale = [
+		-1.0 * SimPar._g_n[n] * con.beta_n * B0 / hbar for n in range(0, len(I))
+	]
+	return gscale, Ascale, nzscale
+
+
+def assemble_Liouville(templates, gscale, Ascale, nzscale, Rperp, Rpar, T2inv):
+	"""
+	Weighted sum of the Liouville templates
+	:math:`\\Gamma + T_2^{-1} + i\\hat{L}`.
+
+	"""
+	from scipy import sparse
+
+	Hmat = sparse.csr_matrix(templates["g"][0].shape, dtype=complex)
+	for i in range(0, 3):
+		if gscale[i] != 0:
+			Hmat = Hmat + gscale[i] * templates["g"][i]
+	for n in range(0, len(Ascale)):
+		for i in range(0, 3):
+			if Ascale[n][i] != 0:
+				Hmat = Hmat + Ascale[n][i] * templates["A"][n][i]
+		if nzscale[n] != 0:
+			Hmat = Hmat + nzscale[n] * templates["nz"][n]
+	gamma = Rperp * templates["perp"] + Rpar * templates["par"] + T2inv
+	Liou = sparse.diags(gamma, format="csr") + 1j * Hmat
+	Liou.eliminate_zeros()
+	return Liou
+
+
+def prune_templates(templates, keep):
+	"""
+	Restricts all templates to the basis functions selected by keep.
+
+	"""
+	pruned = {"g": [], "A": [], "nz": []}
+	for T in templates["g"]:
+		pruned["g"].append(T[keep][:, keep])
+	for TA in templates["A"]:
+		pruned["A"].append([T[keep][:, keep] for T in TA])
+	for T in templates["nz"]:
+		pruned["nz"].append(T[keep][:, keep])
+	for key in ("perp", "par", "start"):
+		pruned[key] = templates[key][keep]
+	return pruned
+
+
+def cached_templates(LMKmax, SimPar):
+	"""
+	Returns the pruned Liouville templates of a spin system from the cache
+	or constructs them.
+
+	Parameters
+	----------
+	LMKmax
+		maximum L, M and K of the spatial basis
+	SimPar: eprsim.EPRsim.Simulation_Params
+		Parameters of one isotope combination
+
+	Returns
+	-------
+	entry: dict
+		Cache entry with the pruned templates ("templates"), the dimension of
+		the full basis ("full_dim") and the truncation information
+		("truncation").
+
+	Notes
+	-----
+	The cache is keyed by LMKmax, the nuclear spins and the symmetry classes
+	of the g- and hyperfine tensors (see tensor_symmetry()). The pruning to
+	the subspace coupled to the starting vector is determined with generic
+	tensors of the same symmetry, so that the pruned basis is valid for all
+	parameter sets with the same key. Only the scaling of the templates
+	with g, A and the diffusion rates is done per call.
+
+	"""
+	I = tuple(float(i) for i in SimPar._I) if SimPar._nofA is not None else ()
+	A = np.reshape(np.asarray(SimPar.A, dtype=float), (-1, 3))
+	gsym = tensor_symmetry(SimPar.g)
+	Asym = tuple(tensor_symmetry(A[n]) for n in range(0, len(I)))
+	key = (tuple(int(x) for x in LMKmax), I, gsym, Asym)
+	if key in _Liouville_cache:
+		return _Liouville_cache[key]
+	base_key = key[0:2]
+	if base_key not in _template_cache:
+		if len(_template_cache) >= Cache_size:
+			_template_cache.pop(next(iter(_template_cache)))
+		_template_cache[base_key] = Liouville_templates(*base_key)
+	templates = _template_cache[base_key]
+	gscale = representative_tensor(gsym, False) if gsym > 0 else np.zeros(3)
+	Ascale = [representative_tensor(s, True) for s in Asym]
+	nzscale = [1.0] * len(I)
+	pattern = assemble_Liouville(
+		templates, gscale, Ascale, nzscale, 1.0, 1.0, 1.0
+	)
+	keep = reachable_subspace(pattern, templates["start"] != 0)
+	entry = {
+		"templates": prune_templates(templates, keep),
+		"full_dim": len(keep),
+		"truncation": None,
+	}
+	if len(_Liouville_cache) >= Cache_size:
+		_Liouville_cache.pop(next(iter(_Liouville_cache)))
+	_Liouville_cache[key] = entry
+	return entry
+
+
+def clear_cache():
+	"""
+	Clears the cache of Liouville matrix templates.
+
+	"""
+	_template_cache.clear()
+	_Liouville_cache.clear()
+
+
+def Liouville_matrix(SimPar, LMKmax, B0):
+	"""
+	Sets up the pruned Liouville matrix and the starting vector.
+
+	Parameters
+	----------
+	SimPar: eprsim.EPRsim.Simulation_Params
+		Parameters of one isotope combination
+	LMKmax
+		maximum L, M and K of the spatial basis
+	B0
+		Magnetic field in T for the anisotropic Zeeman interaction
+
+	Returns
+	-------
+	Liou: scipy.sparse.csr_matrix
+		Matrix :math:`\\Gamma + T_2^{-1} + i\\hat{L}` in the pruned basis (None
+		if the pruned basis exceeds max_Liouville_dim)
+	v: numpy.ndarray
+		normalized starting vector in the pruned basis
+	info: dict
+		dimensions of the full, pruned and truncated basis, the cache entry
+		and the truncation measure of this parameter set
+
+	Notes
+	-----
+	If a previous Lanczos run of the same spin system with an equal or
+	larger product of correlation time and anisotropy has been carried out,
+	the basis is additionally truncated to the functions with a
+	non-negligible weight in the Krylov space of that run
+	(see truncate_basis()).
+
+	"""
+	entry = cached_templates(LMKmax, SimPar)
+	templates = entry["templates"]
+	info = {"full_dim": entry["full_dim"], "dim": len(templates["start"])}
+	if info["dim"] > max_Liouville_dim:
+		return None, None, info
+	gscale, Ascale, nzscale = interaction_scales(SimPar, B0)
+	Rperp, Rpar = diffusion_rates(SimPar.tcorr)
+	T2inv = 0.5 * SimPar.lw[0] * 1e-3 * np.mean(SimPar.g) * con.beta / hbar
+	Liou = assemble_Liouville(templates, gscale, Ascale, nzscale, Rperp, Rpar, T2inv)
+	start = templates["start"]
+	measure = max(1 / (6 * Rperp), 1 / (6 * Rpar)) * max(
+		[np.max(np.abs(gscale))] + [np.max(np.abs(a)) for a in Ascale]
+	)
+	info["entry"] = entry
+	info["measure"] = measure
+	info["truncated"] = False
+	trunc = entry["truncation"]
+	if Basis_truncation and trunc is not None and measure <= trunc[0]:
+		keep = trunc[1]
+		Liou = Liou[keep][:, keep]
+		start = start[keep]
+		info["truncated"] = True
+	info["used_dim"] = len(start)
+	v = start / np.linalg.norm(start)
+	return Liou, v, info
+
+
+def truncate_basis(info, weight):
+	"""
+	Stores a truncated basis in the cache entry of a spin system.
+
+	Parameters
+	----------
+	info: dict
+		info dictionary of Liouville_matrix()
+	weight: numpy.ndarray
+		maximum magnitude of each basis function in the normalized Lanczos
+		vectors
+
+	Notes
+	-----
+	Basis functions with a weight below Basis_weight_thresh (relative to the
+	largest weight) do not contribute to the Krylov space generated from the
+	starting vector and are dropped for subsequent calculations of the same
+	spin system.
+
+	"""
+	if info["truncated"] or not Basis_truncation:
+		return
+	keep = weight >= Basis_weight_thresh * np.max(weight)
+	info["entry"]["truncation"] = (info["measure"], keep)
+	return
+
+
+def reachable_subspace(Liou, start):
+	"""
+	Boolean mask of all basis functions which are coupled (directly or
+	indirectly) to the starting vector. All other basis functions do not
+	contribute to the spectrum.
+
+	"""
+	from scipy import sparse
+
+	pattern = sparse.csr_matrix(
+		(np.ones(Liou.nnz), Liou.indices, Liou.indptr), shape=Liou.shape
+	)
+	pattern = pattern + pattern.T
+	keep = start.copy()
+	while True:
+		new = (pattern @ keep.astype(float)) > 0
+		new = new | keep
+		if np.array_equal(new, keep):
+			return keep
+		keep = new
+
+
+# *****************************************************************************
+# Solvers: Lanczos continued fraction and conjugate gradients
+# *****************************************************************************
+
+
+def lanczos_tridiagonal(Liou, v, z, maxiter=None):
+	"""
+	Complex-symmetric Lanczos tridiagonalization of the Liouville matrix.
+
+	Parameters
+	----------
+	Liou
+		sparse complex-symmetric Liouville matrix
+	v
+		normalized real starting vector
+	z
+		vector with complex shifts (all field points)
+	maxiter: int
+		maximum number of Lanczos steps (default: dimension of Liou)
+
+	Returns
+	-------
+	alpha, beta
+		diagonal and off-diagonal elements of the tridiagonal matrix
+	weight
+		maximum magnitude of each basis function in the normalized Lanczos
+		vectors
+
+	Notes
+	-----
+	The Lanczos recursion is independent of the field point. The iteration
+	stops if the continued fraction has converged for all shifts z.
+
+	"""
+	n = Liou.shape[0]
+	if maxiter is None:
+		maxiter = n
+	alpha = []
+	beta = []
+	q_old = np.zeros(n, dtype=complex)
+	q = v.astype(complex)
+	b = 0
+	f_old = None
+	weight = np.zeros(n)
+	for j in range(0, maxiter):
+		weight = np.maximum(weight, np.abs(q) / np.linalg.norm(q))
+		w = Liou @ q - b * q_old
+		a = np.sum(q * w)
+		w = w - a * q
+		alpha.append(a)
+		b = np.sqrt(np.sum(w * w))
+		if j % 10 == 9 or abs(b) < 1e-12 * abs(a):
+			f = continued_fraction(np.array(alpha), np.array(beta), z)
+			if f_old is not None:
+				change = np.max(np.abs(f - f_old)) / np.max(np.abs(f))
+				if change < Lanczos_thresh:
+					break
+			f_old = f
+		if abs(b) < 1e-12 * abs(a):
+			break
+		beta.append(b)
+		q_old = q
+		q = w / b
+	return np.array(alpha), np.array(beta[: len(alpha) - 1]), weight
+
+
+def continued_fraction(alpha, beta, z):
+	"""
+	Evaluates :math:`e_1^T(T-z)^{-1}e_1` for the tridiagonal matrix T as
+	continued fraction for all shifts z.
+
+	"""
+	f = np.zeros(len(z), dtype=complex)
+	for j in range(len(alpha) - 1, -1, -1):
+		if j < len(beta):
+			f = 1 / (alpha[j] - z - beta[j] ** 2 * f)
+		else:
+			f = 1 / (alpha[j] - z)
+	return f
+
+
+def cocg_resolvent(Liou, v, z, maxiter=None):
+	"""
+	Evaluates :math:`v^T(L-z)^{-1}v` for all shifts z with the conjugate
+	orthogonal conjugate gradient (COCG) method for complex-symmetric
+	matrices. The solution of the previous field point is used as initial
+	guess.
+
+	"""
+	n = Liou.shape[0]
+	if maxiter is None:
+		maxiter = 10 * n
+	f = np.zeros(len(z), dtype=complex)
+	x = np.zeros(n, dtype=complex)
+	nv = np.linalg.norm(v)
+	for i in range(0, len(z)):
+		r = v - (Liou @ x - z[i] * x)
+		p = r.copy()
+		rho = np.sum(r * r)
+		for it in range(0, maxiter):
+			if np.linalg.norm(r) < CG_thresh * nv:
+				break
+			q = Liou @ p - z[i] * p
+			a = rho / np.sum(p * q)
+			x = x + a * p
+			r = r - a * q
+			rho_new = np.sum(r * r)
+			p = r + (rho_new / rho) * p
+			rho = rho_new
+		f[i] = np.sum(v * x)
+	return f
+
+
+def print_Info(SimPar, LMKmax, Solver, info):
+	"""
+	Prints information about the simulation pass
+
+	"""
+	print("\n*******************************************")
+	print("************RUN SLOW MOTION*************")
+	print("*******************************************\n")
+	print("Rotational correlation time: " + str(SimPar.tcorr) + " s")
+	print("LMKmax: " + str(LMKmax))
+	print("Solver: " + str(Solver))
+	print("Full Liouville space dimension: " + str(info["full_dim"]))
+	print("Pruned Liouville space dimension: " + str(info["dim"]))
+	if info.get("truncated"):
+		print("Truncated Liouville space dimension: " + str(info["used_dim"]))
+	print("Nuclear spins : " + str(SimPar._Nucsvec))
+	return
@@ -11,7 +11,7 @@ Copyright (c) 2017, Stephan Rein, M.Sc., University of Freiburg
 
 """
 
-from copy import deepcopy
+from copy import copy
 import numpy as np
 import time as time
 from . import Tools as tool
@@ -20,16 +20,94 @@ from . import Presettings
 from . import resfield_full
 from . import spectral_processing
 from . import Hamiltonian_Eig
+from . import Planner
+from . import Profiler as prof
 
 convert_user_input_and_Set_up_defaults = (
 	Presettings.convert_user_input_and_Set_up_defaults
 )
 stick_spectrum_calculation = resfield_full.stick_spectrum_calculation
+frequency_stick_spectrum = resfield_full.frequency_stick_spectrum
 create_conv_spectrum = spectral_processing.create_conv_spectrum
 pseudo_modulation = Convolutions.pseudo_modulation
 
+con = tool.physical_constants()
 
-def solid_state_kernel(Par1, SimPar1):
+
+# *****************************************************************************
+# Workspace of a solid state simulation run
+# *****************************************************************************
+# Attributes which are set during a run (all others are read from the
+# parameters object)
+Workspace_attributes = (
+	"warning", "mwFreq", "S", "nKnots", "LevelSelect", "SepHilbertspace",
+	"ispopu", "T", "D", "D_tensor", "DPair", "DPair_tensor", "J_tensor",
+	"coupled_e_dim", "e_dimension", "Nucs", "A", "A_tmp", "n", "AFrame",
+	"A_tensor", "number_of_nuclei", "dim_nuc", "dim_nuc_tot", "dim_nuc_tot_tmp",
+	"g_tensor", "Population", "Population_t", "Singlet", "Triplet",
+	"Point_Group", "nOctants", "phinKnots", "allowed_NMR_trans",
+	"allowed_EPR_trans", "nKnots_theta_vec", "I", "Pauli", "S_tot",
+	"S_tot_without_nuc", "S_pure_ele", "Hilbert_dim",
+	"Ham_ZFS", "Ham_FD", "rho_0", "eigval", "eigvec", "field", "n_explicit",
+	"trans_dim", "all_trans_dim", "field_length", "field_extra",
+	"field_warning", "Transdim", "Warning_counter", "intensity", "res",
+	"lw", "Harmonic", "Gaussian", "_ntheta", "_nphi", "chunked", "Range",
+	"Points",
+)
+# Intermediate arrays which are freed after the stick spectrum calculation
+Intermediates = (
+	"Ham_ZFS", "Ham_FD", "I", "Pauli", "S_tot", "S_tot_without_nuc",
+	"S_pure_ele", "rho_0", "eigval", "eigvec", "field",
+	"field_extra", "nKnots_theta_vec", "Warning_counter", "intensity", "res",
+)
+
+
+class Solid_State_Workspace:
+	"""
+	Workspace of one solid state simulation run.
+
+	Notes
+	-----
+	The parameters object is used as read-only input. All attributes which
+	are set during the run are stored in the workspace, all other
+	attributes are read from the parameters object. Thus, the parameters
+	do not have to be copied, and intermediate arrays can be freed with
+	release() as soon as they are not needed anymore.
+
+	"""
+
+	__slots__ = ("_spec",) + Workspace_attributes
+
+	def __init__(self, spec):
+		self._spec = spec
+
+	def __getattr__(self, name):
+		# Only called for attributes which are not set in the workspace
+		if name == "_spec" or name.startswith("__"):
+			raise AttributeError(name)
+		return getattr(self._spec, name)
+
+	def __copy__(self):
+		new = Solid_State_Workspace(self._spec)
+		for name in Workspace_attributes:
+			try:
+				value = object.__getattribute__(self, name)
+			except AttributeError:
+				continue
+			setattr(new, name, value)
+		return new
+
+	def release(self, *names):
+		"""Frees the given intermediate attributes."""
+		for name in names:
+			try:
+				delattr(self, name)
+			except AttributeError:
+				pass
+		return
+
+
+def solid_state_kernel(Par1, SimPar1, Harmonic=None):
 	"""
 	Kernel for solid state simulation.
 
@@ -37,6 +115,8 @@ def solid_state_kernel(Par1, SimPar1):
 	----------
 	Par1
 	SimPar1
+	Harmonic
+		0 = absorptive, 1 = first derivative. Default is Par1.Harmonic.
 
 	Returns
 	-------
@@ -45,33 +125,275 @@ def solid_state_kernel(Par1, SimPar1):
 	warning
 
 	"""
-	Par = deepcopy(Par1)
-	SimPar = deepcopy(SimPar1)
-	# st= time.time()
-	Par, SimPar = convert_user_input_and_Set_up_defaults(Par, SimPar)
+	Par, intensity, resonance = solid_state_sticks(Par1, SimPar1)
 	if Par.warning == 1:
 		return (
 			np.linspace(Par.Range[0], Par.Range[1], int(Par.Points)),
 			np.zeros(int(Par.Points)),
 			Par.warning,
 		)
-	Hamiltonian_Eig.ZFS_Hamiltonian(Par)
-	Hamiltonian_Eig.HF_Eig(Par)
-	# print(time.time()-st)
-	# st= time.time()
+	magnetic_field, spectrum, Par = solid_state_broadening(
+		Par, intensity, resonance, Harmonic=Harmonic
+	)
+	if Par.verbosity:
+		print_info(Par)
+	return magnetic_field, spectrum, Par.warning
+
+
+def solid_state_sticks(Par1, SimPar1):
+	"""
+	Linewidth independent part of the solid state simulation (set up of the
+	Hamiltonian, diagonalization and stick spectrum).
+
+	Parameters
+	----------
+	Par1
+		Parameters object (not modified)
+	SimPar1
+		simulation object of Validate_Parameters() (not modified)
+
+	Returns
+	-------
+	Par
+		Solid_State_Workspace with all settings of the simulation
+	intensity
+		stick intensities on the orientation grid (None if Par.warning == 1)
+	resonance
+		stick resonance fields on the orientation grid
+
+	"""
+	Par = Solid_State_Workspace(Par1)
+	with prof.stage("Presettings"):
+		Par, SimPar = convert_user_input_and_Set_up_defaults(Par, SimPar1)
+	if Par.warning == 1:
+		return Par, None, None
+	with prof.stage("ZFS_Hamiltonian"):
+		Hamiltonian_Eig.ZFS_Hamiltonian(Par)
+	with prof.stage("HF_Eig"):
+		Hamiltonian_Eig.HF_Eig(Par, Planner.eigen_budget(Par))
+	Par.release("I", "S_tot_without_nuc", "S_pure_ele")
+	# Chunks of orientations if Par.max_memory would be exceeded
+	Par.chunked = Planner.use_chunks(Par)
+	if not Par.chunked:
+		Par.release("Ham_ZFS", "Ham_FD")
 	intensity, resonance, Par = stick_spectrum_calculation(Par)
-	# print(time.time()-st)
-	# st= time.time()
+	Par.release(*Intermediates)
+	return Par, intensity, resonance
+
+
+def solid_state_experiments(Par1, SimPar1, experiments, Harmonic=None):
+	"""
+	Solid state kernel for several field-swept experiments of one spin
+	system.
+
+	Parameters
+	----------
+	Par1
+	SimPar1
+	experiments
+		list of (mwFreq, Range, Points) with the microwave frequency in GHz
+		and the field range in mT
+	Harmonic
+		0 = absorptive, 1 = first derivative. Default is Par1.Harmonic.
+
+	Returns
+	-------
+	results
+		list of (magnetic_field, spectrum, warning) of solid_state_kernel()
+		for every experiment
+
+	Notes
+	-----
+	The presettings, the orientation grid and the Hamiltonians of all
+	orientations are set up once. The eigendecomposition (HF_Eig()) is
+	carried out once per field range and shared by all experiments with
+	this range, only the stick spectrum and the broadening depend on the
+	microwave frequency.
+
+	"""
+	Par = Solid_State_Workspace(Par1)
+	with prof.stage("Presettings"):
+		Par, SimPar = convert_user_input_and_Set_up_defaults(Par, SimPar1)
+	results = []
+	if Par.warning == 1:
+		for mwFreq, Range, Points in experiments:
+			field = np.linspace(Range[0], Range[1], int(Points))
+			results.append((field, np.zeros(int(Points)), Par.warning))
+		return results
+	with prof.stage("ZFS_Hamiltonian"):
+		Hamiltonian_Eig.ZFS_Hamiltonian(Par)
+	eigen = {}
+	for mwFreq, Range, Points in experiments:
+		ParE = copy(Par)
+		ParE.mwFreq = mwFreq * con.GHz2Hz
+		ParE.Range = list(Range)
+		ParE.Points = int(Points)
+		key = (float(Range[0]), float(Range[1]))
+		if key not in eigen:
+			with prof.stage("HF_Eig"):
+				Hamiltonian_Eig.HF_Eig(ParE, Planner.eigen_budget(ParE))
+			eigen[key] = (ParE.field, ParE.n_explicit, ParE.eigval, ParE.eigvec)
+		ParE.field, ParE.n_explicit, ParE.eigval, ParE.eigvec = eigen[key]
+		ParE.chunked = Planner.use_chunks(ParE)
+		intensity, resonance, ParE = stick_spectrum_calculation(ParE)
+		ParE.release(*Intermediates)
+		magnetic_field, spectrum, ParE = solid_state_broadening(
+			ParE, intensity, resonance, Harmonic=Harmonic
+		)
+		if ParE.verbosity:
+			print_info(ParE)
+		results.append((magnetic_field, spectrum, ParE.warning))
+	return results
+
+
+def solid_state_frequency_kernel(Par1, SimPar1, Harmonic=None):
+	"""
+	Kernel for frequency-swept solid state simulation at the fixed magnetic
+	field Par1.Field (in mT).
+
+	Parameters
+	----------
+	Par1
+	SimPar1
+	Harmonic
+		0 = absorptive, 1 = first derivative. Default is Par1.Harmonic.
+
+	Returns
+	-------
+	frequency
+		microwave frequency axis in GHz (see sweep_range())
+	spectrum
+	warning
+		3 if no transition is in the frequency range
+
+	Notes
+	-----
+	The Hamiltonian of every orientation is diagonalized once at the fixed
+	field and the transition frequencies are broadened directly, so
+	neither the field bisection nor the resonance field search of the
+	field-swept kernel are needed. The linewidths (in mT) are converted to
+	frequency widths with the isotropic g-value (see isotropic_g()).
+
+	"""
+	mwRange = sweep_range(Par1)
+	frequency = np.linspace(mwRange[0], mwRange[1], int(Par1.Points))
+	Par, intensity, resonance = solid_state_frequency_sticks(Par1, SimPar1)
+	if Par.warning == 1:
+		return frequency, np.zeros(int(Par1.Points)), Par.warning
+	if intensity is None:
+		# No transition in the frequency range
+		return frequency, np.zeros(int(Par1.Points)), 3
+	axis, spectrum, Par = solid_state_broadening(
+		Par, intensity, resonance, Harmonic=Harmonic
+	)
+	if Par.verbosity:
+		print_info(Par)
+	return frequency, spectrum, Par.warning
+
+
+def solid_state_frequency_sticks(Par1, SimPar1):
+	"""
+	Linewidth independent part of the frequency-swept solid state
+	simulation (see solid_state_frequency_kernel()).
+
+	Returns
+	-------
+	Par
+		Solid_State_Workspace. Par.Range is the frequency range and Par.lw
+		are the linewidths, both in MHz.
+	intensity
+		stick intensities on the orientation grid (None if Par.warning == 1
+		or no transition is in the frequency range)
+	resonance
+		transition frequencies in MHz on the orientation grid
+
+	"""
+	Par = Solid_State_Workspace(Par1)
+	with prof.stage("Presettings"):
+		Par, SimPar = convert_user_input_and_Set_up_defaults(Par, SimPar1)
+	if Par.warning == 1:
+		return Par, None, None
+	with prof.stage("ZFS_Hamiltonian"):
+		Hamiltonian_Eig.ZFS_Hamiltonian(Par)
+	with prof.stage("fixed_field_Eig"):
+		Hamiltonian_Eig.fixed_field_Eig(Par, Par.Field)
+	Par.release("I", "S_tot_without_nuc", "S_pure_ele", "Ham_ZFS", "Ham_FD")
+	# Frequency axis and linewidths in MHz
+	Par.Range = [f * 1e3 for f in sweep_range(Par1)]
+	Par.lw = list(1e3 * tool.mT2GHz(np.asarray(Par.lw, dtype=float), isotropic_g(Par.g)))
+	margin = 5 * max(Par.lw)
+	window = [(Par.Range[0] - margin) * con.MHz2Hz, (Par.Range[1] + margin) * con.MHz2Hz]
+	intensity, resonance, Par = frequency_stick_spectrum(Par, window)
+	Par.release(*Intermediates)
+	return Par, intensity, resonance
+
+
+def sweep_range(Par):
+	"""
+	Frequency range in GHz of a frequency-swept simulation. Default
+	(Par.mwRange is None) is the range of g-values of the field sweep over
+	Par.Range at Par.mwFreq.
+
+	"""
+	if Par.mwRange is not None:
+		return [float(Par.mwRange[0]), float(Par.mwRange[1])]
+	return [
+		Par.mwFreq * Par.Field / Par.Range[1], Par.mwFreq * Par.Field / Par.Range[0]
+	]
+
+
+def isotropic_g(g):
+	"""
+	Isotropic g-value of a g input (scalar, [g_perp, g_par] or principal
+	values, one row per electron).
+
+	"""
+	g = np.asarray(g, dtype=float)
+	if g.ndim > 0 and g.shape[-1] == 2:
+		g = np.stack([g[..., 0], g[..., 0], g[..., 1]], axis=-1)
+	return float(np.mean(g))
+
+
+def solid_state_broadening(Par, intensity, resonance, lw=None, Harmonic=None):
+	"""
+	Broadening of a stick spectrum of solid_state_sticks().
+
+	Parameters
+	----------
+	Par
+		Parameters object returned by solid_state_sticks()
+	intensity, resonance
+		stick spectrum returned by solid_state_sticks()
+	lw
+		linewidths [Gaussian, Lorentzian] in mT. Default is Par.lw.
+	Harmonic
+		0 = absorptive, 1 = first derivative. Default is Par.Harmonic.
+
+	Returns
+	-------
+	magnetic_field
+	spectrum
+	Par
+		copy of Par with the settings of the broadening step
+
+	Notes
+	-----
+	The stick spectrum is not modified, so that it can be broadened with
+	different linewidths.
+
+	"""
+	Par = copy(Par)
+	if lw is not None:
+		Par.lw = lw
+	if Harmonic is not None:
+		Par.Harmonic = Harmonic
 	magnetic_field, spectrum = create_conv_spectrum(Par, intensity, resonance)
-	# print(time.time()-st)
-	# st= time.time()
 	"""Do pseudo-field modulation if necessary"""
 	if Par.Harmonic == 1:
-		spectrum = tool.pseudo_field_modulation(0.001, magnetic_field, spectrum)
+		with prof.stage("modulation"):
+			spectrum = tool.pseudo_field_modulation(0.001, magnetic_field, spectrum)
 		# magnetic_field, spectrum = pseudo_modulation(Exp,Opt,Sys, magnetic_field,spectrum)
-	if Par.verbosity:
-		print_info(Par)
-	return magnetic_field, spectrum, Par.warning
+	return magnetic_field, spectrum, Par
 
 
 def print_info(Par):
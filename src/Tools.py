@@ -6,10 +6,151 @@ A collection of functions, used for EPR data processing
 Copyright, Stephan Rein, 2019
 """
 
+import functools
+import importlib.util
+import os
+import sys
+import threading
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import fftpack, special
-from scipy import signal
+
+# Plotting and scipy submodules are imported in the functions which need them
+# to keep the import of the package (e.g. in worker processes) fast.
+
+_jit_functions = []  # All functions decorated with lazy_jit()
+# Directory of the Numba cache (None: Numba default next to the sources)
+_cache_dir = os.environ.get("EPRSIM_CACHE_DIR")
+Multiplier_cache_size = 64  # Maximum number of cached spectral multipliers
+_multiplier_cache = {}  # Multipliers keyed by (kind, N, step, parameter)
+_multiplier_lock = threading.Lock()
+
+
+def numba_available():
+	"""
+	Checks if Numba is installed, without importing it.
+
+	"""
+	return importlib.util.find_spec("numba") is not None
+
+
+def set_cache_dir(path):
+	"""
+	Sets the directory of the Numba cache for all functions which are
+	compiled afterwards (see lazy_jit()). The default is the environment
+	variable EPRSIM_CACHE_DIR or, if not set, the Numba default. None
+	restores the Numba default.
+
+	"""
+	global _cache_dir
+	_cache_dir = None if path is None else str(path)
+	if _cache_dir is not None:
+		os.environ["NUMBA_CACHE_DIR"] = _cache_dir
+	else:
+		os.environ.pop("NUMBA_CACHE_DIR", None)
+	if "numba" in sys.modules:
+		sys.modules["numba"].config.CACHE_DIR = _cache_dir or ""
+	return
+
+
+def lazy_jit(signature=None, **options):
+	"""
+	Decorator for a Numba just-in-time compilation at the first call.
+
+	Parameters
+	----------
+	signature : :class:`string`, optional
+				Numba signature as a string (e.g. 'float64[:](float64[:])'),
+				so that Numba types are not needed at import.
+	options
+				Options of numba.jit (e.g. nopython=True, cache=True)
+
+	Notes
+	-----
+	Numba is imported and the function is compiled (or loaded from the
+	Numba cache) when the function is called for the first time. Without
+	Numba the original Python function is called.
+
+	"""
+
+	def decorator(func):
+		return Lazy_jit(func, signature, options)
+
+	return decorator
+
+
+class Lazy_jit:
+	"""
+	Function wrapper of lazy_jit(). The compiled function is created at the
+	first call.
+
+	"""
+
+	def __init__(self, func, signature, options):
+		functools.update_wrapper(self, func)
+		self.py_func = func
+		self.signature = signature
+		self.options = options
+		self._compiled = None
+		self.fallback = None
+		self.cache_dir = None  # Cache directory of the compilation
+		_jit_functions.append(self)
+
+	def compile(self):
+		"""
+		Compiles the function. Falls back to the Python function if Numba is
+		not available or the compilation fails (the reason is stored in
+		self.fallback). A cached function which was compiled for another
+		cache directory is compiled again, so that it is written to the
+		current one (see set_cache_dir()).
+
+		"""
+		if (
+			self._compiled is not None
+			and self._compiled is not self.py_func
+			and self.options.get("cache", False)
+			and self.cache_dir != _cache_dir
+		):
+			self._compiled = None
+		if self._compiled is None:
+			if not numba_available():
+				self.fallback = "Numba is not installed"
+				self._compiled = self.py_func
+				return self._compiled
+			if _cache_dir is not None:
+				set_cache_dir(_cache_dir)
+			from numba import jit
+
+			self.cache_dir = _cache_dir
+			try:
+				if self.signature is None:
+					self._compiled = jit(**self.options)(self.py_func)
+				else:
+					self._compiled = jit(self.signature, **self.options)(self.py_func)
+			except Exception as error:
+				self.fallback = str(error).split("\n")[0]
+				self._compiled = self.py_func
+				print("\nWARNING: Numba compilation of " + self.__name__
+					+ " failed. The Python function is used!")
+		return self._compiled
+
+	def status(self):
+		"""
+		Returns 'not compiled', 'python' (fallback), 'cached' (loaded from
+		the Numba cache) or 'compiled'.
+
+		"""
+		if self._compiled is None:
+			return "not compiled"
+		if self._compiled is self.py_func:
+			return "python"
+		stats = getattr(self._compiled, "stats", None)
+		if stats is not None and sum(stats.cache_hits.values()) > 0:
+			return "cached"
+		return "compiled"
+
+	def __call__(self, *args, **kwargs):
+		if self._compiled is None:
+			self.compile()
+		return self._compiled(*args, **kwargs)
 
 
 class physical_constants:
@@ -56,6 +197,14 @@ class physical_constants:
 		Hz to MHz conversion; 1e-6
 	MHz2Hz
 		MHz to Hz conversion; 1e6
+	mT2Hzperg
+		Resonance frequency per mT and unit g-value in Hz;
+		`beta` * 1e-3 / `h`
+	GHz2mTg
+		Resonance field times g-value per GHz in mT;
+		1e12 * `h` / `beta`
+	field_units
+		Factors from mT to the field units 'mT', 'T' and 'G'
 
 	"""
 
@@ -96,6 +245,12 @@ class physical_constants:
 		self.Hz2GHz_info = "Conversion Hz to GHz"
 		self.Hz2MHz = 1e-6
 		self.MHz2Hz = 1e6
+		self.mT2Hzperg = (self.beta * 1e-3) / self.h
+		self.mT2Hzperg_info = "Resonance frequency per mT and g-value in Hz"
+		self.GHz2mTg = (self.h * 1e12) / self.beta
+		self.GHz2mTg_info = "Resonance field times g-value per GHz in mT"
+		self.field_units = {"mT": 1.0, "T": self.mT2T, "G": 10.0}
+		self.field_units_info = "Conversion mT to mT, T and G"
 
 	def print_all_constants(self):
 		"""
@@ -137,6 +292,9 @@ class physical_constants:
 		mT2T:	 Constant mT to T
 		GHz2Hz:  Constant GHz to Hz
 		Hz2GHz:  Constant Hz to GHz
+		mT2Hzperg: Resonance frequency per mT and g-value in Hz
+		GHz2mTg: Resonance field times g-value per GHz in mT
+		field_units: Conversion mT to mT, T and G
 		Information about a specific variable can be obtained
 		by asking for a member variable with an appended _info (e.g. kb_info).
 		This variable is then a string, containing the information
@@ -160,6 +318,9 @@ class physical_constants:
 		print("mT2T:	Constant mT to T")
 		print("GHz2Hz:	Constant GHz to Hz")
 		print("Hz2GHz:	Constant Hz to GHz")
+		print("mT2Hzperg:	Resonance frequency per mT and g-value in Hz")
+		print("GHz2mTg:	Resonance field times g-value per GHz in mT")
+		print("field_units:	Conversion mT to mT, T and G")
 		print(
 			"\nInformation about a specific variable can be obtained  "
 			+ " by asking for a member variable with an appended _info "
@@ -170,20 +331,25 @@ class physical_constants:
 		return
 
 
+_constants = physical_constants()  # Constant table of the unit converters
+
+
 def pseudo_field_modulation(modamp, field, spectrum):
 	"""
 	Pseudo-field modulation of EPR signals
 
 	Parameters
 	----------
-	amp: float
-		Modulation amplitude in mT.
+	amp: float or numpy.ndarray
+		Modulation amplitude in mT. An array gives one amplitude per row of
+		spc.
 
 	field: numpy.ndarray
 		Magnetic field vector.
 
 	spc :numpy.ndarray
-		Signal vector of the EPR signal.
+		Signal vector of the EPR signal. For 2-D input (n_spectra, Points)
+		every row is modulated.
 
 	Returns
 	-------
@@ -229,17 +395,13 @@ def pseudo_field_modulation(modamp, field, spectrum):
 	>>> spc_mod = tool.pseudo_field_modulation(modAmp, field, spc)
 
 	"""
-	modamp = max(0.001, modamp)
-	# Set up x-axis in inverse field domain
-	fieldstep = field[1] - field[0]
-	fourier_x = fftpack.fftfreq(len(spectrum), fieldstep)
-	# Modulation amplitude in conjugated Fourier space
-	level = modamp * np.pi
-	datafft = fftpack.fft(spectrum)
-	bessel_fft = special.jv(1, fourier_x * level)
-	pseudomod = 1j * bessel_fft * datafft
+	modamp = np.maximum(0.001, modamp)
+	npoints = np.shape(spectrum)[-1]
+	# Bessel function in the inverse field domain (rFFT grid)
+	bessel_fft = multiplier_rows("bessel", npoints, field[1] - field[0], modamp)
+	pseudomod = bessel_fft * np.fft.rfft(spectrum, axis=-1)
 	# Inverse Fourier transform of the convoluted signal
-	spcm = np.real(fftpack.ifft(pseudomod))
+	spcm = np.fft.irfft(pseudomod, npoints, axis=-1)
 	return spcm
 
 
@@ -298,12 +460,9 @@ def GHz2mT(freq, giso=None):
 	>>> print(B0)
 	>>> [2982.16631174 3028.76266037]
 	"""
-	cons = physical_constants()
 	if giso is None:
-		giso = cons.g_free
-	if not isinstance(freq, float) or not isinstance(freq, int):
-		freq = np.asarray(freq)
-	field = (cons.h * freq * 1e12) / (giso * cons.beta)
+		giso = _constants.g_free
+	field = (_constants.GHz2mTg * np.asarray(freq, dtype=float)) / giso
 	return field
 
 
@@ -362,29 +521,140 @@ def mT2GHz(field, giso=None):
 	>>> print(B0)
 	>>> [31.38794575 32.29875667]
 	"""
-	cons = physical_constants()
 	if giso is None:
-		giso = cons.g_free
-	if not isinstance(field, float) or not isinstance(field, int):
-		field = np.asarray(field)
-	mwFreq = (giso * field * 1e-12 * cons.beta) / cons.h
+		giso = _constants.g_free
+	mwFreq = (giso * np.asarray(field, dtype=float)) / _constants.GHz2mTg
 	return mwFreq
 
 
+def mT2g(field, freq):
+	"""
+	Conversion from mT to g-values
+
+	Parameters
+	----------
+	field : :class:`numpy.ndarray` or :class:`float`
+		Magnetic field in mT.
+	freq : :class:`numpy.ndarray` or :class:`float`
+		Microwave frequency in GHz.
+
+	Returns
+	-------
+	g : :class:`numpy.ndarray` or :class:`float`
+		g-values at resonance, :math:`g = h \\omega / (\\beta B_0)`.
+
+	Notes
+	-----
+	The arrays are broadcast, e.g. a field array (n_spectra, Points) and
+	the frequencies freq[:, None] of the rows.
+
+	"""
+	return (_constants.GHz2mTg * np.asarray(freq, dtype=float)) / np.asarray(
+		field, dtype=float
+	)
+
+
+def g2mT(g, freq):
+	"""
+	Conversion from g-values to mT (resonance fields at the microwave
+	frequency freq in GHz). The arrays are broadcast (see mT2g()).
+
+	"""
+	return (_constants.GHz2mTg * np.asarray(freq, dtype=float)) / np.asarray(
+		g, dtype=float
+	)
+
+
+class FieldAxis:
+	"""
+	Magnetic field axis with representations in other units and scales,
+	which are computed on first access.
+
+	Parameters
+	----------
+	field : :class:`numpy.ndarray`
+		Magnetic field in mT (1-D or (n_spectra, Points)).
+	mwFreq : :class:`float` or :class:`numpy.ndarray`, optional
+		Microwave frequency in GHz (one per row for 2-D fields). Needed
+		for the g-scale.
+	giso : :class:`float`, optional
+		g-value of the frequency scale (default: free electron).
+
+	Attributes
+	----------
+	mT, T, G
+		Field in mT, T and Gauss.
+	g
+		g-values at resonance (see mT2g()).
+	GHz
+		Resonance frequencies of giso (see mT2GHz()).
+
+	Examples
+	--------
+	>>> B0, spc, flag = sim.simulate(Param)
+	>>> axis = tool.FieldAxis(B0, Param.mwFreq)
+	>>> tool.plot(axis.g, spc)
+
+	"""
+
+	def __init__(self, field, mwFreq=None, giso=None):
+		self.mT = np.asarray(field, dtype=float)
+		self.mwFreq = None if mwFreq is None else np.asarray(mwFreq, dtype=float)
+		self.giso = _constants.g_free if giso is None else giso
+
+	@classmethod
+	def from_g(cls, g, mwFreq, giso=None):
+		"""Field axis of a g-value axis at the microwave frequency mwFreq."""
+		axis = cls(g2mT(g, mwFreq), mwFreq, giso)
+		axis.__dict__["g"] = np.asarray(g, dtype=float)
+		return axis
+
+	def _frequency_rows(self):
+		if self.mwFreq is None:
+			raise ValueError("The g-scale needs a microwave frequency (mwFreq).")
+		if self.mwFreq.ndim == 1 and self.mT.ndim == 2:
+			return self.mwFreq[:, None]
+		return self.mwFreq
+
+	@functools.cached_property
+	def T(self):
+		return self.mT * _constants.field_units["T"]
+
+	@functools.cached_property
+	def G(self):
+		return self.mT * _constants.field_units["G"]
+
+	@functools.cached_property
+	def g(self):
+		return mT2g(self.mT, self._frequency_rows())
+
+	@functools.cached_property
+	def GHz(self):
+		return mT2GHz(self.mT, self.giso)
+
+	def __len__(self):
+		return np.shape(self.mT)[-1]
+
+	def __array__(self, dtype=None, copy=None):
+		return np.asarray(self.mT, dtype=dtype)
+
+
 def modulation_amplitude(modamp, field, spectrum):
 	"""
 	Modulation amplitude to simulate the effect of overmodulation
 
 	Parameters
 	----------
-	modamp :  :class:`float`
-			  Modulation amplitude in mT.
+	modamp :  :class:`float` or :class:`numpy.ndarray`
+			  Modulation amplitude in mT. An array gives one amplitude per
+			  row of spectrum.
 
 	field :   :class:`numpy.ndarray`
 			  Magnetic field vector in mT.
 
 	spectrum : :class:`numpy.ndarray`
-			   Intensity vector of the EPR signal.
+			   Intensity vector of the EPR signal. For 2-D input every row
+			   is processed separately.
 
 	Returns
 	-------
@@ -407,7 +677,8 @@ def modulation_amplitude(modamp, field, spectrum):
 
 	The function calculates a pseudo-field modulation of the signal
 	using the given modulation amplitude and subsequently reintegrates the
-	signal.
+	signal. The integral is the cumulative sum shifted by half a point
+	(evaluated in the Fourier domain), so that the signal is not shifted.
 
 
 	Examples
@@ -419,10 +690,19 @@ def modulation_amplitude(modamp, field, spectrum):
 	>>> ModAmp = 0.5
 	>>> spcm = tool.modulation_amplitude(ModAmp, field, spc)
 	"""
-	if modamp != 0:
-		spectrum = pseudo_field_modulation(modamp, field, spectrum)
-		spectrum = np.cumsum(spectrum)
-	return spectrum
+	modamp = np.asarray(modamp, dtype=float)
+	if np.all(modamp == 0):
+		return spectrum
+	npoints = np.shape(spectrum)[-1]
+	datafft = np.fft.rfft(pseudo_field_modulation(modamp, field, spectrum), axis=-1)
+	datafft *= cached_multiplier("integration", npoints, field[1] - field[0])
+	# Integral centred on the field points, which starts at the first point
+	modulated = np.fft.irfft(datafft, npoints, axis=-1)
+	modulated -= _irfft_last(datafft, npoints)
+	if modamp.ndim == 0:
+		return modulated
+	# Rows without modulation amplitude stay unchanged
+	return np.where((modamp != 0)[..., None], modulated, spectrum)
 
 
 def phase_offset(gamma, spc, unit="rad"):
@@ -432,10 +712,12 @@ def phase_offset(gamma, spc, unit="rad"):
 
 	Parameters
 	----------
-	gamma : :class:`float`
-			Phase angle for the microwave phase offset.
+	gamma : :class:`float` or :class:`numpy.ndarray`
+			Phase angle for the microwave phase offset. An array gives one
+			angle per row of spc.
 	spc :	:class:`numpy.ndarray`
-			Real-valued EPR signal vector.
+			Real-valued EPR signal vector. For 2-D input every row is
+			processed separately.
 	unit :	:class:`str`, optional
 			Defines the unit: 'degree' for degree, 'rad' for radian (default).
 
@@ -471,27 +753,290 @@ def phase_offset(gamma, spc, unit="rad"):
 	>>> gamma = 20.5
 	>>> spcp = tool.pseudo_field_modulation(gamma, spc, 'degree')
 	"""
+	from scipy import signal
+
+	gamma = np.asarray(gamma, dtype=float)
 	if unit == "degree":
 		gamma = (np.pi * gamma) / 180
-	spc_im = signal.hilbert(spc)
-	spc_im = np.exp(-1j * gamma) * spc_im
+	spc_im = signal.hilbert(spc, axis=-1)
+	spc_im = np.exp(-1j * gamma)[..., None] * spc_im
 	return np.real(spc_im)
 
 
+def spectral_multiplier(npoints, fieldstep, modamp=0, gamma=0, derivative=False):
+	"""
+	Product of the spectral multipliers of the post-processing steps on
+	the rFFT grid of a spectrum
+
+	Parameters
+	----------
+	npoints :   :class:`int`
+				Number of points of the spectrum.
+	fieldstep : :class:`float`
+				Step of the magnetic field vector in mT.
+	modamp :    :class:`float`, optional
+				Modulation amplitude in mT (see modulation_amplitude()).
+	gamma :     :class:`float`, optional
+				Phase offset in rad (see phase_offset()).
+	derivative : :class:`bool`, optional
+				 First derivative by pseudo-field modulation with 0.001 mT.
+
+	Returns
+	-------
+	multiplier : :class:`numpy.ndarray`
+				 Complex multiplier of length npoints // 2 + 1.
+
+	Notes
+	-----
+	The factors are the Bessel functions of the pseudo-field modulations,
+	the centred integral of modulation_amplitude()
+	(:math:`1/(2\\mathrm{i}\\sin(\\pi k/N))`, the cumulative sum
+	:math:`1/(1-\\mathrm{e}^{-2\\pi\\mathrm{i}k/N})` shifted by half a
+	point, zero for :math:`k = 0`) and the rotation of the analytic signal of
+	phase_offset(). Each factor only keeps the real part at the Nyquist
+	frequency, as the real-valued intermediate spectra of the sequential
+	functions do. The integration constant of the cumulative sum is not
+	contained (see fused_postprocessing()).
+
+	"""
+	multiplier = np.ones(npoints // 2 + 1, dtype=complex)
+	if derivative:
+		multiplier *= cached_multiplier("bessel", npoints, fieldstep, 0.001)
+	if modamp != 0:
+		multiplier *= cached_multiplier("bessel", npoints, fieldstep, max(0.001, modamp))
+		multiplier *= cached_multiplier("integration", npoints, fieldstep)
+	if gamma != 0:
+		multiplier *= cached_multiplier("rotation", npoints, fieldstep, gamma)
+	return multiplier
+
+
+def cached_multiplier(kind, npoints, fieldstep, parameter=0.0):
+	"""
+	Spectral multiplier or convolution window from a bounded cache, which
+	is shared by all convolution and modulation functions
+
+	Parameters
+	----------
+	kind :      :class:`str`
+				'bessel' (pseudo-field modulation, parameter: modulation
+				amplitude in mT), 'integration' (cumulative sum), 'rotation'
+				(phase offset, parameter: angle in rad), 'gaussian' and
+				'lorentzian' (convolution windows centred at the point N // 2,
+				parameter: FWHM in mT), 'gaussian_rfft' and 'lorentzian_rfft'
+				(their circular convolution multipliers), 'pink' (shaping
+				of white to 1/f noise).
+	npoints :   :class:`int`
+				Number of points of the spectrum.
+	fieldstep : :class:`float`
+				Step of the magnetic field vector in mT.
+	parameter : :class:`float`
+				Parameter of the multiplier.
+
+	Returns
+	-------
+	multiplier : :class:`numpy.ndarray`
+				 Read-only array. The multipliers are defined on the rFFT grid
+				 (N // 2 + 1 points), the windows on the field grid.
+
+	Notes
+	-----
+	The cache keeps the Multiplier_cache_size most recently used entries,
+	keyed by (kind, N, step, parameter). The multipliers on the rFFT grid
+	only keep the real part at the Nyquist frequency, as the real-valued
+	intermediate spectra of the sequential functions do.
+
+	"""
+	key = (kind, int(npoints), float(fieldstep), float(parameter))
+	with _multiplier_lock:
+		if key in _multiplier_cache:
+			# Reinsert to mark the entry as most recently used
+			multiplier = _multiplier_cache.pop(key)
+			_multiplier_cache[key] = multiplier
+			return multiplier
+	multiplier = _Multiplier_builders[kind](*key[1:])
+	multiplier.setflags(write=False)
+	with _multiplier_lock:
+		_multiplier_cache[key] = multiplier
+		while len(_multiplier_cache) > Multiplier_cache_size:
+			_multiplier_cache.pop(next(iter(_multiplier_cache)))
+	return multiplier
+
+
+def multiplier_rows(kind, npoints, fieldstep, parameter):
+	"""
+	Cached multiplier (see cached_multiplier()) for a scalar parameter or
+	one multiplier per parameter for an array (stacked along the first
+	axes), which broadcasts against 2-D spectra.
+
+	"""
+	parameter = np.asarray(parameter, dtype=float)
+	if parameter.ndim == 0:
+		return cached_multiplier(kind, npoints, fieldstep, parameter)
+	rows = [cached_multiplier(kind, npoints, fieldstep, p) for p in parameter.ravel()]
+	return np.reshape(rows, parameter.shape + (-1,))
+
+
+def _bessel_multiplier(npoints, fieldstep, modamp):
+	from scipy import special
+
+	fourier_x = np.fft.rfftfreq(npoints, fieldstep)
+	multiplier = 1j * special.jv(1, fourier_x * modamp * np.pi)
+	if npoints % 2 == 0:
+		multiplier[-1] = 0
+	return multiplier
+
+
+def _integration_multiplier(npoints, fieldstep, parameter):
+	k = np.arange(1, npoints // 2 + 1)
+	multiplier = np.zeros(npoints // 2 + 1, dtype=complex)
+	# Cumulative sum shifted by half a point: centred on the field points
+	multiplier[1:] = 1 / (2j * np.sin(np.pi * k / npoints))
+	if npoints % 2 == 0:
+		multiplier[-1] = np.real(multiplier[-1])
+	return multiplier
+
+
+def _rotation_multiplier(npoints, fieldstep, gamma):
+	multiplier = np.full(npoints // 2 + 1, np.exp(-1j * gamma))
+	multiplier[0] = np.cos(gamma)
+	if npoints % 2 == 0:
+		multiplier[-1] = np.cos(gamma)
+	return multiplier
+
+
+def _gaussian_window(npoints, fieldstep, width):
+	std = width / (2 * np.sqrt(2 * np.log(2)))
+	res = (np.arange(0, npoints) - npoints // 2) * fieldstep
+	return np.exp(-0.5 * res ** 2 / (std ** 2))
+
+
+def _lorentzian_window(npoints, fieldstep, width):
+	res = (np.arange(0, npoints) - npoints // 2) * fieldstep
+	return ((0.5 * width) / np.pi) / (res ** 2 + (0.5 * width) ** 2)
+
+
+def _pink_multiplier(npoints):
+	# f^(-1/2) on the rFFT grid without the mean, scaled to unit variance
+	multiplier = np.zeros(npoints // 2 + 1)
+	multiplier[1:] = 1 / np.sqrt(np.arange(1, npoints // 2 + 1))
+	power = 2 * np.sum(multiplier ** 2)
+	if npoints % 2 == 0:
+		power -= multiplier[-1] ** 2
+	return multiplier * np.sqrt(npoints / power)
+
+
+def _window_rfft(window):
+	# Circular convolution kernel: the centre of the window moves to index 0
+	return np.fft.rfft(np.fft.ifftshift(window))
+
+
+_Multiplier_builders = {
+	"bessel": _bessel_multiplier,
+	"integration": _integration_multiplier,
+	"rotation": _rotation_multiplier,
+	"gaussian": _gaussian_window,
+	"lorentzian": _lorentzian_window,
+	"pink": lambda n, step, parameter: _pink_multiplier(n),
+	"gaussian_rfft": lambda n, step, w: _window_rfft(_gaussian_window(n, step, w)),
+	"lorentzian_rfft": lambda n, step, w: _window_rfft(_lorentzian_window(n, step, w)),
+}
+
+
+def fused_postprocessing(field, spectrum, Harmonic=1, derivative=False,
+		modamp=0, gamma=0, weight=1.0):
+	"""
+	Derivative, normalization, modulation amplitude and phase offset of
+	EPR spectra with one forward real FFT
+
+	Parameters
+	----------
+	field :    :class:`numpy.ndarray`
+			   Magnetic field vector in mT.
+	spectrum : :class:`numpy.ndarray`
+			   Intensity vector of the EPR signal. For 2-D input every row
+			   is processed separately.
+	Harmonic : :class:`int`
+			   0: absorptive EPR signal, 1: first derivative (default)
+	derivative : :class:`bool`
+			   True if spectrum is absorptive and the first derivative has
+			   to be taken (pseudo-field modulation with 0.001 mT).
+	modamp :   :class:`float`
+			   Modulation amplitude in mT.
+	gamma :    :class:`float`
+			   Phase offset in rad.
+	weight :   :class:`float`
+			   Weighting factor of the normalized spectrum.
+
+	Returns
+	-------
+	spectrum : :class:`numpy.ndarray`
+			   Processed intensity vector(s).
+
+	Notes
+	-----
+	Gives the same result as the sequence pseudo_field_modulation(),
+	normalize2area(), modulation_amplitude() and phase_offset(), but the
+	steps are applied as one product of spectral multipliers (see
+	spectral_multiplier()). The derivative needs a second inverse
+	transform, because the normalization refers to the derivative
+	spectrum.
+
+	"""
+	spectrum = np.asarray(spectrum, dtype=float)
+	if not (derivative or modamp != 0 or gamma != 0):
+		return weight * normalize2area(spectrum, Harmonic)
+	npoints = spectrum.shape[-1]
+	fieldstep = field[1] - field[0]
+	datafft = np.fft.rfft(spectrum, axis=-1)
+	if derivative:
+		datafft *= spectral_multiplier(npoints, fieldstep, derivative=True)
+		spectrum = np.fft.irfft(datafft, npoints, axis=-1)
+	integral = np.cumsum(spectrum, axis=-1) if Harmonic == 1 else spectrum
+	norm = np.sum(np.absolute(integral), axis=-1, keepdims=True)
+	if modamp != 0 or gamma != 0:
+		modulated = datafft * spectral_multiplier(npoints, fieldstep, modamp)
+		rotation = spectral_multiplier(npoints, fieldstep, gamma=gamma)
+		spectrum = np.fft.irfft(modulated * rotation, npoints, axis=-1)
+		if modamp != 0:
+			# Integration constant: the cumulative sum starts at the first point
+			spectrum -= np.cos(gamma) * _irfft_last(modulated, npoints)
+	return weight * spectrum / norm
+
+
+def _irfft_last(datafft, npoints):
+	"""
+	Band-limited inverse real FFT (along the last axis) half a point
+	behind the last point, i.e. the end of the cumulative sum for the
+	centred integral (see _integration_multiplier()).
+
+	"""
+	k = np.arange(0, datafft.shape[-1])
+	factor = np.full(len(k), 2.0)
+	factor[0] = 1
+	if npoints % 2 == 0:
+		factor[-1] = 1
+	phase = np.exp(-1j * np.pi * k / npoints)
+	return np.sum(
+		factor * np.real(datafft * phase), axis=-1, keepdims=True
+	) / npoints
+
+
 def convolution_L(width, field, spectrum):
 	"""
 	Convolution of a signal with a Lorentzian function
 
 	Parameters
 	----------
-	width :   :class:`float`
-			  Line-width in mT, given as full width at half maximum (FWHM)
+	width :   :class:`float` or :class:`numpy.ndarray`
+			  Line-width in mT, given as full width at half maximum (FWHM).
+			  An array gives one line-width per row of spectrum.
 
 	field :   :class:`numpy.ndarray`
 			  Magnetic field vector in mT.
 
 	spectrum : :class:`numpy.ndarray`
-			   Intensity vector of the EPR signal.
+			   Intensity vector of the EPR signal. For 2-D input every row
+			   is convoluted.
 
 	Returns
 	-------
@@ -515,14 +1060,9 @@ def convolution_L(width, field, spectrum):
 	>>> spcc = tool.convolution_L(FWHM, field, spc)
 	"""
 
-	npoints = len(spectrum)
-	mid = npoints // 2
-	Bcenter = field[mid]
-	std = width
-	res = field - Bcenter
-	L = ((0.5 * std) / np.pi) / (res ** 2 + (0.5 * std) ** 2)
-	spectrum_conv = np.convolve(spectrum, L, mode="same")
-	spectrum = spectrum_conv
+	npoints = np.shape(spectrum)[-1]
+	L = multiplier_rows("lorentzian", npoints, field[1] - field[0], width)
+	spectrum_conv = _convolve_rows(spectrum, L)
 	return spectrum_conv
 
 
@@ -532,14 +1072,16 @@ def convolution_G(width, field, spectrum):
 
 	Parameters
 	----------
-	width :   :class:`float`
-			  Line-width in mT, given as full width at half maximum (FWHM)
+	width :   :class:`float` or :class:`numpy.ndarray`
+			  Line-width in mT, given as full width at half maximum (FWHM).
+			  An array gives one line-width per row of spectrum.
 
 	field :   :class:`numpy.ndarray`
 			  Magnetic field vector in mT.
 
 	spectrum : :class:`numpy.ndarray`
-			   Intensity vector of the EPR signal.
+			   Intensity vector of the EPR signal. For 2-D input every row
+			   is convoluted.
 
 	Returns
 	-------
@@ -563,15 +1105,22 @@ def convolution_G(width, field, spectrum):
 	>>> FWHM = 0.2
 	>>> spcc = tool.convolution_G(FWHM, field, spc)
 	"""
-	npoints = len(spectrum)
-	mid = npoints // 2
-	std = width / (2 * np.sqrt(2 * np.log(2)))
-	G = np.exp(-0.5 * (field - field[mid]) ** 2 / (std ** 2))
-	spectrum_conv = np.convolve(spectrum, G, mode="same")
-	spectrum = spectrum_conv
+	npoints = np.shape(spectrum)[-1]
+	G = multiplier_rows("gaussian", npoints, field[1] - field[0], width)
+	spectrum_conv = _convolve_rows(spectrum, G)
 	return spectrum_conv
 
 
+def _convolve_rows(spectrum, window):
+	"""Convolution along the last axis (mode 'same'), broadcasting the rows."""
+	from scipy import signal
+
+	ndim = max(np.ndim(spectrum), np.ndim(window))
+	spectrum = np.reshape(spectrum, (1,) * (ndim - np.ndim(spectrum)) + np.shape(spectrum))
+	window = np.reshape(window, (1,) * (ndim - np.ndim(window)) + np.shape(window))
+	return signal.fftconvolve(spectrum, window, mode="same", axes=-1)
+
+
 def normalize2area(spectrum, Harmonic=1):
 	"""
 	Normalization of EPR spectra to their area
@@ -579,7 +1128,8 @@ def normalize2area(spectrum, Harmonic=1):
 	Parameters
 	----------
 	spectrum : :class:`numpy.ndarray`
-			   Intensity vector of the EPR signal.
+			   Intensity vector of the EPR signal. For 2-D input every row
+			   is normalized separately.
 
 	Harmonic : :class:`int`
 			   0: absorptive EPR signal, 1: first derivative (default)
@@ -609,12 +1159,51 @@ def normalize2area(spectrum, Harmonic=1):
 
 	if Harmonic == 1:
 		pass
-		spectrum = spectrum / np.sum(np.absolute(np.cumsum(spectrum)))
+		spectrum = spectrum / np.sum(
+			np.absolute(np.cumsum(spectrum, axis=-1)), axis=-1, keepdims=True
+		)
 	else:
-		spectrum = spectrum / np.sum(np.absolute(spectrum))
+		spectrum = spectrum / np.sum(np.absolute(spectrum), axis=-1, keepdims=True)
 	return spectrum
 
 
+def normalize2area_jacobian(spectrum, jacobian, Harmonic=1):
+	"""
+	Normalization of an EPR spectrum to its area together with the
+	corresponding transformation of its parameter derivatives
+
+	Parameters
+	----------
+	spectrum : :class:`numpy.ndarray`
+			   Intensity vector of the EPR signal.
+
+	jacobian : :class:`numpy.ndarray`
+			   Derivatives of the spectrum with respect to the parameters,
+			   one column per parameter.
+
+	Harmonic : :class:`int`
+			   0: absorptive EPR signal, 1: first derivative (default)
+
+	Returns
+	-------
+	spectrumn : :class:`numpy.ndarray`
+				Intensity vector normalized to the area (see normalize2area())
+	jacobiann : :class:`numpy.ndarray`
+				Derivatives of the normalized spectrum
+
+	"""
+	if Harmonic == 1:
+		integral = np.cumsum(spectrum)
+		dintegral = np.cumsum(jacobian, axis=0)
+	else:
+		integral = spectrum
+		dintegral = jacobian
+	norm = np.sum(np.absolute(integral))
+	dnorm = np.sign(integral) @ dintegral
+	jacobian = jacobian / norm - np.outer(spectrum, dnorm) / norm ** 2
+	return spectrum / norm, jacobian
+
+
 def generalized_Pascal(n, I):
 	"""
 	Generates the values of a row of a generalized Pascal triangle
@@ -643,7 +1232,10 @@ def generalized_Pascal(n, I):
 	the intesity pattern of n equivalent coupling spins with
 	spin quantum number I.
 
-	Note that the rows start with n = 1 (no coupling).
+	The row is the n-th power of the polynomial with 2I+1 unit
+	coefficients. It is calculated by repeated squaring (exact integer
+	convolutions as long as the coefficients fit into int64) and is
+	memoized on (n, 2I). The returned array is read-only.
 
 
 	Examples
@@ -678,25 +1270,33 @@ def generalized_Pascal(n, I):
 	>>> print(P)
 	[ 1.  4. 10. 20. 31. 40. 44. 40. 31. 20. 10.  4.  1.]
 	"""
-	if n == 0:
-		return [1.0]
-
-	s0 = int(2 * I * n + 1)
-	A = np.zeros((n, s0))
-	A[0, 0 : int(2 * I + 1)] = 1
-	I2 = 2 * I
-	for i in range(1, n):
-		for j in range(0, s0):
-			if j + I2 >= s0:
-				ub = int(s0 - 1)
-			else:
-				ub = int(j + I2)
-			if j - I2 < 0:
-				lb = 0
-			else:
-				lb = int(j - I2)
-			A[i, j] = np.sum(A[i - 1, lb : ub - int(2 * I) + 1])
-	return A[n - 1, :]
+	return _Pascal_row(int(n), int(round(2 * I)))
+
+
+@functools.lru_cache(maxsize=128)
+def _Pascal_row(n, I2):
+	# n-th power of the polynomial 1 + x + ... + x^(2I) by repeated squaring.
+	# Exact in integers as long as the sum of the row, (2I+1)^n, fits.
+	dtype = np.int64 if (I2 + 1) ** n < 2 ** 62 else float
+	base = np.ones(I2 + 1, dtype=dtype)
+	row = np.ones(1, dtype=dtype)
+	while n > 0:
+		if n & 1:
+			row = _polynomial_product(row, base)
+		n >>= 1
+		if n > 0:
+			base = _polynomial_product(base, base)
+	row = row.astype(float)
+	row.setflags(write=False)
+	return row
+
+
+def _polynomial_product(a, b):
+	if a.dtype == float and min(len(a), len(b)) > 64:
+		from scipy import signal
+
+		return signal.fftconvolve(a, b)
+	return np.convolve(a, b)
 
 
 def gyro2gn(gyro):
@@ -744,22 +1344,32 @@ def gyro2gn(gyro):
 	return gn
 
 
-def add_noise(spc, SNR):
+def add_noise(spc, SNR, rng=None, color="white"):
 	"""
 	Adds Gaussian noise to a signal
 
 	Parameters
 	----------
 	spc : :class:`numpy.ndarray`
-		  Intensity vector of the EPR signal.
+		  Intensity vector of the EPR signal. For 2-D input the noise of
+		  every row refers to the maximum of the row.
+
+	SNR : :class:`float` or :class:`numpy.ndarray`
+		  Signal-to-noise ratio with respect to the intensity. An array
+		  gives one ratio per row of spc.
+
+	rng : :class:`numpy.random.Generator`, :class:`int` or None
+		  Random number generator or seed (see random_generator()). None
+		  uses the global state of numpy.random.
 
-	SNR : :class:`float`
-		  Signal-to-noise ratio with respect to the intensity.
+	color : :class:`str`
+		  'white' or 'pink' (1/f) noise (see noise_realizations()).
 
 	Returns
 	-------
 	spc :  :class:`numpy.ndarray`
-		   Intensity vector of the EPR signal with addition of noise.
+		   Intensity vector of the EPR signal with addition of noise (a new
+		   array, the input is not modified).
 
 
 	Notes
@@ -830,11 +1440,109 @@ def add_noise(spc, SNR):
 			:width: 60 %
 			:align: center
 	"""
-	maxSNR = np.max(np.abs(spc))
-	lenghtspc = len(spc)
-	noisvec = np.random.normal(0, maxSNR / SNR, lenghtspc)
-	spc += noisvec
-	return spc
+	maxSNR = np.max(np.abs(spc), axis=-1)
+	sigma = maxSNR / np.asarray(SNR, dtype=float)
+	noisvec = noise_realizations(np.shape(spc), rng, color) * sigma[..., None]
+	return spc + noisvec
+
+
+def noise_replicates(spc, SNR, n_replicates, rng=None, color="white"):
+	"""
+	Noisy replicates of one noise-free signal (e.g. for bootstrap or
+	Monte-Carlo error estimates of fits)
+
+	Parameters
+	----------
+	spc : :class:`numpy.ndarray`
+		  Noise-free intensity vector of the EPR signal (Points,). It is not
+		  modified.
+
+	SNR : :class:`float` or :class:`numpy.ndarray`
+		  Signal-to-noise ratio with respect to the maximum intensity of spc
+		  (see add_noise()). An array gives one ratio per replicate.
+
+	n_replicates : :class:`int`
+		  Number of noise realizations.
+
+	rng : :class:`numpy.random.Generator`, :class:`int` or None
+		  Random number generator or seed (see random_generator()).
+
+	color : :class:`str`
+		  'white' or 'pink' (1/f) noise (see noise_realizations()).
+
+	Returns
+	-------
+	replicates :  :class:`numpy.ndarray`
+		   Array (n_replicates, Points) of noisy signals.
+
+	Notes
+	-----
+	The noise is drawn in one call and the signal is added to it by
+	broadcasting, so the only allocated array is the returned one. The
+	same generator state gives the same replicates.
+
+	Examples
+	--------
+	>>> B0, spc, flag = sim.simulate(Param)
+	>>> replicates = tool.noise_replicates(spc, 30, 1000, rng=42)
+
+	"""
+	spc = np.asarray(spc, dtype=float)
+	sigma = np.max(np.abs(spc)) / np.asarray(SNR, dtype=float)
+	replicates = noise_realizations((int(n_replicates), spc.shape[-1]), rng, color)
+	replicates *= np.reshape(sigma, (-1, 1))
+	replicates += spc
+	return replicates
+
+
+def noise_realizations(shape, rng=None, color="white"):
+	"""
+	Noise with zero mean and unit standard deviation along the last axis
+
+	Parameters
+	----------
+	shape : :class:`tuple`
+		  Shape of the noise array. The spectral shaping of colored noise
+		  acts along the last axis.
+
+	rng : :class:`numpy.random.Generator`, :class:`int` or None
+		  Random number generator or seed (see random_generator()).
+
+	color : :class:`str`
+		  'white' (Gaussian white noise) or 'pink' (Gaussian 1/f noise, also
+		  '1/f').
+
+	Returns
+	-------
+	noise :  :class:`numpy.ndarray`
+
+	Notes
+	-----
+	The 1/f noise is white noise multiplied on the rFFT grid with
+	:math:`f^{-1/2}`, which gives the power spectral density
+	:math:`S(f) \\propto 1/f` (see cached_multiplier()). The mean (f = 0)
+	is removed and the amplitudes are scaled to unit variance.
+
+	"""
+	noise = random_generator(rng).standard_normal(shape)
+	if color == "white":
+		return noise
+	if color not in ("pink", "1/f"):
+		raise ValueError("Unknown noise color %s (white, pink or 1/f)." % color)
+	npoints = np.shape(noise)[-1]
+	multiplier = cached_multiplier("pink", npoints, 1.0)
+	return np.fft.irfft(np.fft.rfft(noise, axis=-1) * multiplier, npoints, axis=-1)
+
+
+def random_generator(rng=None):
+	"""
+	A :class:`numpy.random.Generator` for a seed or Generator. For None,
+	the global state of numpy.random is used (np.random.seed()).
+
+	"""
+	if rng is None:
+		return np.random
+	return np.random.default_rng(rng)
 
 
 def Eulermatrix(phi, theta, psi=0):
@@ -857,25 +1565,46 @@ def Eulermatrix(phi, theta, psi=0):
 	psi is optional. The Euler matrix is returned.
 
 	"""
-	# Allocations
+	return Eulermatrices(phi, theta, psi)
+
+
+def Eulermatrices(phi, theta, psi=0):
+	"""
+	Stack of Euler matrices (y-convention) for arrays of angles.
+
+	Parameters
+	----------
+	phi, theta, psi
+		Euler angles in rad (scalars or arrays, which are broadcast)
+
+	Returns
+	-------
+	eulermatrices
+		Array of shape (..., 3, 3) with the broadcast shape of the angles.
+
+	"""
+	phi, theta, psi = np.broadcast_arrays(
+		np.asarray(phi, dtype=float), np.asarray(theta, dtype=float),
+		np.asarray(psi, dtype=float)
+	)
 	cosphi = np.cos(phi)
 	sinphi = np.sin(phi)
 	costhet = np.cos(theta)
 	sinthet = np.sin(theta)
 	cospsi = np.cos(psi)
 	sinpsi = np.sin(psi)
-	eulermatrix = np.zeros((3, 3))
-	# Set up the full 3-dimensional Euler matrix
-	eulermatrix[0][0] = cosphi * costhet * cospsi - sinphi * sinpsi
-	eulermatrix[0][1] = -cosphi * costhet * sinpsi - sinphi * cospsi
-	eulermatrix[0][2] = cosphi * sinthet
-	eulermatrix[1][0] = sinphi * costhet * cospsi + cosphi * sinpsi
-	eulermatrix[1][1] = -sinphi * costhet * sinpsi + cosphi * cospsi
-	eulermatrix[1][2] = sinphi * sinthet
-	eulermatrix[2][0] = -sinthet * cospsi
-	eulermatrix[2][1] = sinthet * sinpsi
-	eulermatrix[2][2] = costhet
-	return eulermatrix
+	# Set up the full 3-dimensional Euler matrices
+	eulermatrices = np.empty(phi.shape + (3, 3))
+	eulermatrices[..., 0, 0] = cosphi * costhet * cospsi - sinphi * sinpsi
+	eulermatrices[..., 0, 1] = -cosphi * costhet * sinpsi - sinphi * cospsi
+	eulermatrices[..., 0, 2] = cosphi * sinthet
+	eulermatrices[..., 1, 0] = sinphi * costhet * cospsi + cosphi * sinpsi
+	eulermatrices[..., 1, 1] = -sinphi * costhet * sinpsi + cosphi * cospsi
+	eulermatrices[..., 1, 2] = sinphi * sinthet
+	eulermatrices[..., 2, 0] = -sinthet * cospsi
+	eulermatrices[..., 2, 1] = sinthet * sinpsi
+	eulermatrices[..., 2, 2] = costhet
+	return eulermatrices
 
 
 def tensor_rotation(tensor, eulermatrix):
@@ -898,6 +1627,16 @@ def tensor_rotation(tensor, eulermatrix):
 	return rotatedTensor
 
 
+def tensor_rotations(tensor, eulermatrices):
+	"""
+	Similarity transformation T' = O^T T O of a tensor (3, 3) or a stack
+	of tensors (..., 3, 3) with a stack of Euler matrices (..., 3, 3), see
+	Eulermatrices(). The leading axes are broadcast.
+
+	"""
+	return np.einsum("...ji,...jk,...kl->...il", eulermatrices, tensor, eulermatrices)
+
+
 # ************************************************************************
 # Plot Results
 # ************************************************************************
@@ -961,6 +1700,8 @@ def plot(field, spectrum, font=11, fignum=1):
 	"""
 
 	try:
+		import matplotlib.pyplot as plt
+
 		spectrum = spectrum / max(abs(spectrum))
 		fig = plt.figure(fignum)
 		ax = fig.add_subplot(111)
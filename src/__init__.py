@@ -1 +1,12 @@
 __version__= "0.1.2"
+
+
+def precompile(cache_dir=None, verbose=True):
+	"""
+	Compiles all Numba kernels into the Numba cache (see
+	eprsim.Precompile.precompile()).
+
+	"""
+	from .Precompile import precompile as _precompile
+
+	return _precompile(cache_dir, verbose)
@@ -7,20 +7,18 @@ Created on Thu Oct 26 14:41:32 2017
 
 
 import numpy as np
-from scipy import interpolate
-import scipy.sparse as sparse
 from . import Hamiltonian_Eig
+from . import Planner
+from . import Profiler as prof
 
 define_nKnots_pattern = Hamiltonian_Eig.define_nKnots_pattern
+FD_diagonalization = Hamiltonian_Eig.FD_diagonalization
+orientation_eigvec = Hamiltonian_Eig.orientation_eigvec
 
-try:
-	from numba import int64, float64, int32, jit, types
-
-	Numba = 1
-except ImportError:
-	Numba = 0
 from . import Tools as tool
 
+Numba = 1 if tool.numba_available() else 0
+
 # *****************************************************************************
 # Physical constants and unit conversion factors + global default settings
 # *****************************************************************************
@@ -63,6 +61,8 @@ def stick_spectrum_calculation(Par):
 	The resonance fields for all kept transitions and all orientations are
 	saved in the member variable Par.res, while the corresponding intensities
 	are saved in the member variable Par.intensity.
+	If Par.chunked is True (see Planner.use_chunks()), the eigenvectors
+	are calculated in chunks of theta angles (chunked_resonances()).
 	"""
 	#  Define knots pattern
 	Knots_theta_vec = define_nKnots_pattern(Par)
@@ -70,6 +70,15 @@ def stick_spectrum_calculation(Par):
 	S_sp_x_y = preparations(Par)
 	# Check if its spin-polarized. Transfer it to local bool to spare time
 	popu, ispopu, rho_0 = check_spin_polarization(Par)
+	if Par.chunked:
+		args = (Par, S_sp_x_y, Knots_theta_vec, ispopu, rho_0, popu)
+		res, intensity, Warning_counter = chunked_resonances(*args)
+		args = (Par, intensity, Warning_counter, res, Knots_theta_vec)
+		with prof.stage("postprocess_resonances"):
+			postprocess_resonances(*args)
+		if int(np.sum(Warning_counter)) > Par.Transdim:
+			Par.field_warning = True
+		return Par.intensity, Par.res, Par
 	# Thow all fully off Par.field range transitions
 	arg = (
 		Par.nKnots,
@@ -80,15 +89,20 @@ def stick_spectrum_calculation(Par):
 		Par.eigval,
 		Par.n_explicit,
 	)
-	Delta_t, signum = preselect_off_res(*arg)
-	Par.trans_dim = len(Delta_t)
-	if Par.trans_dim > 30 and Par.Point_Group != "Dhinfty":
-		args = (Par, Delta_t, signum, S_sp_x_y, Knots_theta_vec)
-		Delta_t, signum, Par.trans_dim = preselect_to_probability(*args)
+	with prof.stage("preselection"):
+		Delta_t, signum = preselect_off_res(*arg)
+		Par.trans_dim = len(Delta_t)
+		if Par.trans_dim > 30 and Par.Point_Group != "Dhinfty":
+			args = (Par, Delta_t, signum, S_sp_x_y, Knots_theta_vec)
+			Delta_t, signum, Par.trans_dim = preselect_to_probability(*args)
+	prof.record_array("preselection", Delta_t)
 	arg = (Par, S_sp_x_y, Knots_theta_vec, Delta_t, ispopu, signum, rho_0, popu)
-	res, intensity, Warning_counter = resonance_loop(*arg)
+	with prof.stage("resonance_loop"):
+		res, intensity, Warning_counter = resonance_loop(*arg)
+	prof.record_array("resonance_loop", res, intensity)
 	args = (Par, intensity, Warning_counter, res, Knots_theta_vec)
-	postprocess_resonances(*args)
+	with prof.stage("postprocess_resonances"):
+		postprocess_resonances(*args)
 	if int(np.sum(Warning_counter)) > Par.Transdim:
 		Par.field_warning = True
 	return Par.intensity, Par.res, Par
@@ -101,8 +115,10 @@ def preparations(Par):
 	the dimension of the Pauli matrices is larger than 96 or spin polarization
 	is present
 	"""
+	from scipy import sparse
+
 	# Initialization of dimension
-	Par.trans_dim = int((len(Par.eigvec) - 1) * len(Par.eigvec) // 2)
+	Par.trans_dim = int((len(Par.eigval) - 1) * len(Par.eigval) // 2)
 	Par.all_trans_dim = Par.trans_dim
 	Par.Hilbert_dim = len(Par.Pauli[0, 0, :])
 	# Ceate sparse matrices for transition probablities
@@ -116,63 +132,248 @@ def preparations(Par):
 	return S_sp_x_y
 
 
+def chunked_resonances(Par, S_sp_x_y, Knots_theta_vec, ispopu, rho_0, popu):
+	"""
+	Resonance fields and intensities with the eigenvectors calculated in
+	chunks of theta angles (Planner.theta_rows()), so that the eigenvectors
+	and resonance differences of all orientations are never stored at the
+	same time. The transitions are selected from the eigenvalues of all
+	orientations as in stick_spectrum_calculation(), so the results are
+	the same.
+	"""
+	with prof.stage("preselection"):
+		signum = crossing_transitions(Par.eigval, Par.mwFreq)
+		Par.trans_dim = len(signum)
+		if Par.trans_dim > 30 and Par.Point_Group != "Dhinfty":
+
+			def eigvec_at(k, q, m):
+				return orientation_eigvec(Par, Knots_theta_vec, k, q, m)
+
+			Par.field_length = Par.n_explicit - 1
+			keep = probability_selection(Par, signum, S_sp_x_y, eigvec_at)
+			signum = signum[keep]
+			Par.trans_dim = len(signum)
+	rows = Planner.theta_rows(Par, Par.trans_dim)
+	prof.count("orientation chunks", -(-Par.nKnots // rows))
+	dimension = len(Par.eigval)
+	res = np.zeros((Par.trans_dim, Par.nKnots, Par.phinKnots), order="C")
+	intensity = np.zeros((Par.trans_dim, Par.nKnots, Par.phinKnots), order="C")
+	Warning_counter = np.zeros((Par.trans_dim, 2))
+	for k0 in range(0, Par.nKnots, rows):
+		k1 = min(k0 + rows, Par.nKnots)
+		with prof.stage("chunk_diagonalization"):
+			eigvec, eigval = FD_diagonalization(
+				k1 - k0,
+				Knots_theta_vec[k0:k1],
+				Par.phinKnots,
+				Par.Ham_ZFS[0, k0:k1],
+				Par.field,
+				dimension,
+				Par.Ham_FD[0, k0:k1],
+				ispopu,
+			)
+		Delta_t = transition_differences(eigval, signum, Par.mwFreq)
+		prof.record_array("chunk_diagonalization", eigvec, Delta_t)
+		arg = (Par, S_sp_x_y, Knots_theta_vec, Delta_t, ispopu, signum, rho_0, popu)
+		with prof.stage("resonance_loop"):
+			resonance_loop(
+				*arg, chunk=(k0, eigvec, eigval), out=(res, intensity, Warning_counter)
+			)
+		del eigvec, eigval, Delta_t
+	return res, intensity, Warning_counter
+
+
+def frequency_stick_spectrum(Par, window):
+	"""
+	Transition frequencies and intensities of a frequency-swept spectrum
+	at the fixed magnetic field Par.field[0]
+
+	Parameters
+	----------
+	Par :	  :class:`object`
+			  Object with all user-defined parameters and the eigenvalues and
+			  eigenvectors at the fixed field (Hamiltonian_Eig.fixed_field_Eig()).
+	window :  :class:`list`
+			  Frequency window [f1, f2] in Hz. Transitions which are outside
+			  for all orientations are removed.
+
+	Returns
+	-------
+	intensity, res
+		Intensities and transition frequencies (in MHz) of all kept
+		transitions on the regular grid over theta and phi (None if no
+		transition is in the window).
+
+	Notes
+	-----
+	Without a field sweep, the resonances need no bisection, interpolation
+	or extrapolation: the transition frequencies are the differences of the
+	eigenvalues, and the intensities are the transition probabilities times
+	the population differences of all orientations (evaluated for all
+	transitions at once, see frequency_resonances()). The transition
+	selection, the post-selection and the interpolation to the regular
+	grid are the same as in stick_spectrum_calculation().
+
+	"""
+	Knots_theta_vec = define_nKnots_pattern(Par)
+	S_sp_x_y = preparations(Par)
+	popu, ispopu, rho_0 = check_spin_polarization(Par)
+	with prof.stage("preselection"):
+		signum = window_transitions(Par.eigval, window[0], window[1])
+		Par.trans_dim = len(signum)
+		if Par.trans_dim > 30 and Par.Point_Group != "Dhinfty":
+
+			def eigvec_at(k, q, m):
+				return Par.eigvec[:, k, q, m]
+
+			Par.field_length = 0
+			keep = probability_selection(Par, signum, S_sp_x_y, eigvec_at)
+			signum = signum[keep]
+			Par.trans_dim = len(signum)
+	if Par.trans_dim == 0:
+		Par.Transdim = 0
+		return None, None, Par
+	args = (Par, S_sp_x_y, Knots_theta_vec, signum, ispopu, rho_0, popu)
+	with prof.stage("resonance_loop"):
+		res, intensity = frequency_resonances(*args)
+	prof.record_array("resonance_loop", res, intensity)
+	Warning_counter = np.zeros((Par.trans_dim, 2))
+	Warning_counter[:, 0] = 1
+	args = (Par, intensity, Warning_counter, res, Knots_theta_vec)
+	with prof.stage("postprocess_resonances"):
+		postprocess_resonances(*args)
+	return Par.intensity, Par.res, Par
+
+
+def window_transitions(eigval, f1, f2):
+	"""
+	Transitions (pairs of levels [t, s]) with a transition frequency in the
+	window [f1, f2] for at least one orientation.
+	"""
+	signum = []
+	for s in range(1, len(eigval)):
+		k = eigval[s] - eigval[0:s]
+		axes = tuple(range(1, k.ndim))
+		inside = np.any((k >= f1) & (k <= f2) & (k != 0), axis=axes)
+		for t in np.nonzero(inside)[0]:
+			signum.append([t, s])
+	return np.array(signum, dtype=np.int32).reshape(-1, 2)
+
+
+def frequency_resonances(Par, S_sp_x_y, Knots_theta_vec, signum, ispopu, rho_0, popu):
+	"""
+	Transition frequencies (in MHz) and intensities of the transitions
+	[t, s] of signum for all orientations at the fixed field. The
+	transition probabilities and thermal populations are evaluated for
+	all transitions and orientations at once.
+	"""
+	thermal_energy = (Par.T * con.kb) / con.h
+	dimension = Par.Hilbert_dim
+	eigval = Par.eigval[..., 0]
+	t, s = signum[:, 0], signum[:, 1]
+	res = (eigval[s] - eigval[t]) * con.Hz2MHz
+	# Transition probabilities |<t|Sx + Sy|s>|^2 of all orientations
+	vectors = np.reshape(Par.eigvec[:, :, :, 0], (dimension, -1, dimension))
+	S_vectors = S_sp_x_y.dot(np.reshape(vectors[s], (-1, dimension)).T).T
+	prob = np.abs(
+		np.sum(np.conj(np.reshape(vectors[t], (-1, dimension))) * S_vectors, axis=-1)
+	) ** 2
+	prob = np.reshape(prob, res.shape)
+	if ispopu:
+		popdiff = np.zeros(res.shape)
+		for k in range(0, Par.nKnots):
+			for q in range(0, Knots_theta_vec[k]):
+				eig = Par.eigvec[:, k, q, 0]
+				for i in range(0, len(signum)):
+					pop1 = population_trans(rho_0[0, k, q], eig[t[i]], popu)
+					pop2 = population_trans(rho_0[0, k, q], eig[s[i]], popu)
+					popdiff[i, k, q] = np.real(pop2 - pop1)
+	else:
+		# Vectorized thermal_popdiff() (with steep = 0)
+		ekbt = (eigval[s] - eigval[t]) / thermal_energy
+		high_temperature = (1 - ekbt) / np.sum(1 - eigval / thermal_energy, axis=0)
+		boltzmann = np.exp(ekbt) / np.sum(np.exp(eigval / thermal_energy), axis=0)
+		popdiff = np.where(ekbt < 0.1, high_temperature, boltzmann)
+	intensity = np.where(prob < 1e-6, 0.0, prob * popdiff)
+	valid = np.arange(0, Par.phinKnots)[None, :] < np.asarray(Knots_theta_vec)[:, None]
+	return res * valid, intensity * valid
+
+
+def crossing_transitions(eigval, mwFreq):
+	"""
+	Transitions (pairs of levels [t, s]) with resonances in the field
+	range, in the same order as in preselect_off_res().
+	"""
+	signum = []
+	for s in range(1, len(eigval)):
+		k = eigval[s] - eigval[0:s]
+		nonzero = k != 0
+		axes = tuple(range(1, k.ndim))
+		below = np.any((k <= mwFreq) & nonzero, axis=axes)
+		above = np.any((k >= mwFreq) & nonzero, axis=axes)
+		for t in np.nonzero(below & above)[0]:
+			signum.append([t, s])
+	return np.array(signum, dtype=np.int32).reshape(-1, 2)
+
+
+def transition_differences(eigval, signum, mwFreq):
+	"""
+	Differences of the transition energies to the microwave frequency
+	for the transitions [t, s] of signum.
+	"""
+	Delta_t = np.zeros((len(signum),) + eigval.shape[1:])
+	for p in range(0, len(signum)):
+		Delta_t[p] = eigval[signum[p][1]] - eigval[signum[p][0]] - mwFreq
+	return Delta_t
+
+
 def dec_preselect_off_res():
 	"""
 	Creates a decorator for the function preselect_off_res(). If Numba
 	is available, the decorator is a Numba jit (just-in-time compilation),
-	otherwise the identity decorator is called (this decorator does nothing).
+	otherwise the Python function is called (see Tools.lazy_jit()).
 	The jit decorator is called with defined static types to improve the
 	performance. Cashing is enabled to avoid avoid compilation each time
 	the Python program is invoked.
 	"""
-	if Numba == 1:
-		return jit(
-			types.Tuple((float64[:, :, :, :], int32[:, :]))(
-				int64, float64, int64, int64, int64, float64[:, :, :, :], int64
-			),
-			nopython=True,
-			cache=True,
-		)
-	else:
-		return dec_identity
+	return tool.lazy_jit(
+		"Tuple((float64[:, :, :, :], int32[:, :]))(int64, float64, int64, "
+		"int64, int64, float64[:, :, :, :], int64)",
+		nopython=True,
+		cache=True,
+	)
 
 
 def dec_find_resonances():
 	"""
 	Creates a decorator for the function find_resonances(). If Numba
 	is available, the decorator is a Numba jit (just-in-time compilation),
-	otherwise the identity decorator is called (this decorator does nothing).
+	otherwise the Python function is called (see Tools.lazy_jit()).
 	The jit decorator is called with defined static types to improve the
 	performance. Cashing is enabled to avoid avoid compilation each time
 	the Python program is invoked.
 	"""
-	if Numba == 1:
-		return jit(
-			types.Tuple((float64, float64, float64))(float64[:], float64[:], int32),
-			nopython=True,
-			cache=True,
-		)
-	else:
-		return dec_identity
+	return tool.lazy_jit(
+		"Tuple((float64, float64, float64))(float64[:], float64[:], int32)",
+		nopython=True,
+		cache=True,
+	)
 
 
 def dec_thermal_popdiff():
 	"""
 	Creates a decorator for the function thermal_popdiff(). If Numba
 	is available, the decorator is a Numba jit (just-in-time compilation),
-	otherwise the identity decorator is called (this decorator does nothing).
+	otherwise the Python function is called (see Tools.lazy_jit()).
 	The jit decorator is called with defined static types to improve the
 	performance. Cashing is enabled to avoid avoid compilation each time
 	the Python program is invoked.
 	"""
-	if Numba == 1:
-		return jit(
-			float64(float64[:], float64[:], int32, int32, float64, float64),
-			nopython=True,
-			cache=True,
-		)
-	else:
-		return dec_identity
+	return tool.lazy_jit(
+		"float64(float64[:], float64[:], int32, int32, float64, float64)",
+		nopython=True,
+		cache=True,
+	)
 
 
 def dec_identity(ob):
@@ -222,10 +423,29 @@ def preselect_to_probability(Par, Delta_t, signum, S_sp_x_y, Knots_theta_vec):
 	The function selects transitions according to there transition
 	probabilities.
 
+	"""
+	Par.field_length = len(Delta_t[0, 0, 0, :]) - 1
+
+	def eigvec_at(k, q, m):
+		return Par.eigvec[:, k, q, m]
+
+	keep = probability_selection(Par, signum, S_sp_x_y, eigvec_at)
+	Delta_t = Delta_t[keep]
+	signum = signum[0 : len(keep)][keep]
+	Par.trans_dim = len(Delta_t)
+	return Delta_t, signum, Par.trans_dim
+
+
+def probability_selection(Par, signum, S_sp_x_y, eigvec_at):
+	"""
+	Returns a boolean array of the transitions with a sufficient transition
+	probability, evaluated at a few orientations at the first or the last
+	field point. eigvec_at(k, q, m) returns the eigenvectors (as rows) of
+	the orientation (k, q) at the field point m.
+
 	"""
 	index = np.zeros(Par.trans_dim, dtype=np.int32)
 	prob_tmp = np.zeros((Par.trans_dim, Par.nKnots, Par.phinKnots))
-	Par.field_length = len(Delta_t[0, 0, 0, :]) - 1
 	ind = np.round(np.linspace(0, 1, 3) * Par.nKnots)
 	ind[2] = ind[2] - 1
 	ind = ind.astype(int)
@@ -241,9 +461,8 @@ def preselect_to_probability(Par, Delta_t, signum, S_sp_x_y, Knots_theta_vec):
 					index[g] = Par.field_length
 				t1 = signum[g][0]
 				t2 = signum[g][1]
-				eigv1 = Par.eigvec[t1][0, 0, index[g]]
-				eigv2 = Par.eigvec[t2][0, 0, index[g]]
-				prob = transition_probability(eigv1, eigv2, S_sp_x_y)
+				eigvec = eigvec_at(0, 0, index[g])
+				prob = transition_probability(eigvec[t1], eigvec[t2], S_sp_x_y)
 				prob_tmp[g, 0, 0] = prob
 		else:
 			for q in range(0, k + 2):
@@ -251,30 +470,29 @@ def preselect_to_probability(Par, Delta_t, signum, S_sp_x_y, Knots_theta_vec):
 					ind2 = ind
 				else:
 					ind2 = ind2_st
+				if np.mod(k, 2) == 0:
+					index = 0
+				else:
+					index = Par.field_length
+				eigvec = eigvec_at(ind2[q], ind[k], index)
 				for i in range(0, Par.trans_dim):
-					if np.mod(k, 2) == 0:
-						index = 0
-					else:
-						index = Par.field_length
 					t1 = signum[i][0]
 					t2 = signum[i][1]
-					eigv1 = Par.eigvec[t1][ind2[q], ind[k], index]
-					eigv2 = Par.eigvec[t2][ind2[q], ind[k], index]
-					prob = transition_probability(eigv1, eigv2, S_sp_x_y)
+					prob = transition_probability(eigvec[t1], eigvec[t2], S_sp_x_y)
 					prob_tmp[i, ind2[q], ind[k]] = prob
 	maxtransprob = Par.LevelSelect * (
 		np.max(np.sum(np.sum(np.absolute(prob_tmp), axis=2), axis=1))
 	)
+	keep = np.ones(Par.trans_dim, dtype=bool)
 	for s in range(Par.trans_dim - 1, -1, -1):
 		if np.sum(np.absolute(prob_tmp[s, :, :])) < maxtransprob:
-			Delta_t = np.delete(Delta_t, s, 0)
-			signum = np.delete(signum, s, 0)
-	Par.trans_dim = len(Delta_t)
-	return Delta_t, signum, Par.trans_dim
+			keep[s] = False
+	return keep
 
 
 def resonance_loop(
-	Par, S_sp_x_y, Knots_theta_vec, Delta_t, ispopu, signum, rho_0, popu
+	Par, S_sp_x_y, Knots_theta_vec, Delta_t, ispopu, signum, rho_0, popu,
+	chunk=None, out=None
 ):
 	"""
 	Function with the loop for finding resonance fiels and intensities to find
@@ -283,12 +501,23 @@ def resonance_loop(
 	the corresponding intensities. Linear extrapolation is used if the
 	resonance is partially (for some orientations) out of the defined
 	magentic field range.
+	With chunk = (k0, eigvec, eigval), only the theta angles k0, k0 + 1, ...
+	of the chunk are evaluated (eigvec, eigval and Delta_t of the chunk)
+	and the results are written into out = (res, intensity, Warning_counter).
 	"""
+	from scipy import interpolate
+
 	thermal_energy = (Par.T * con.kb) / con.h
+	if chunk is None:
+		chunk = (0, Par.eigvec, Par.eigval)
+	k0, eigvec, eigval = chunk
 	# Allocation of all vectors which should be filled
-	intensity = np.zeros((Par.trans_dim, Par.nKnots, Par.phinKnots), order="C")
-	res = np.zeros((Par.trans_dim, Par.nKnots, Par.phinKnots), order="C")
-	Warning_counter = np.zeros((Par.trans_dim, 2))
+	if out is None:
+		intensity = np.zeros((Par.trans_dim, Par.nKnots, Par.phinKnots), order="C")
+		res = np.zeros((Par.trans_dim, Par.nKnots, Par.phinKnots), order="C")
+		Warning_counter = np.zeros((Par.trans_dim, 2))
+	else:
+		res, intensity, Warning_counter = out
 	# Extrapolative Par.field if necessary
 	stepsize = (Par.field[len(Par.field) - 1] - Par.field[0]) / (len(Par.field) - 1)
 	Par.field_extra = np.append(
@@ -304,36 +533,37 @@ def resonance_loop(
 		t1.append(signum[i][0])
 		t2.append(signum[i][1])
 	# MAIN LOOP FOR FINDING ALL RESONANCE FIELDS
-	for k in range(0, Par.nKnots):
+	for k in range(k0, k0 + len(eigval[0])):
+		kc = k - k0
 		for q in range(0, Knots_theta_vec[k]):
 			for i in range(0, Par.trans_dim):
-				index = np.argmax(Delta_t[i, k, q, :] > 0)
-				Delta = Delta_t[i, k, q, :]
+				index = np.argmax(Delta_t[i, kc, q, :] > 0)
+				Delta = Delta_t[i, kc, q, :]
 				if index > 0:
 					res[i][k, q], steep, ediff = find_resonance(Par.field, Delta, index)
 					fac = (con.beta * (Par.field[index] - Par.field[index - 1])) / (
 						con.h * ediff * 1e3
 					)
 					prob1 = transition_probability(
-						Par.eigvec[t1[i]][k, q, index - 1],
-						Par.eigvec[t2[i]][k, q, index - 1],
+						eigvec[t1[i]][kc, q, index - 1],
+						eigvec[t2[i]][kc, q, index - 1],
 						S_sp_x_y,
 					)
 					prob2 = transition_probability(
-						Par.eigvec[t1[i]][k, q, index],
-						Par.eigvec[t2[i]][k, q, index],
+						eigvec[t1[i]][kc, q, index],
+						eigvec[t2[i]][kc, q, index],
 						S_sp_x_y,
 					)
 
 					prob = (1 - steep) * prob1 + (steep) * prob2
 					Warning_counter[i][0] = 1
 					if ispopu:
-						eigv_1 = Par.eigvec[t1[i]][k, q, index - 1] * (
+						eigv_1 = eigvec[t1[i]][kc, q, index - 1] * (
 							1 - steep
-						) + Par.eigvec[t1[i]][k, q, index] * (steep)
-						eigv_2 = Par.eigvec[t2[i]][k, q, index - 1] * (
+						) + eigvec[t1[i]][kc, q, index] * (steep)
+						eigv_2 = eigvec[t2[i]][kc, q, index - 1] * (
 							1 - steep
-						) + Par.eigvec[t2[i]][k, q, index] * (steep)
+						) + eigvec[t2[i]][kc, q, index] * (steep)
 				else:
 					if min(Delta) > 0:
 						ind = len(Par.field) - 1
@@ -347,13 +577,13 @@ def resonance_loop(
 					spl2 = interpolate.splrep(Par.field_extra, extrapol, k=3)
 					kt = interpolate.sproot(spl2, mest=1)
 					if len(kt) == 1:
-						res[i][k, q] = kt
+						res[i][k, q] = kt[0]
 					else:
 						res[i][k, q] = 0
 					fac = 0.5
 					Warning_counter[i][1] = 1
-					eigv1 = Par.eigvec[t1[i]][k, q, ind]
-					eigv2 = Par.eigvec[t2[i]][k, q, ind]
+					eigv1 = eigvec[t1[i]][kc, q, ind]
+					eigv2 = eigvec[t2[i]][kc, q, ind]
 					prob = transition_probability(eigv1, eigv2, S_sp_x_y)
 					if ispopu:
 						eigv_1 = eigv1
@@ -370,8 +600,8 @@ def resonance_loop(
 						popdiff = np.real(pop2 - pop1)
 					else:
 						popdiff = thermal_popdiff(
-							Par.eigval[:, k, q, index - 1],
-							Par.eigval[:, k, q, index],
+							eigval[:, kc, q, index - 1],
+							eigval[:, kc, q, index],
 							t1[i],
 							t2[i],
 							thermal_energy,
@@ -469,6 +699,8 @@ def equiv_grid(Par, res, intensity, Knots_theta_vec):
 	The final results for the intensities and resonance fields are saved
 	in the Par object.
 	"""
+	from scipy import interpolate
+
 	# Allocation
 	Par.intensity = np.zeros((Par.Transdim, Par.nKnots, Par.phinKnots))
 	Par.res = np.zeros((Par.Transdim, Par.nKnots, Par.phinKnots))
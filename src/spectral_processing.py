@@ -11,11 +11,15 @@ interpolated number of orientations.
 import numpy as np
 from . import Interpolation_lib
 from . import Direct_conversion_to_Field
+from . import Planner
+from . import Profiler as prof
 
 spline_interpolation_angle_grid = Interpolation_lib.spline_interpolation_angle_grid
 field_interpol = Interpolation_lib.field_interpol
 create_Lorentzian = Direct_conversion_to_Field.create_Lorentzian
 create_Gaussian = Direct_conversion_to_Field.create_Gaussian
+stick_spectrum = Direct_conversion_to_Field.stick_spectrum
+chunked_stick_spectrum = Direct_conversion_to_Field.chunked_stick_spectrum
 
 
 def create_conv_spectrum(Par, intensity, resonance):
@@ -23,13 +27,24 @@ def create_conv_spectrum(Par, intensity, resonance):
 	Par._nphi = None
 	Par._ntheta = None
 	determine_which_broadening(Par)
-	interpolation_number(Par, intensity, resonance, True)
-	inten, res, theta, phi = spline_interpolation_angle_grid(Par, intensity, resonance)
+	with prof.stage("interpolation"):
+		interpolation_number(Par, intensity, resonance, True)
+		# Chunks of theta angles if Par.max_memory would be exceeded
+		rows = Planner.interpolation_rows(Par, intensity.nbytes + resonance.nbytes)
+		if rows is None:
+			inten, res, theta, phi = spline_interpolation_angle_grid(
+				Par, intensity, resonance
+			)
+			prof.record_array("interpolation", res, inten)
+			res, inten = stick_spectrum(Par, res, inten)
+		else:
+			res, inten = chunked_stick_spectrum(Par, intensity, resonance, rows)
 	if Par.Gaussian:
 		field, signal = create_Gaussian(Par, res, inten)
 	else:
 		field, signal = create_Lorentzian(Par, res, inten)
-	field, signal = field_interpol(field, signal, Par)
+	with prof.stage("field_interpolation"):
+		field, signal = field_interpol(field, signal, Par)
 	return field, signal
 
 
@@ -0,0 +1,221 @@
+#! python3
+# Benchmark suite for the simulation kernels. Runs offline on the CPU and
+# writes machine-readable (JSON) results, which can be compared against a
+# stored baseline to catch performance regressions.
+#
+# Usage (from the test directory):
+#	python benchmark.py --output results.json
+#	python benchmark.py --compare results.json --tolerance 1.25
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from eprsim import EPRsim
+from eprsim.Profiler import Profiler
+
+sim = EPRsim
+
+### Reference cases (same spin systems as the stored spectra in simfiles/)
+
+def iso_nitrox():
+	return sim.Parameters(
+	    Range=[335, 350], mwFreq=9.6, g=2.002, A=45.5, Nucs="N", lw=[0.2, 0.2],
+	    motion="fast"
+	)
+
+def aniso_N_fm():
+	return sim.Parameters(
+	    Range=[335, 350], g=[2.0083, 2.0061, 2.0022], A=[12, 13, 110], Nucs="14N",
+	    mwFreq=9.6, lw=[0.2, 0.2], tcorr=1e-10, motion="fast"
+	)
+
+def aniso_N_ss():
+	return sim.Parameters(
+	    Range=[335, 350], g=[2.0083, 2.0061, 2.0022], A=[12, 13, 110], Nucs="14N",
+	    lw=[0.5, 0.2], motion="solid"
+	)
+
+def aniso_NH_ss():
+	return sim.Parameters(
+	    Range=[335, 350], g=[2.0083, 2.0061, 2.0022],
+	    A=[[12, 13, 110], [20, 30, 30]], Nucs="14N,H", lw=[0.5, 0.2],
+	    motion="solid"
+	)
+
+def multicomponent_ss():
+	P2 = sim.Parameters(
+	    Range=[335, 350], g=2.0003, lw=[0.3, 0.0], motion="solid", weight=0.1
+	)
+	return [aniso_N_ss(), P2]
+
+def triplet():
+	return sim.Parameters(
+	    S=1, Range=[130, 450], g=2, lw=[4, 1], D=[-1400, 20],
+	    Population=[0.2, 0.3, 0.4], Harmonic=0
+	)
+
+### Scaling cases
+
+def equivalent_protons(n):
+	def case():
+		return sim.Parameters(
+		    Range=[330, 350], g=[2.0083, 2.0061, 2.0022], A=[8, 8, 12], Nucs="1H",
+		    n=n, lw=[0.3, 0.1], motion="solid"
+		)
+	return case
+
+def hilbert_dimension(k):
+	def case():
+		A = [[12, 13, 110]] + [[5 + i, 6 + i, 9 + i] for i in range(0, k)]
+		if k == 0:
+			A = A[0]
+		return sim.Parameters(
+		    Range=[330, 350], g=[2.0083, 2.0061, 2.0022], A=A,
+		    Nucs=",".join(["14N"] + ["1H"] * k), lw=[0.3, 0.1], motion="solid"
+		)
+	return case
+
+def field_points(n):
+	def case():
+		P = aniso_N_ss()
+		P.Points = n
+		return P
+	return case
+
+def high_spin(S):
+	def case():
+		return sim.Parameters(
+		    S=S, Range=[50, 650], g=2, lw=[4, 1], D=[1000, 100], Harmonic=0
+		)
+	return case
+
+Reference = {
+	"iso_nitrox": iso_nitrox,
+	"aniso_N_fm": aniso_N_fm,
+	"aniso_N_ss": aniso_N_ss,
+	"aniso_NH_ss": aniso_NH_ss,
+	"multicomponent_ss": multicomponent_ss,
+	"triplet": triplet,
+}
+Scaling = {}
+for n in [1, 2, 3, 4]:
+	Scaling["equivalent_protons_" + str(n)] = equivalent_protons(n)
+for k in [0, 1, 2, 3]:
+	Scaling["hilbert_N_" + str(k) + "H"] = hilbert_dimension(k)
+for n in [1024, 4096, 16384]:
+	Scaling["points_" + str(n)] = field_points(n)
+for S in [1, 1.5, 2]:
+	Scaling["high_spin_S" + str(S)] = high_spin(S)
+
+### Helper Functions
+
+def quiet(P):
+	if isinstance(P, list):
+		return [quiet(Pi) for Pi in P]
+	P.verbosity = False
+	return P
+
+def run_case(case, repeat=3):
+	"""
+	Runs one case (after one warm-up run for the just-in-time compilation)
+	and returns the best wall time, the peak traced memory and the stage
+	profile of the best run.
+	"""
+	sim.simulate(quiet(case()))
+	best = None
+	times = []
+	for r in range(0, repeat):
+		P = quiet(case())
+		profiler = Profiler()
+		tracemalloc.start()
+		st = time.perf_counter()
+		sim.simulate(P, profiler=profiler)
+		elapsed = time.perf_counter() - st
+		current, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		times.append(elapsed)
+		if best is None or elapsed < best["time"]:
+			report = profiler.report()
+			for entry in report["stages"].values():
+				entry["peak_shape"] = list(entry["peak_shape"])
+			best = {
+			    "time": elapsed, "peak_memory": peak, "stages": report["stages"],
+			    "counters": report["counters"],
+			}
+	best["times"] = times
+	return best
+
+def metadata():
+	return {
+	    "python": platform.python_version(),
+	    "numpy": np.__version__,
+	    "platform": platform.platform(),
+	    "processor": platform.processor(),
+	    "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+	}
+
+def run(cases, repeat=3):
+	results = {}
+	for name in cases:
+		results[name] = run_case(cases[name], repeat)
+		print(name + ": " + str(round(results[name]["time"], 4)) + " s, "
+		      + str(round(results[name]["peak_memory"] / 1e6, 2)) + " MB")
+	return {"metadata": metadata(), "results": results}
+
+def compare(results, baseline, tolerance=1.25, min_time=0.01):
+	"""
+	Returns the regressions (case, quantity, new value, baseline value) of
+	the cases in both result sets. Times below min_time (in s) are not
+	compared.
+	"""
+	regressions = []
+	for name, new in results["results"].items():
+		if name not in baseline["results"]:
+			continue
+		old = baseline["results"][name]
+		if new["time"] > tolerance * old["time"] and new["time"] > min_time:
+			regressions.append((name, "time", new["time"], old["time"]))
+		if new["peak_memory"] > tolerance * old["peak_memory"]:
+			regressions.append(
+			    (name, "peak_memory", new["peak_memory"], old["peak_memory"])
+			)
+	return regressions
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="EPRsim benchmark suite")
+	parser.add_argument("--output", help="JSON file for the results")
+	parser.add_argument("--compare", help="JSON file with baseline results")
+	parser.add_argument("--tolerance", type=float, default=1.25,
+	                    help="allowed ratio to the baseline (default 1.25)")
+	parser.add_argument("--repeat", type=int, default=3)
+	parser.add_argument("--suite", choices=["all", "reference", "scaling"],
+	                    default="all")
+	parser.add_argument("--cases", nargs="*", help="names of single cases")
+	args = parser.parse_args(argv)
+	cases = {}
+	if args.suite in ("all", "reference"):
+		cases.update(Reference)
+	if args.suite in ("all", "scaling"):
+		cases.update(Scaling)
+	if args.cases:
+		cases = dict((name, {**Reference, **Scaling}[name]) for name in args.cases)
+	results = run(cases, args.repeat)
+	if args.output:
+		with open(args.output, "w") as f:
+			json.dump(results, f, indent=1)
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		regressions = compare(results, baseline, args.tolerance)
+		for name, quantity, new, old in regressions:
+			print("REGRESSION " + name + " " + quantity + ": " + str(new)
+			      + " (baseline " + str(old) + ")")
+		if regressions:
+			return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
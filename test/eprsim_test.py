@@ -186,3 +186,581 @@ def test_falseNegative():
 	#These are different speectra, so it should not pass the assertion
 	with raises(AssertionError):
 		sim_diff(B0,spc,BRef,spcRef) if not writeData else None
+
+def test_fm_batch():
+	"""Rows of a batched fast-motion simulation agree with single simulations."""
+	Ra = [335, 350]
+	g = [2.0083, 2.0061, 2.0022]
+	A = [12, 13, 110]
+	tcorr = np.logspace(-11, -9, 5)
+	lwL = np.linspace(0.1, 0.3, 5)
+	Param = sim.Parameters(
+	    Range=Ra, g=g, A=A, Nucs="14N", mwFreq=9.6, lw=[0.2, 0.2], motion="fast"
+	)
+	B0, spcs, flag = sim.simulate_fast_motion_batch(Param, tcorr, lw=lwL)
+	assert(spcs.shape == (5, 1024))
+	for i in range(0, 5):
+		P = sim.Parameters(
+		    Range=Ra, g=g, A=A, Nucs="14N", mwFreq=9.6, lw=[0.2, lwL[i]],
+		    tcorr=tcorr[i], motion="fast"
+		)
+		B1, spc, flag = sim.simulate(P)
+		sim_diff(B0, spcs[i], B1, spc, Tol=1e-8)
+
+def test_fm_jacobian():
+	"""Analytic derivatives of a fast-motion spectrum agree with finite differences."""
+	g = np.array([2.0083, 2.0061, 2.0022])
+	A = np.array([12.0, 13.0, 110.0])
+	x0 = dict(g=g, A=A, tcorr=3e-10, lw_L=0.15, lw_G=0.1)
+	def spc(x):
+		P = sim.Parameters(
+		    Range=[335, 350], g=list(x["g"]), A=list(x["A"]), Nucs="14N",
+		    mwFreq=9.6, lw=[x["lw_G"], x["lw_L"]], tcorr=x["tcorr"], motion="fast"
+		)
+		return sim.simulate_jacobian(P)
+	B0, spc0, J, labels, flag = spc(x0)
+	assert(J.shape == (1024, len(labels)))
+	assert(labels == [
+	    "giso", "aiso_1", "dg_x", "dg_y", "dg_z", "dA_1_x", "dA_1_y", "dA_1_z",
+	    "tcorr", "lw_L", "lw_G"
+	])
+	steps = dict(g=2e-7, A=1e-3, tcorr=1e-13, lw_L=1e-5, lw_G=1e-5)
+	for j, name in enumerate(labels):
+		# Direction of the derivative in (g, A, tcorr, lw) and its Jacobian column
+		if name in ("giso", "aiso_1"):
+			key, d, Jd = name[0].replace("a", "A"), np.ones(3), J[:, j]
+		elif name[:2] in ("dg", "dA"):
+			# g and A only define the traceless part of dg and dA
+			key = name[1]
+			d = -np.ones(3) / 3
+			d["xyz".index(name[-1])] += 1
+			Jd = J[:, [labels.index(name[:-1] + ax) for ax in "xyz"]] @ d
+		else:
+			key, d, Jd = name, 1.0, J[:, j]
+		xp, xm = dict(x0), dict(x0)
+		xp[key] = x0[key] + steps[key] * d
+		xm[key] = x0[key] - steps[key] * d
+		fd = (spc(xp)[1] - spc(xm)[1]) / (2 * steps[key])
+		assert(np.max(np.abs(fd - Jd)) < 1e-6 * np.max(np.abs(fd))), name
+
+
+def test_slow_motion():
+	"""Slow-motion spectra approach the fast-motion limit and both solvers agree."""
+	Ra = [330, 350]
+	g = [2.0083, 2.0061, 2.0022]
+	A = [12, 13, 110]
+	Param = sim.Parameters(
+	    Range=Ra, g=g, A=A, Nucs="14N", mwFreq=9.6, lw=[0, 0.3], tcorr=1e-11,
+	    motion="slow"
+	)
+	B0, spc, flag = sim.simulate(Param)
+	Param.motion = "fast"
+	B1, spcRef, flag = sim.simulate(Param)
+	sim_diff(B0, spc, B1, spcRef, Tol=0.02)
+	Param = sim.Parameters(
+	    Range=Ra, g=g, A=A, Nucs="14N", mwFreq=9.6, lw=[0, 0.3], tcorr=3e-9,
+	    motion="slow", Points=256
+	)
+	B0, spc, flag = sim.simulate(Param)
+	Param.Solver = "CG"
+	B1, spcCG, flag = sim.simulate(Param)
+	sim_diff(B0, spc, B1, spcCG, Tol=1e-6)
+
+def test_slow_motion_cache():
+	"""Repeated slow-motion simulations reuse the cached Liouville templates."""
+	from eprsim import SlowMotion
+	SlowMotion.clear_cache()
+	Param = sim.Parameters(
+	    Range=[330, 350], g=[2.0083, 2.0061, 2.0022], A=[12, 13, 110], Nucs="14N",
+	    mwFreq=9.6, lw=[0, 0.3], tcorr=3e-9, motion="slow", Points=256
+	)
+	B0, spc, flag = sim.simulate(Param)
+	assert(len(SlowMotion._Liouville_cache) == 1)
+	B1, spc1, flag = sim.simulate(Param)
+	assert(len(SlowMotion._Liouville_cache) == 1)
+	sim_diff(B0, spc, B1, spc1, Tol=1e-8)
+	Param.tcorr = 1e-9
+	B1, spc1, flag = sim.simulate(Param)
+	SlowMotion.Basis_truncation = False
+	B2, spc2, flag = sim.simulate(Param)
+	SlowMotion.Basis_truncation = True
+	sim_diff(B1, spc1, B2, spc2, Tol=1e-6)
+
+def test_wigner_large_rank():
+	"""Clebsch-Gordan coefficients and Wigner functions stay orthonormal for L >= 60."""
+	from eprsim import SlowMotion as sm
+	j1, j2, M = 60, 2, 3
+	C = np.array([
+	    [sm.Clebsch_Gordan(j1, m1, j2, M - m1, J, M) for m1 in range(M - j2, M + j2 + 1)]
+	    for J in range(j1 - j2, j1 + j2 + 1)
+	])
+	assert(np.allclose(C @ C.T, np.eye(5), rtol=0, atol=1e-12))
+	j, m = 70, 7
+	ref = np.sqrt((j - m + 1) * (j + m + 1) / ((2 * j + 1) * (j + 1)))
+	assert(np.isclose(sm.Clebsch_Gordan(j, m, 1, 0, j + 1, m), ref, rtol=1e-12))
+	j = 60
+	for beta in (0.3, 1.2, 2.5):
+		d = np.array([
+		    [sm.Wigner_d(j, mp, m, beta) for m in range(-j, j + 1)]
+		    for mp in range(-j, j + 1)
+		])
+		assert(np.allclose(d @ d.T, np.eye(2 * j + 1), rtol=0, atol=1e-12))
+		assert(np.isclose(d[-1, -1], np.cos(beta / 2) ** (2 * j), rtol=1e-12))
+
+
+def test_isotope_compositions():
+	"""Equivalent nuclei are enumerated by isotope composition with multinomial weights."""
+	Param = sim.Parameters(Nucs="C", n=12, A=[10, 10, 12], tcorr=1e-10, motion="fast")
+	Val = sim.Validate_Parameters(Param)
+	w = Val.Sim_objects[0]._w
+	nucs = [obj._Nucsvec for obj in Val.Sim_objects]
+	assert(len(set(nucs)) == len(nucs))
+	assert(min(w) >= Param.abund_threshold)
+	comps = sim.isotope_group_compositions(["12C", "13C"], 12)
+	assert(len(comps) == 13)
+	assert(abs(sum([c[1] for c in comps]) - sum(w) - sum(
+	    [c[1] for c in comps if c[1] < Param.abund_threshold])) < 1e-12)
+
+def test_parallel_simulate():
+	"""Thread and process pools reproduce the serial multicomponent spectrum."""
+	def systems():
+		P1 = sim.Parameters(
+		    Nucs="N,H", n=[1, 2], A=[[12, 13, 110], [5, 5, 9]], Range=[330, 350],
+		    g=[2.008, 2.006, 2.002], lw=[0.3, 0.3], weight=0.5
+		)
+		P2 = sim.Parameters(
+		    Nucs="N", A=[12, 13, 110], g=[2.008, 2.006, 2.002], Range=[330, 350],
+		    lw=[0.3, 0.3], tcorr=1e-9, motion="fast"
+		)
+		return [P1, P2]
+	B0, spc, flag = sim.simulate(systems())
+	for executor in ("thread", "process"):
+		B1, spc1, flag = sim.simulate(systems(), workers=2, executor=executor)
+		assert(np.array_equal(spc, spc1))
+
+
+def test_simulate_warning_system():
+	"""A system with a warning does not shift or erase the others."""
+	kw = dict(Range=[300, 360], lw=[0.3, 0.1], Harmonic=0, verbosity=False)
+	# dim(H) > 512: warning 1 for all isotope combinations
+	P1 = sim.Parameters(g=2.1, Nucs="Cu,Cu,Cu,Cu,Cu", A=[50] * 5, **kw)
+	P2 = sim.Parameters(g=2.0, **kw)
+	B0, spc, flag = sim.simulate(P2)
+	for systems in ([P1, P2], [P2, P1]):
+		B1, spc1, flag1 = sim.simulate(systems)
+		assert(flag1 == 1 and np.array_equal(spc, spc1))
+	# Frequency sweep, no transitions of P1 in range: warning 3
+	kw = dict(lw=[0.3, 0.1], Field=340.0, mwRange=[9.4, 9.6], Harmonic=0, verbosity=False)
+	P1 = sim.Parameters(g=4.0, Nucs="Cu", A=50, **kw)
+	P2 = sim.Parameters(g=2.0, **kw)
+	F, spc, flag = sim.simulate(P2)
+	for systems in ([P1, P2], [P2, P1]):
+		F1, spc1, flag1 = sim.simulate(systems)
+		assert(flag1 == 3 and np.array_equal(spc, spc1))
+	F1, spc1, flag1 = sim.simulate(P1)
+	assert(flag1 == 3 and spc1.shape == F1.shape and not spc1.any())
+
+
+def test_simulate_mixed_axes():
+	"""Systems with different sweep types or axes are not summed."""
+	kw = dict(g=2.0, lw=[0.3, 0.1], Harmonic=0, verbosity=False)
+	P1 = sim.Parameters(Field=340.0, mwRange=[9.4, 9.6], **kw)
+	P2 = sim.Parameters(Range=[335, 350], **kw)
+	with raises(ValueError):
+		sim.simulate([P1, P2])
+	P3 = sim.Parameters(Range=[330, 350], **kw)
+	with raises(ValueError):
+		sim.simulate([P2, P3])
+
+
+def test_simulate_many():
+	"""Grouped sets of simulate_many() reproduce single simulate() calls."""
+	sets = []
+	for lw in [0.3, 0.6]:
+		sets.append(sim.Parameters(
+		    Nucs="N", A=[12, 13, 110], g=[2.008, 2.006, 2.002], Range=[330, 350],
+		    lw=[lw, 0.2]
+		))
+	for tcorr in [2e-10, 1e-9]:
+		sets.append(sim.Parameters(
+		    Nucs="N", A=[12, 13, 110], g=[2.008, 2.006, 2.002], Range=[330, 350],
+		    lw=[0.1, 0.3], tcorr=tcorr, motion="fast"
+		))
+	sets.append(sim.Parameters(
+	    Nucs="N", A=40, g=2.006, Range=[330, 350], lw=[0.1, 0.2], motion="fast"
+	))
+	for workers in (None, 2):
+		B0, spcs, flags = sim.simulate_many(sets, workers=workers)
+		assert(spcs.shape == (len(sets), len(B0)))
+		for i in range(0, len(sets)):
+			B1, spc, flag = sim.simulate(sets[i])
+			assert(np.allclose(spcs[i], spc, atol=1e-12 * np.max(abs(spc))))
+
+
+def test_solid_state_workspace():
+	"""The solid-state stick stage does not modify or copy the parameters."""
+	from eprsim import SolidState as so
+	P = sim.Parameters(
+	    Nucs="14N,1H", A=[[12, 13, 110], [20, 30, 30]], g=[2.008, 2.006, 2.002],
+	    AFrame=[[0, 20, 0], [0, 0, 0]], Range=[330, 350], lw=[0.3, 0.3],
+	    verbosity=False
+	)
+	B0, spc, flag = sim.simulate(P)
+	state = dict(P.__dict__)
+	SimPar = sim.Validate_Parameters(P).Sim_objects[0]
+	ParS, intensity, resonance = so.solid_state_sticks(P, SimPar)
+	assert(P.__dict__ == state)
+	assert(ParS.mwFreq == 9.6e9 and ParS.A_tensor.shape == (2, 3, 3))
+	for name in ["Ham_FD", "eigvec", "eigval", "intensity", "res"]:
+		assert(not hasattr(ParS, name))
+	with raises(AttributeError):
+		ParS.undefined_attribute = 1
+	B1, spc1, ParB = so.solid_state_broadening(ParS, intensity, resonance)
+	assert(np.allclose(spc1 / np.max(abs(spc1)), spc / np.max(abs(spc))))
+
+
+def test_max_memory():
+	"""Chunks of orientations and of the interpolated angle grid
+	(max_memory) reproduce the spectrum and stay below the limit."""
+	import tracemalloc
+	from eprsim.Profiler import Profiler
+	P = sim.Parameters(
+	    Nucs="14N,1H", A=[[12, 13, 110], [20, 30, 30]], g=[2.008, 2.006, 2.002],
+	    Range=[330, 350], lw=[0.3, 0.3], Interpolative_Refinement=4,
+	    verbosity=False
+	)
+	profiler = Profiler()
+	B0, spc, flag = sim.simulate(P, profiler=profiler)
+	plan = sim.plan(P, max_memory=0.7)
+	entry = plan["systems"][0]
+	assert(entry["Hilbert_dim"] == 12 and entry["Point_Group"] == "D2h")
+	assert(entry["theta_rows"] is not None)
+	assert(entry["interpolation_rows"] is not None)
+	assert(entry["bisection_rounds"]
+		== profiler.report()["counters"]["HF_Eig bisection rounds"])
+	assert(plan["runtime"] > 0)
+	P.max_memory = 0.7
+	profiler = Profiler()
+	tracemalloc.start()
+	B1, spc1, flag = sim.simulate(P, profiler=profiler)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	assert(peak <= P.max_memory * 1e6)
+	assert(np.allclose(spc, spc1))
+	counters = profiler.report()["counters"]
+	assert(counters["orientation chunks"] > 1)
+	assert(counters["interpolation chunks"] > 1)
+
+
+def test_fit():
+	"""Fit recovers linewidths and hyperfine couplings and reuses stages."""
+	P = sim.Parameters(
+	    Nucs="N", A=[12, 13, 100], g=[2.008, 2.006, 2.002], Range=[330, 350],
+	    lw=[0.4, 0.2], Points=512, verbosity=False
+	)
+	B0, spc, flag = sim.simulate(P)
+	P.A = [12, 13, 106]
+	P.lw = [0.3, 0.3]
+	result = sim.fit(B0, 2 * spc, P, vary={"lw": [0.2, 0.2], "A": [0, 0, 10]})
+	assert(np.allclose(result.x, [100, 0.4, 0.2], rtol=5e-2))
+	assert(np.isclose(result.amplitude, 2, rtol=1e-2))
+	assert(result.stages["lw[0]"] == "broadening")
+	assert(result.evaluations[0]["Hamiltonian"] < result.evaluations[0]["broadening"])
+	P1 = sim.Parameters(
+	    Nucs="N", A=[12, 13, 100], g=[2.008, 2.006, 2.002], Range=[330, 350],
+	    lw=[0.1, 0.3], tcorr=1e-9, motion="fast", verbosity=False
+	)
+	P2 = sim.Parameters(
+	    Nucs="N", A=40, g=2.006, Range=[330, 350], lw=[0.1, 0.1], motion="fast",
+	    verbosity=False, weight=0.5
+	)
+	B0, spc, flag = sim.simulate([P1, P2])
+	P1.tcorr = 6e-10
+	result = sim.fit(
+	    B0, spc, [P1, P2], vary=[{"tcorr": 8e-10}, None], workers=2
+	)
+	assert(np.isclose(result.x[0], 1e-9, rtol=2e-2))
+	assert(np.allclose(result.weights, [2 / 3, 1 / 3], rtol=1e-2))
+	assert(result.evaluations[0]["Hamiltonian"] == 1)
+
+
+def test_fit_process():
+	"""Jacobian columns evaluated in a process pool agree with the serial fit."""
+	P = sim.Parameters(
+	    g=[2.008, 2.006, 2.002], Range=[330, 350], lw=[0.4, 0.2], Points=512,
+	    verbosity=False
+	)
+	B0, spc, flag = sim.simulate(P)
+	P.lw = [0.3, 0.3]
+	result = sim.fit(B0, spc, P, vary={"lw": [0.2, 0.2]})
+	result1 = sim.fit(B0, spc, P, vary={"lw": [0.2, 0.2]}, workers=2, executor="process")
+	assert(np.array_equal(result.x, result1.x))
+
+
+def test_fit_variable_projection():
+	"""Weights and baseline are eliminated linearly (NNLS and QR)."""
+	P1 = sim.Parameters(
+	    Nucs="N", A=[12, 13, 100], g=[2.008, 2.006, 2.002], Range=[330, 350],
+	    lw=[0.3, 0.3], Points=512, verbosity=False
+	)
+	P2 = sim.Parameters(
+	    Nucs="H", A=[5, 5, 9], g=[2.004, 2.003, 2.001], Range=[330, 350],
+	    lw=[0.3, 0.3], Points=512, verbosity=False
+	)
+	B0, spc1, flag = sim.simulate(P1)
+	B0, spc2, flag = sim.simulate(P2)
+	base = 0.01 + 0.002 * (B0 - 340)
+	data = 0.7 * spc1 + 0.3 * spc2 + base
+	result = sim.fit(B0, data, [P1, P2], vary=None, baseline=1)
+	assert(np.allclose(result.weights, [0.7, 0.3]))
+	assert(np.allclose(result.baseline, base))
+	result = sim.fit(B0, -data, [P1, P2], vary=None, baseline=1,
+	                 nonnegative=False)
+	assert(np.isclose(result.amplitude, -1))
+	result = sim.fit(B0, -data, [P1, P2], vary=None, baseline=1)
+	assert(np.all(result.weights >= 0))
+
+
+def test_profiler():
+	"""Profiler reports the solid-state stages without changing the spectrum."""
+	from eprsim.Profiler import Profiler
+	P = sim.Parameters(
+	    Nucs="N", A=[12, 13, 110], g=[2.008, 2.006, 2.002], Range=[330, 350],
+	    lw=[0.3, 0.3], ModAmp=0.1, verbosity=False
+	)
+	B0, spc, flag = sim.simulate(P)
+	profiler = Profiler()
+	B1, spc1, flag = sim.simulate(P, profiler=profiler)
+	assert(np.array_equal(spc, spc1))
+	report = profiler.report()
+	for name in ["Presettings", "ZFS_Hamiltonian", "HF_Eig", "preselection",
+	             "resonance_loop", "interpolation", "rendering", "modulation"]:
+		assert(report["stages"][name]["calls"] >= 1)
+	assert(report["stages"]["HF_Eig"]["peak_bytes"] > 0)
+	assert("HF_Eig bisection rounds" in report["counters"])
+	assert(report["total_time"] >= report["stages"]["solid_state_kernel"]["time"])
+
+
+def test_fused_postprocessing():
+	"""One spectral multiplication equals the sequential post-processing."""
+	from eprsim import Tools as tool
+	for n in [1024, 1023]:
+		B = np.linspace(330, 350, n)
+		spc = np.exp(-0.5 * (B - 338) ** 2) + 0.5 / (1 + (B - 344) ** 2)
+		ref = tool.pseudo_field_modulation(0.001, B, spc)
+		ref = 2 * tool.normalize2area(ref, 1)
+		ref = tool.modulation_amplitude(0.4, B, ref)
+		ref = tool.phase_offset(0.3, ref)
+		out = tool.fused_postprocessing(
+		    B, np.vstack([spc, spc]), 1, True, 0.4, 0.3, 2
+		)
+		assert(np.allclose(out, ref, rtol=0, atol=1e-12 * np.max(np.abs(ref))))
+
+
+def test_batched_tools():
+	"""2-D post-processing with per-row parameters equals the row-wise calls."""
+	from eprsim import Tools as tool
+	B = np.linspace(330, 350, 1024)
+	spcs = np.array([np.exp(-0.5 * (B - c) ** 2) for c in [336, 340, 344]])
+	p = np.array([0.0, 0.2, 0.5])
+	batched = [
+	    tool.pseudo_field_modulation(p, B, spcs), tool.modulation_amplitude(p, B, spcs),
+	    tool.convolution_G(p + 0.1, B, spcs), tool.convolution_L(p + 0.1, B, spcs),
+	    tool.phase_offset(p, spcs), tool.normalize2area(spcs),
+	]
+	for i in range(0, 3):
+		rows = [
+		    tool.pseudo_field_modulation(p[i], B, spcs[i]),
+		    tool.modulation_amplitude(p[i], B, spcs[i]),
+		    tool.convolution_G(p[i] + 0.1, B, spcs[i]),
+		    tool.convolution_L(p[i] + 0.1, B, spcs[i]),
+		    tool.phase_offset(p[i], spcs[i]), tool.normalize2area(spcs[i]),
+		]
+		for out, ref in zip(batched, rows):
+			assert(np.allclose(out[i], ref, rtol=0, atol=1e-12 * np.max(np.abs(ref))))
+	pair = np.array([spcs[0], 10 * spcs[0]])
+	noisy = tool.add_noise(pair, np.array([10, 10]))
+	assert(noisy.shape == (2, 1024) and np.array_equal(pair[0], spcs[0]))
+	assert(tool.add_noise(np.arange(8), 10, rng=1).dtype == float)
+
+
+def test_padded_convolution():
+	"""Padded rFFT convolution agrees with a direct one and does not wrap around."""
+	from eprsim import Convolutions as conv
+	class Sys:
+		lw = [0.3, 0.2]
+	B = np.linspace(335, 350, 1024)
+	spc = np.exp(-0.5 * (B - 342) ** 2 / 0.2 ** 2)
+	x = np.arange(-200, 201) * (B[1] - B[0])
+	ref = np.convolve(spc, np.exp(-4 * np.log(2) * x ** 2 / 0.3 ** 2), mode="same")
+	assert(np.allclose(conv.voigt_convolution_Gauss(Sys, B, spc), ref, atol=1e-10))
+	edge = np.exp(-0.5 * (B - 350) ** 2 / 0.2 ** 2)
+	spcc = conv.voigt_convolution_Lorentz(Sys, B, edge)
+	assert(spcc.shape == B.shape)
+	assert(np.max(np.abs(spcc[0:100])) < 1e-3 * np.max(spcc))
+	# Modulation amplitude: no shift against a high-resolution reference
+	from eprsim import Tools as tool
+	def modulated(n):
+		Bn = np.linspace(335, 350, n)
+		spcn = conv.voigt_convolution_Gauss(Sys, Bn, np.exp(-0.5 * (Bn - 342) ** 2 / 0.2 ** 2))
+		out = [
+		    tool.modulation_amplitude(0.3, Bn, spcn),
+		    tool.fused_postprocessing(Bn, spcn, 0, False, 0.3),
+		]
+		return Bn, [o / np.max(o) for o in out]
+	Bh, refs = modulated(16384)
+	B, outs = modulated(1024)
+	for out, ref in zip(outs, refs):
+		ref = np.interp(B, Bh, ref)
+		assert(np.sqrt(np.mean((out - ref) ** 2)) < 2e-4)
+
+
+def test_generalized_Pascal():
+	"""Rows of the generalized Pascal triangle by polynomial powers."""
+	from math import comb
+	from eprsim import Tools as tool
+	assert(np.array_equal(tool.generalized_Pascal(3, 1), [1, 3, 6, 7, 6, 3, 1]))
+	assert(np.array_equal(
+	    tool.generalized_Pascal(4, 1.5), [1, 4, 10, 20, 31, 40, 44, 40, 31, 20, 10, 4, 1]
+	))
+	assert(np.array_equal(tool.generalized_Pascal(0, 1), [1]))
+	row = tool.generalized_Pascal(40, 0.5)
+	assert(np.array_equal(row, [float(comb(40, k)) for k in range(0, 41)]))
+	assert(tool.generalized_Pascal(40, 0.5) is row)
+
+
+def test_euler_rotations():
+	"""Stacks of Euler matrices and rotated tensors match the scalar versions."""
+	from eprsim import Tools as tool
+	from eprsim import Hamiltonian_Eig as ham
+	rng = np.random.default_rng(3)
+	angles = rng.uniform(0, np.pi, (3, 5))
+	tensors = rng.normal(size=(5, 3, 3))
+	R = tool.Eulermatrices(angles[0], angles[1], angles[2])
+	assert(R.shape == (5, 3, 3))
+	rotated = tool.tensor_rotations(tensors, R)
+	for i in range(0, 5):
+		Ri = tool.Eulermatrix(angles[0, i], angles[1, i], angles[2, i])
+		assert(np.allclose(R[i], Ri))
+		assert(np.allclose(rotated[i], tool.tensor_rotation(tensors[i], Ri)))
+	grid = ham.orientation_rotations(3, [1, 3, 5], 5, 1)
+	assert(ham.orientation_rotations(3, np.array([1, 3, 5]), 5, 1) is grid)
+	assert(grid.shape == (3, 5, 3, 3) and not grid.flags.writeable)
+	assert(np.all(grid[1, 3:] == 0) and np.all(np.isfinite(grid)))
+
+
+def test_noise_replicates():
+	"""Noisy replicates are reproducible and white/1f noise has unit variance."""
+	from eprsim import Tools as tool
+	spc = np.exp(-0.5 * np.linspace(-4, 4, 512) ** 2)
+	base = spc.copy()
+	reps = tool.noise_replicates(spc, 20, 2000, rng=5)
+	assert(reps.shape == (2000, 512))
+	assert(np.array_equal(spc, base))
+	assert(np.array_equal(reps, tool.noise_replicates(spc, 20, 2000, rng=np.random.default_rng(5))))
+	assert(abs(np.std(reps - spc) * 20 - 1) < 0.01)
+	pink = tool.noise_realizations((2000, 512), rng=5, color="pink")
+	assert(abs(np.std(pink) - 1) < 0.01)
+	psd = np.mean(np.abs(np.fft.rfft(pink, axis=-1)) ** 2, axis=0)
+	assert(abs(psd[10] / psd[40] - 4) < 0.4)
+	with raises(ValueError):
+		tool.noise_realizations((2, 8), color="blue")
+
+
+def test_field_axis():
+	"""Vectorized unit converters and the lazily converted field axis."""
+	from eprsim import Tools as tool
+	from eprsim import FastMotion as fm
+	assert(np.isclose(tool.GHz2mT(9.6), 342.5518855564894))
+	assert(np.isclose(tool.mT2GHz(332.5, 2.05), 9.540190522093772))
+	freq = np.array([9.4, 9.6, 34.0])
+	B = np.linspace(330, 350, 256)[None, :] * freq[:, None] / 9.6
+	axis = tool.FieldAxis(B, freq)
+	assert(axis.g.shape == (3, 256))
+	assert(np.allclose(tool.g2mT(axis.g, freq[:, None]), B))
+	assert(np.allclose(axis.GHz, tool.mT2GHz(B)))
+	assert(np.allclose(axis.G, 10 * B))
+	assert(fm.Biso(axis.g, freq[:, None] * 1e9).shape == (3, 256))
+	assert(np.isclose(fm.Biso(2.0, 9.6e9, "T"), 1e-3 * fm.Biso(2.0, 9.6e9)))
+	g_axis = tool.FieldAxis.from_g(np.linspace(2.1, 1.9, 64), 9.6)
+	assert(np.allclose(g_axis.mT, tool.GHz2mT(9.6, np.linspace(2.1, 1.9, 64))))
+	with raises(ValueError):
+		tool.FieldAxis(B).g
+
+
+def test_frequency_sweep():
+	"""Frequency-swept spectra agree with field sweeps on the g-scale."""
+	from eprsim import Tools as tool
+	P = sim.Parameters(
+	    g=2.0, lw=[0.3, 0.1], Field=340.0, mwRange=[9.4, 9.6], Harmonic=0,
+	    verbosity=False
+	)
+	F, spc, flag = sim.simulate(P)
+	assert(F[0] == 9.4 and F[-1] == 9.6 and flag == 0)
+	assert(abs(F[np.argmax(spc)] - tool.mT2GHz(340.0, 2.0)) < 2 * (F[1] - F[0]))
+	kw = dict(
+	    Range=[335, 350], g=[2.0083, 2.0061, 2.0022], A=[12, 13, 110], Nucs="14N",
+	    lw=[0.5, 0.2], Harmonic=0, verbosity=False
+	)
+	B0, spc, flag = sim.simulate(sim.Parameters(**kw))
+	F, spcF, flag = sim.simulate(sim.Parameters(Field=342.0, **kw))
+	spcB = np.interp(B0, (342.0 * 9.6 / F)[::-1], spcF[::-1])
+	assert(np.corrcoef(spc, spcB)[0, 1] > 0.99)
+	P.mwRange = [20, 21]
+	assert(sim.simulate(P)[2] == 3)
+
+
+def test_experiments():
+	"""Multi-frequency simulations agree with separate simulations."""
+	kw = dict(
+	    g=[2.0083, 2.0061, 2.0022], A=[12, 13, 110], Nucs="14N", lw=[0.5, 0.2],
+	    ModAmp=0.1, verbosity=False
+	)
+	P2 = sim.Parameters(g=2.0003, lw=[0.3, 0.1], weight=0.1, motion="fast", verbosity=False)
+	experiments = [(9.6, [335, 350], 1024), (9.7, [335, 350], 512), (34.0, [1205, 1225])]
+	fields, spectra, flags = sim.simulate([sim.Parameters(**kw), P2], experiments=experiments)
+	assert(flags == [0, 0, 0] and len(fields[2]) == 1024)
+	for j, (mwFreq, Range, *Points) in enumerate(experiments):
+		Points = Points[0] if Points else 1024
+		P = sim.Parameters(mwFreq=mwFreq, Range=Range, Points=Points, **kw)
+		P2e = sim.Parameters(
+		    g=2.0003, lw=[0.3, 0.1], weight=0.1, motion="fast", verbosity=False,
+		    mwFreq=mwFreq, Range=Range, Points=Points
+		)
+		B0, spc, flag = sim.simulate([P, P2e])
+		sim_diff(fields[j], spectra[j], B0, spc, Tol=1e-12)
+	# dim(H) > 512: warning 1, the system adds nothing
+	P1 = sim.Parameters(g=2.1, Nucs="Cu,Cu,Cu,Cu,Cu", A=[50] * 5, verbosity=False)
+	fields, spectra, flags = sim.simulate([P2, P1], experiments=experiments)
+	fields2, spectra2, flags2 = sim.simulate(P2, experiments=experiments)
+	assert(flags == [1, 1, 1] and flags2 == [0, 0, 0])
+	for j in range(0, len(experiments)):
+		assert(np.array_equal(spectra[j], spectra2[j]))
+	fields, spectra, flags = sim.simulate(P1, experiments=experiments)
+	assert(flags == [1, 1, 1] and spectra[2].shape == (1024,) and not spectra[2].any())
+
+
+def test_multiplier_cache():
+	"""Spectral multipliers are shared, read-only and the cache is bounded."""
+	from eprsim import Tools as tool
+	B = np.linspace(330, 350, 1024)
+	G = tool.cached_multiplier("gaussian", 1024, B[1] - B[0], 0.3)
+	assert(tool.cached_multiplier("gaussian", 1024, B[1] - B[0], 0.3) is G)
+	assert(not G.flags.writeable)
+	ref = np.exp(-0.5 * (B - B[512]) ** 2 / (0.3 / (2 * np.sqrt(2 * np.log(2)))) ** 2)
+	assert(np.allclose(G, ref))
+	for i in range(0, 2 * tool.Multiplier_cache_size):
+		tool.cached_multiplier("bessel", 1024, 0.02, 0.1 + i)
+	assert(len(tool._multiplier_cache) == tool.Multiplier_cache_size)
+
+
+def test_benchmark():
+	"""The benchmark suite records stage profiles and detects regressions."""
+	import benchmark
+	results = benchmark.run({"iso_nitrox": benchmark.iso_nitrox}, repeat=1)
+	entry = results["results"]["iso_nitrox"]
+	assert(entry["stages"]["fast_motion_kernel"]["calls"] >= 1)
+	assert(benchmark.compare(results, results) == [])
+	slow = {"results": {"iso_nitrox": dict(entry, time=entry["time"] / 10,
+	                                       peak_memory=entry["peak_memory"] / 10)}}
+	assert(len(benchmark.compare(results, slow, min_time=0)) == 2)
@@ -17,3 +17,47 @@ def test_bad_pkg_struct():
 		import EPRsim
 	with raises(ModuleNotFoundError):	
 		import Tools
+
+def test_import_budget():
+	"""Importing the simulation modules is fast and does not load plotting,
+	scipy or numba (they are imported when needed)."""
+	import subprocess
+	import sys
+	code = ("import sys, time; t = time.perf_counter(); import eprsim.EPRsim; "
+		"t = time.perf_counter() - t; "
+		"heavy = [m for m in ('matplotlib', 'seaborn', 'scipy', 'numba') "
+		"if m in sys.modules]; print(t, ','.join(heavy))")
+	times = []
+	for i in range(0, 3):
+		out = subprocess.run([sys.executable, "-c", code], capture_output=True,
+			text=True, check=True).stdout.split()
+		times.append(float(out[0]))
+		assert(len(out) == 1)
+	assert(min(times) < 1.0)
+
+def test_precompile(tmp_path):
+	"""All Numba kernels are compiled into the given cache directory (also
+	if they were compiled before) and a failing compilation falls back to
+	Python."""
+	import eprsim
+	from eprsim import Tools
+	for cache_dir in (tmp_path / "first", tmp_path / "second"):
+		report = eprsim.precompile(cache_dir, verbose=False)
+		Tools.set_cache_dir(None)
+		names = [entry["name"] for entry in report]
+		for name in ["preselect_off_res", "find_resonance", "thermal_popdiff",
+			"eval_Gauss", "eval_Lorentz", "phase_eigenvectors"]:
+			assert(name in names)
+		if not Tools.numba_available():
+			assert(all(entry["status"] == "python" for entry in report))
+			continue
+		files = [f.name for f in cache_dir.rglob("*.nbi")]
+		for entry in report:
+			assert(entry["status"] == "compiled")
+			assert(any("." + entry["name"] + "-" in f for f in files))
+	def f(x):
+		return x + 1
+	lazy = Tools.Lazy_jit(f, "float64(float64, float64)", {"nopython": True})
+	Tools._jit_functions.remove(lazy)
+	assert(lazy(1.0) == 2.0)
+	assert(lazy.status() == "python")